@@ -0,0 +1,93 @@
+"""
+Serialization cost of Cloudinary files through CloudFileListSerializer, with `extra` built
+from upload_resp for every row (before) and read from the precomputed extra_data (after).
+Runs without a database.
+
+    python benchmarks/bench_serialization.py [--rows 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'src'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_app.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.contenttypes.models import ContentType  # noqa: E402
+
+from drf_cloudstorage.models import CloudFile  # noqa: E402
+from drf_cloudstorage.serializers import CloudFileListSerializer  # noqa: E402
+
+CONTENT_TYPE = ContentType(id=1, app_label='example', model='example')
+
+
+def cloudinary_resp(i):
+    public_id = 'drf_cloudstorage/example__example__image_file/sample_%05d' % i
+
+    return {
+        'public_id': public_id,
+        'version': 1584600000 + i,
+        'format': 'jpg',
+        'resource_type': 'image',
+        'type': 'upload',
+        'secure_url': 'https://res.cloudinary.com/demo/image/upload/v%s/%s.jpg' % (
+            1584600000 + i, public_id
+        ),
+        'url': 'http://res.cloudinary.com/demo/image/upload/v%s/%s.jpg' % (
+            1584600000 + i, public_id
+        ),
+        'width': 1920,
+        'height': 1080,
+        'bytes': 204800,
+        'etag': '%032x' % i,
+        'signature': '%040x' % i,
+        'tags': [],
+        'placeholder': False,
+        'original_filename': 'sample',
+        'storage': 'cloudinary',
+    }
+
+
+def build_rows(count, precomputed):
+    rows = []
+    for i in range(count):
+        cloudfile = CloudFile(id=i + 1, url='https://example.com/%s.jpg' % i,
+                              upload_resp=cloudinary_resp(i), content_type_id=CONTENT_TYPE.id,
+                              content_field='image_file', name='sample')
+        if precomputed:
+            cloudfile.extra_data = cloudfile.build_extra()
+        rows.append(cloudfile)
+
+    return rows
+
+
+def measure(rows):
+    started = time.perf_counter()
+    CloudFileListSerializer(rows, many=True).data
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    # Keep content type lookups away from the database
+    ContentType.objects._add_to_cache('default', CONTENT_TYPE)
+
+    before = measure(build_rows(args.rows, precomputed=False))
+    after = measure(build_rows(args.rows, precomputed=True))
+
+    print('CloudFileListSerializer, %d rows' % args.rows)
+    print('extra built per row:     %.3fs (%.1f us/row)' % (before, before / args.rows * 1e6))
+    print('extra_data precomputed:  %.3fs (%.1f us/row)' % (after, after / args.rows * 1e6))
+    print('speedup: %.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark suite running offline against the local storage backend, in a test database created
+for the run. Measures uploads per second through the API at several file sizes and
+concurrency levels, queries and stage durations per upload, list serialization and linking to
+foreign key and many to many targets. Results are printed as JSON, to be kept per release and
+compared with --compare.
+
+    python benchmarks/bench_suite.py [--rows 10000] [--output results.json]
+                                     [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'src'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_app.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.contenttypes.models import ContentType  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from drf_cloudstorage import metrics  # noqa: E402
+from drf_cloudstorage.constants import FileStatus, StorageProvider  # noqa: E402
+from drf_cloudstorage.models import CloudFile  # noqa: E402
+from drf_cloudstorage.serializers import CloudFileListSerializer  # noqa: E402
+from drf_cloudstorage.serializers import CloudFileURLSignedListSerializer  # noqa: E402
+from example.models import Example  # noqa: E402
+
+#: Up to the 2MB limit of the example target
+SIZES = {'1KiB': 1024, '256KiB': 256 * 1024, '2MiB': 2 * 1024 ** 2}
+CONCURRENCY = (1, 4, 8)
+TARGET = 'example.Example.all_file'
+STAGES = ('parse', 'validate', 'upload', 'save', 'link')
+
+
+def post_file(client, content, object_id=None):
+    data = {'file': SimpleUploadedFile('sample.bin', content), 'target': TARGET,
+            'storage': StorageProvider.LOCAL}
+    if object_id is not None:
+        data['object_id'] = object_id
+
+    resp = client.post(reverse('cloudfile-list'), data=data)
+    assert resp.status_code == 201, resp.content
+
+
+def bench_uploads(uploads):
+    """
+    :return list: Uploads per second and MiB per second per file size and concurrency
+    """
+    # Writers of SQLite test databases lock each other out
+    levels = CONCURRENCY if connection.vendor != 'sqlite' else CONCURRENCY[:1]
+
+    results = []
+    for size_name, size in SIZES.items():
+        content = os.urandom(size)
+        for concurrency in levels:
+            count = max(uploads // (1 + size // 1024 ** 2), concurrency)
+
+            def upload(i):
+                try:
+                    post_file(Client(), content)
+                finally:
+                    if threading.current_thread() is not threading.main_thread():
+                        connections.close_all()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(upload, range(count)))
+            elapsed = time.perf_counter() - started
+
+            results.append({
+                'size': size_name,
+                'concurrency': concurrency,
+                'uploads': count,
+                'uploads_per_second': count / elapsed,
+                'mib_per_second': count * size / elapsed / 1024 ** 2,
+            })
+
+    return results
+
+
+def bench_upload_queries():
+    """
+    :return dict: Queries and mean stage durations in milliseconds of a linked upload
+    """
+    client = Client()
+    example = Example.objects.create()
+    content = os.urandom(SIZES['1KiB'])
+    # Content types and the like are cached by the first upload
+    post_file(client, content, example.pk)
+
+    with CaptureQueriesContext(connection) as queries:
+        post_file(client, content, example.pk)
+    # Read from the query log, which the next requests reset
+    query_count = len(queries)
+
+    sink = metrics.get_metrics_sink()
+    sink.clear()
+    for i in range(50):
+        post_file(client, content, example.pk)
+
+    stages = {}
+    for stage in STAGES:
+        durations = sink.timings[sink.key('cloudstorage.stage.duration', {
+            'stage': stage, 'storage': StorageProvider.LOCAL if stage in ('upload', 'save')
+            else ''
+        })]
+        stages[stage] = statistics.mean(durations) * 1000 if durations else None
+
+    return {'queries': query_count, 'stage_ms': stages}
+
+
+def bench_list_serialization(rows):
+    """
+    :return dict: Seconds to fetch and serialize `rows` files per list serializer
+    """
+    content_type = ContentType.objects.get_for_model(Example)
+    CloudFile.objects.bulk_create([
+        CloudFile(url='/cloudstorage/bench/%d.bin' % i, name='sample',
+                  status=FileStatus.UPLOADED, content_type=content_type, content_field='all_file',
+                  upload_resp={'storage': StorageProvider.LOCAL, 'prefix': 'bench',
+                               'name': '%d.bin' % i, 'etag': '%x' % i})
+        for i in range(rows)
+    ], batch_size=1000)
+
+    results = {}
+    for serializer_cls in (CloudFileListSerializer, CloudFileURLSignedListSerializer):
+        queryset = CloudFile.objects.order_by('-pk')[:rows]
+        started = time.perf_counter()
+        serializer_cls(queryset, many=True).data
+        elapsed = time.perf_counter() - started
+        results[serializer_cls.__name__] = {'rows': rows, 'seconds': elapsed,
+                                            'us_per_row': elapsed / rows * 1e6}
+
+    return results
+
+
+def bench_link(number):
+    """
+    :return dict: Microseconds per link_to_target() for a foreign key and a many to many target
+    """
+    example = Example.objects.create()
+    content_type = ContentType.objects.get_for_model(Example)
+
+    results = {}
+    for field in ('all_file', 'attachments'):
+        cloudfiles = CloudFile.objects.bulk_create([
+            CloudFile(url='/cloudstorage/bench/link.bin', content_type=content_type,
+                      content_field=field, object_id=example.pk,
+                      upload_resp={'storage': StorageProvider.LOCAL, 'prefix': 'bench',
+                                   'name': 'link.bin'})
+            for i in range(number)
+        ])
+        if cloudfiles[0].pk is None:
+            cloudfiles = list(CloudFile.objects.filter(content_field=field).order_by('-pk')
+                              [:number])
+
+        started = time.perf_counter()
+        for cloudfile in cloudfiles:
+            cloudfile.link_to_target()
+        elapsed = time.perf_counter() - started
+
+        results['fk' if field == 'all_file' else 'm2m'] = {
+            'links': number, 'us_per_link': elapsed / number * 1e6
+        }
+
+    return results
+
+
+def compare(results, previous):
+    """
+    Prints the change of every number against the results of a previous run
+    """
+    def walk(current, old, path):
+        if isinstance(current, dict):
+            for key, value in current.items():
+                if isinstance(old, dict) and key in old:
+                    walk(value, old[key], path + [key])
+        elif isinstance(current, list):
+            for item, old_item in zip(current, old):
+                label = '%s/c%s' % (item.get('size'), item.get('concurrency'))
+                walk({k: v for k, v in item.items() if k not in ('size', 'concurrency')},
+                     old_item, path + [label])
+        elif isinstance(current, (int, float)) and isinstance(old, (int, float)) and old:
+            print('%-70s %12.3f %12.3f %+7.1f%%' % ('.'.join(map(str, path)), old, current,
+                                                    (current - old) / old * 100),
+                  file=sys.stderr)
+
+    walk(results['benchmarks'], previous['benchmarks'], [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--links', type=int, default=1000)
+    parser.add_argument('--output', help='Write the results to this file instead of stdout')
+    parser.add_argument('--compare', help='Results of a previous run to compare with')
+    args = parser.parse_args()
+
+    # tmpfs keeps the stored files in memory where available
+    root = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    override = override_settings(
+        CLOUDSTORAGE_BACKENDS={StorageProvider.LOCAL: 'drf_cloudstorage.backends.local.'
+                                                      'LocalBackend'},
+        CLOUDSTORAGE_LOCAL_ROOT=root,
+        CLOUDSTORAGE_METRICS_SINK='drf_cloudstorage.metrics.InMemorySink',
+        ALLOWED_HOSTS=['testserver'],
+    )
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    override.enable()
+    try:
+        benchmarks = {
+            'uploads': bench_uploads(args.uploads),
+            'upload_queries': bench_upload_queries(),
+            'list_serialization': bench_list_serialization(args.rows),
+            'link_to_target': bench_link(args.links),
+        }
+    finally:
+        override.disable()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'benchmarks': benchmarks,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(results, json.load(fp))
+
+
+if __name__ == '__main__':
+    main()
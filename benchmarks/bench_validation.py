@@ -0,0 +1,55 @@
+"""
+Per-upload file size validation cost with limits parsed on every access (before) and parsed
+once when the field is constructed (after).
+
+    python benchmarks/bench_validation.py [--number 100000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'src'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drf_app.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import humanfriendly  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+
+from drf_cloudstorage.serializers import CloudFileValidationMixin  # noqa: E402
+from drf_cloudstorage.targets import get_target  # noqa: E402
+
+
+def validate_file_size_before(field, file):
+    """ Validation as done while CloudFileField parsed its limits on every access """
+    min_size = humanfriendly.parse_size(field._min_file_size, binary=True)
+    max_size = humanfriendly.parse_size(field._max_file_size, binary=True)
+
+    return min_size <= file.size <= max_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    target = get_target('example.Example.image_file')
+    file = SimpleUploadedFile('sample.jpg', b'0' * 100 * 1024, content_type='image/jpeg')
+    validator = CloudFileValidationMixin()
+
+    before = timeit.timeit(lambda: validate_file_size_before(target.field, file),
+                           number=args.number)
+    after = timeit.timeit(lambda: validator._validate_file_size(target, file),
+                          number=args.number)
+
+    print('validate_file_size before: %.3f us/upload' % (before / args.number * 1e6))
+    print('validate_file_size after:  %.3f us/upload' % (after / args.number * 1e6))
+    print('speedup: %.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+    main()
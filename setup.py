@@ -10,7 +10,8 @@ except ImportError:
 me = 'Abhinav Kotak'
 memail = 'in.abhi9@gmail.com'
 
-packages = ['drf_cloudstorage', 'drf_cloudstorage.migrations']
+packages = ['drf_cloudstorage', 'drf_cloudstorage.backends', 'drf_cloudstorage.migrations',
+            'drf_cloudstorage.management', 'drf_cloudstorage.management.commands']
 package_dir = {'drf_cloudstorage': 'src/drf_cloudstorage'}
 install_requires = open('requirements.txt', 'r').readlines()
 
@@ -76,9 +76,114 @@ CLOUDINARY_NAME = None
 CLOUDINARY_API_KEY = None
 CLOUDINARY_API_SECRET = None
 
+#: Storage backends by name, the name is the `storage` of upload requests
+CLOUDSTORAGE_BACKENDS = {
+    's3': 'drf_cloudstorage.backends.s3.S3Backend',
+    'cloudinary': 'drf_cloudstorage.backends.cloudinary.CloudinaryBackend',
+    'local': 'drf_cloudstorage.backends.local.LocalBackend',
+}
+#: Directory and base url of files of the local backend
+CLOUDSTORAGE_LOCAL_ROOT = os.path.join(BASE_DIR, 'cloudstorage')
+CLOUDSTORAGE_LOCAL_URL = '/cloudstorage/'
+
 #: This storage provider will be used by default for storing files. This can be override in the
-# upload request. Valid values are from 'cloudstorage.constants.PROVIDERS"
+# upload request. Valid values are the names of CLOUDSTORAGE_BACKENDS
 CLOUDSTORAGE_DEFAULT_PROVIDER = None
 
 # s3 pre signed url expires in x seconds
 S3_SIGNED_URL_EXPIRES_IN = 0
+#: Signed urls are cached and reused for windows of this many seconds, 0 disables the cache.
+# A url stays valid for S3_SIGNED_URL_EXPIRES_IN seconds after its window ends.
+S3_SIGNED_URL_CACHE_WINDOW = 60
+S3_SIGNED_URL_CACHE_SIZE = 10000
+
+#: Files of this size or bigger are uploaded to S3 in parts, uploaded concurrently
+S3_MULTIPART_THRESHOLD = '64MiB'
+S3_MULTIPART_CHUNK_SIZE = '8MiB'
+S3_MULTIPART_CONCURRENCY = 4
+#: Number of times a failed part is retried before the whole upload is aborted
+S3_MULTIPART_MAX_RETRIES = 3
+
+#: Files of this size or bigger are sent to Cloudinary in parts, read from disk one at a time
+CLOUDINARY_CHUNKED_UPLOAD_THRESHOLD = '20MiB'
+CLOUDINARY_CHUNKED_UPLOAD_CHUNK_SIZE = '20MiB'
+
+#: Uploaded files bigger than this are spooled to a temporary file, unless the target field
+# defines its own `memory_file_size`
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+
+#: Check allowed_mime_types against the magic number in the first bytes of the upload instead
+# of trusting the file extension
+CLOUDSTORAGE_SNIFF_MIME_TYPES = False
+
+#: Reuse the provider object of an earlier upload with the same content and storage instead of
+# uploading the same bytes again
+CLOUDSTORAGE_DEDUPLICATE = False
+
+#: Delete the provider object when a file is deleted through the API, unless other rows still
+# reference it. Unlinked files are collected by `manage.py cloudstorage_gc`.
+CLOUDSTORAGE_DELETE_REMOTE_FILES = True
+
+#: CloudFile.upload_resp only keeps the keys the app reads. Enable to keep the complete provider
+# response in the cloudstorage_file_raw_response table. Migration 0010 trims the responses stored
+# before, it copies them to that table first only when this is enabled.
+CLOUDSTORAGE_STORE_RAW_RESPONSE = False
+
+#: Seconds a direct upload ticket (POST /cloudfilesdirect) is valid for. Cloudinary caps it to an
+# hour.
+CLOUDSTORAGE_DIRECT_UPLOAD_EXPIRES_IN = 3600
+
+#: Resumable upload sessions (POST /cloudfilesuploads) expire after this many seconds without a
+# chunk. Expired sessions are deleted by `manage.py cloudstorage_gc`.
+CLOUDSTORAGE_UPLOAD_SESSION_TTL = 24 * 3600
+
+#: GET /cloudfiles<id>/download relays provider objects in chunks of this size
+CLOUDSTORAGE_DOWNLOAD_CHUNK_SIZE = '64KiB'
+
+#: Connections kept alive per host and process for Cloudinary and downloads. S3 keeps its own
+# per thread.
+CLOUDSTORAGE_HTTP_POOL_SIZE = 10
+#: Seconds to connect to and wait for data from providers
+CLOUDSTORAGE_HTTP_CONNECT_TIMEOUT = 5
+CLOUDSTORAGE_HTTP_READ_TIMEOUT = 60
+
+#: Idempotent provider calls (deletes, lookups, downloads) are retried this many times in all,
+# with jittered exponential backoff, for at most CLOUDSTORAGE_RETRY_DEADLINE seconds
+CLOUDSTORAGE_RETRY_ATTEMPTS = 3
+CLOUDSTORAGE_RETRY_BASE_DELAY = 0.2
+CLOUDSTORAGE_RETRY_MAX_DELAY = 2
+CLOUDSTORAGE_RETRY_DEADLINE = 10
+#: A storage failing this many calls in a row is not called for RESET_TIMEOUT seconds, requests
+# fail right away with 503 instead
+CLOUDSTORAGE_CIRCUIT_BREAKER_THRESHOLD = 5
+CLOUDSTORAGE_CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+#: Storage uploads go to when the requested one fails, e.g. {'s3': 'cloudinary'}
+CLOUDSTORAGE_FAILOVER = {}
+
+#: Dotted path of a drf_cloudstorage.metrics.MetricsSink receiving the upload metrics, e.g.
+# 'drf_cloudstorage.metrics.InMemorySink'. Signals are sent either way.
+CLOUDSTORAGE_METRICS_SINK = None
+
+#: Commit a pending row before uploading so no transaction is held open during the upload
+CLOUDSTORAGE_TWO_PHASE_UPLOAD = False
+
+#: Accept uploads with 202 and upload them in the background through CLOUDSTORAGE_UPLOAD_WORKER.
+# Clients poll the `status` route of the file until the url is filled in.
+CLOUDSTORAGE_ASYNC_UPLOAD = False
+#: 'drf_cloudstorage.workers.ThreadPoolWorker' or 'drf_cloudstorage.workers.DatabaseWorker'; the
+# latter needs `manage.py cloudstorage_worker` running
+CLOUDSTORAGE_UPLOAD_WORKER = 'drf_cloudstorage.workers.ThreadPoolWorker'
+CLOUDSTORAGE_UPLOAD_WORKERS = 4
+#: Seconds after which `cloudstorage_worker` hands a file claimed by another worker to the next
+# one, the other worker presumably died. Must exceed the longest upload.
+CLOUDSTORAGE_UPLOAD_LEASE = 3600
+#: Directory for files waiting to be uploaded. Defaults to <tmp>/drf_cloudstorage
+CLOUDSTORAGE_SPOOL_DIR = None
+
+#: Limits of the bulk upload endpoint
+CLOUDSTORAGE_BULK_UPLOAD_MAX_FILES = 100
+CLOUDSTORAGE_BULK_UPLOAD_CONCURRENCY = 4
+
+#: Files per page of the list endpoint, and the most a client may ask for with `page_size`
+CLOUDSTORAGE_LIST_PAGE_SIZE = 100
+CLOUDSTORAGE_LIST_MAX_PAGE_SIZE = 1000
@@ -5,6 +5,8 @@ from django.conf import settings
 
 L = logging.getLogger(__name__)
 
+default_app_config = 'drf_cloudstorage.apps.CloudstorageConfig'
+
 try:
     cloudinary.config(
         cloud_name=settings.CLOUDINARY_NAME,
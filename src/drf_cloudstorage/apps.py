@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CloudstorageConfig(AppConfig):
     name = 'drf_cloudstorage'
+
+    def ready(self):
+        from .targets import build_registry
+
+        build_registry()
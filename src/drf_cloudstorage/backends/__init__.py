@@ -0,0 +1,62 @@
+"""
+Storage backends by the name stored in `CloudFile.upload_resp['storage']`. Backends are
+configured by settings.CLOUDSTORAGE_BACKENDS, a dict of names to dotted backend class paths,
+and instantiated once per process.
+"""
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext_lazy as _
+
+from ..constants import StorageProvider
+from ..errors import InvalidStorage
+
+DEFAULT_BACKENDS = {
+    StorageProvider.S3: 'drf_cloudstorage.backends.s3.S3Backend',
+    StorageProvider.CLOUDINARY: 'drf_cloudstorage.backends.cloudinary.CloudinaryBackend',
+}
+
+_lock = threading.Lock()
+_backends = None
+
+
+def get_backend(name):
+    """
+    :param str name: Name of the backend, e.g. 's3'
+    :return StorageBackend:
+    :raise InvalidStorage: If no backend is registered under `name`
+    """
+    try:
+        return _get_backends()[name]
+    except KeyError:
+        raise InvalidStorage(_("Storage '%s' is not configured." % name))
+
+
+def backend_names():
+    """
+    :return tuple: Names of the configured backends, valid values of the `storage` field
+    """
+    return tuple(_get_backends())
+
+
+def _get_backends():
+    global _backends
+
+    if _backends is None:
+        with _lock:
+            if _backends is None:
+                paths = getattr(settings, 'CLOUDSTORAGE_BACKENDS', DEFAULT_BACKENDS)
+                _backends = {name: import_string(path)(name) for name, path in paths.items()}
+
+    return _backends
+
+
+@receiver(setting_changed)
+def _reset_backends(setting, **kwargs):
+    global _backends
+
+    if setting == 'CLOUDSTORAGE_BACKENDS':
+        _backends = None
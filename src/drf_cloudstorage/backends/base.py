@@ -0,0 +1,132 @@
+import os
+import tempfile
+from pathlib import Path
+
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
+from django.utils.translation import ugettext_lazy as _
+
+from .. import helper, streaming
+from ..errors import CloudFileError
+
+
+class StorageBackend:
+    """
+    Stores the content of cloud files. `upload()` returns the response the file is located by
+    afterwards, every other method is handed it back through `CloudFile.upload_resp`.
+    """
+    #: Keys of the upload response kept in CloudFile.upload_resp, None keeps all of them
+    resp_keys = None
+
+    def __init__(self, name):
+        """
+        :param str name: Name the backend is registered under, stored as upload_resp['storage']
+        """
+        self.name = name
+
+    def upload(self, f, directory, use_filename=False):
+        """
+        :param File|str f: File or path of the file
+        :param str directory: Upload directory of the target
+        :param bool use_filename: Keep the file name instead of prefixing it randomly
+        :return tuple: (url, upload_resp)
+        :raise UploadError:
+        """
+        raise NotImplementedError
+
+    def delete_many(self, upload_resps):
+        """
+        Deletes objects with as few requests as the backend allows
+
+        :param list upload_resps: upload_resp of uploaded files
+        :return int: Number of deleted objects
+        """
+        raise NotImplementedError
+
+    def download_url(self, cloudfile):
+        """
+        :param CloudFile cloudfile:
+        :return str: Url the content is fetched from, signed if private
+        """
+        return cloudfile.url
+
+    def open(self, cloudfile):
+        """
+        :param CloudFile cloudfile:
+        :return file: Readable file with the content
+        """
+        f = tempfile.TemporaryFile()
+        for chunk in streaming.iter_content(streaming.open_remote(self.download_url(cloudfile))):
+            f.write(chunk)
+        f.seek(0)
+
+        return f
+
+    def stream(self, cloudfile, request):
+        """
+        :param CloudFile cloudfile:
+        :param HttpRequest request: Client request, possibly a Range or conditional one
+        :return HttpResponse: Response with the content
+        """
+        return streaming.stream_response(self.download_url(cloudfile), request)
+
+    def sign_many(self, cloudfiles):
+        """
+        :param list cloudfiles: Uploaded files
+        :return list: Signed url per file, empty if the backend does not sign urls
+        """
+        return [''] * len(cloudfiles)
+
+    def build_extra(self, cloudfile):
+        """
+        :param CloudFile cloudfile: Uploaded file
+        :return dict: Backend specific metadata, see `CloudFile.extra`
+        """
+        return {}
+
+    def direct_upload_params(self, target, directory, filename, mime_type, expires_in):
+        """
+        Authorizes a client to upload a file to the backend itself
+
+        :param CloudFileTarget target:
+        :param str directory: Upload directory of the target
+        :param str filename:
+        :param str mime_type: Mime type the client declared, None if unrestricted
+        :param int expires_in: Seconds the authorization is valid for
+        :return tuple: (url, fields, upload_resp) -- the file is posted to `url` along with the
+            form `fields`, `upload_resp` locates the object once uploaded
+        """
+        raise CloudFileError(_("Storage '%s' does not support direct uploads." % self.name))
+
+    def verify_direct_upload(self, upload_resp, client_resp):
+        """
+        Looks the directly uploaded object up
+
+        :param dict upload_resp: upload_resp returned by `direct_upload_params()`
+        :param dict client_resp: Response the backend gave the client
+        :return tuple: (url, upload_resp, size in bytes)
+        :raise CloudFileError: If the object does not exist
+        """
+        raise CloudFileError(_("Storage '%s' does not support direct uploads." % self.name))
+
+    @staticmethod
+    def get_file_name(f, use_filename):
+        """
+        :param File|str f: File, path or name of the file
+        :param bool use_filename: Keep the name instead of prefixing it randomly
+        :return str: Slugified file name
+        """
+        if isinstance(f, str):
+            filename = helper.path_leaf(f)
+        else:
+            filename = f.name
+
+        if use_filename is False:
+            filename = '%s_%s' % (get_random_string(5), filename)
+
+        # Slugify only file name without extension
+        filename_, ext = os.path.splitext(filename)
+        filename_ = slugify(filename_)
+        ext = ''.join(Path(filename).suffixes)
+
+        return '%s%s' % (filename_, ext)
@@ -0,0 +1,136 @@
+import mimetypes
+import os
+import time
+from collections import defaultdict
+
+import cloudinary
+import cloudinary.utils
+from cloudinary.exceptions import Error, NotFound
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+
+from .. import clients, helper
+from ..constants import DEFAULT_CLOUDINARY_VARIANTS
+from ..errors import CloudFileError, InvalidTarget, UploadError
+from ..helper import CloudinaryHelper
+from .base import StorageBackend
+
+
+class CloudinaryBackend(StorageBackend):
+    """
+    Cloudinary account configured by the cloudinary settings, files are stored under
+    settings.CLOUDINARY_BASE_PATH
+    """
+    resp_keys = ('storage', 'public_id', 'version', 'format', 'resource_type', 'secure_url',
+                 'etag')
+
+    def upload(self, f, directory, use_filename=True):
+        assert settings.CLOUDINARY_BASE_PATH is not None, 'Define Cloudinary base path'
+
+        path = '%s/%s' % (settings.CLOUDINARY_BASE_PATH, directory)
+        threshold = helper.parse_size(getattr(settings, 'CLOUDINARY_CHUNKED_UPLOAD_THRESHOLD',
+                                              '20MiB'))
+        try:
+            if helper.file_size(f) >= threshold:
+                response = self._chunked_upload(f, folder=path, use_filename=True,
+                                                invalidate=True, resource_type='auto')
+            else:
+                response = clients.cloudinary_uploader().upload(f, folder=path,
+                                                                use_filename=True,
+                                                                invalidate=True,
+                                                                resource_type='auto')
+            response['storage'] = self.name
+        except Error as e:
+            raise UploadError from e
+
+        return response['secure_url'], response
+
+    @staticmethod
+    def _chunked_upload(f, **options):
+        """
+        Sends the file in parts of settings.CLOUDINARY_CHUNKED_UPLOAD_CHUNK_SIZE bytes, read from
+        disk one at a time instead of all at once as upload() does
+        """
+        options['chunk_size'] = helper.parse_size(
+            getattr(settings, 'CLOUDINARY_CHUNKED_UPLOAD_CHUNK_SIZE', '20MiB')
+        )
+        if not isinstance(f, str):
+            options['filename'] = helper.path_leaf(f.name)
+            # upload_large() closes what it reads, so it gets a file of its own when possible
+            if hasattr(f, 'temporary_file_path'):
+                f = f.temporary_file_path()
+            else:
+                f.seek(0)
+
+        return clients.cloudinary_uploader().upload_large(f, **options)
+
+    def delete_many(self, upload_resps):
+        public_ids = defaultdict(set)
+        for resp in upload_resps:
+            public_ids[resp.get('resource_type', 'image')].add(resp['public_id'])
+
+        deleted = 0
+        for resource_type, ids in public_ids.items():
+            ids = sorted(ids)
+            # delete_resources takes up to 100 public ids per request
+            for i in range(0, len(ids), 100):
+                result = clients.cloudinary_api().delete_resources(ids[i:i + 100],
+                                                                   resource_type=resource_type,
+                                                                   invalidate=True)
+                deleted += sum(1 for status in result['deleted'].values() if status == 'deleted')
+
+        return deleted
+
+    def download_url(self, cloudfile):
+        return cloudfile.upload_resp.get('secure_url') or cloudfile.url
+
+    def build_extra(self, cloudfile):
+        cloudinary_cls = CloudinaryHelper(cloudfile.upload_resp)
+
+        try:
+            variants = cloudfile.target.cloudinary_variants
+        except InvalidTarget:
+            variants = DEFAULT_CLOUDINARY_VARIANTS
+
+        return {
+            **{name: cloudinary_cls.edit(transformation)
+               for name, transformation in variants.items()},
+            'public_id': cloudfile.upload_resp.get('public_id'),
+            'resource_type': cloudfile.upload_resp.get('resource_type'),
+            'file_name': cloudinary_cls.file_name,
+            'file_name_short': helper.shorten_str(cloudinary_cls.file_name,
+                                                  append='.%s' % cloudinary_cls.format)
+        }
+
+    def direct_upload_params(self, target, directory, filename, mime_type, expires_in):
+        folder = ('%s/%s' % (settings.CLOUDINARY_BASE_PATH, directory)).strip('/')
+        public_id = os.path.splitext(filename)[0]
+        config = cloudinary.config()
+
+        # Cloudinary rejects signatures older than an hour, whatever expires_in is
+        params = {'folder': folder, 'public_id': public_id, 'timestamp': int(time.time())}
+        if target.allowed_mime_types is not None:
+            params['allowed_formats'] = ','.join(sorted(
+                ext.lstrip('.') for mt in target.allowed_mime_types
+                for ext in mimetypes.guess_all_extensions(mt)
+            ))
+        params['signature'] = cloudinary.utils.api_sign_request(params, config.api_secret)
+        params['api_key'] = config.api_key
+
+        url = cloudinary.utils.cloudinary_api_url('upload', resource_type='auto')
+        upload_resp = {'public_id': '%s/%s' % (folder, public_id), 'storage': self.name}
+
+        return url, params, upload_resp
+
+    def verify_direct_upload(self, upload_resp, client_resp):
+        try:
+            resource = clients.cloudinary_api().resource(
+                upload_resp['public_id'],
+                resource_type=client_resp.get('resource_type', 'image')
+            )
+        except NotFound:
+            raise CloudFileError(_('File has not been uploaded.'))
+
+        resp = dict(resource, storage=self.name)
+
+        return resp['secure_url'], resp, resp['bytes']
@@ -0,0 +1,165 @@
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+
+from .. import helper
+from ..errors import UploadError
+from .base import StorageBackend
+
+L = logging.getLogger(__name__)
+
+#: Single byte range of a Range header; multiple ranges are answered with the whole file
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class LocalBackend(StorageBackend):
+    """
+    Files on the local filesystem under settings.CLOUDSTORAGE_LOCAL_ROOT, e.g. for development,
+    tests and benchmarks without a provider. Pointing the root at a tmpfs such as /dev/shm
+    keeps them in memory.
+
+    Urls are built from settings.CLOUDSTORAGE_LOCAL_URL; the files are served by the download
+    route of the API, or by the web server if the url is mapped to the root.
+    """
+    resp_keys = ('storage', 'prefix', 'name', 'etag')
+
+    def upload(self, f, directory, use_filename=False):
+        filename = self.get_file_name(f, use_filename)
+        path = self._path(directory, filename)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=os.path.dirname(path))
+            os.close(fd)
+            try:
+                self._copy(f, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            stat = os.stat(path)
+        except OSError as e:
+            raise UploadError from e
+
+        resp = {'prefix': directory, 'name': filename, 'storage': self.name,
+                'etag': '%x-%x' % (stat.st_mtime_ns, stat.st_size)}
+
+        return self._url(directory, filename), resp
+
+    @staticmethod
+    def _copy(f, path):
+        source = f if isinstance(f, str) else getattr(f, 'temporary_file_path', lambda: None)()
+        if source is not None:
+            # Copied by the kernel with sendfile(2)
+            shutil.copyfile(source, path)
+            return
+
+        f.seek(0)
+        with open(path, 'wb') as fp:
+            chunks = f.chunks() if hasattr(f, 'chunks') else iter(lambda: f.read(64 * 1024), b'')
+            for chunk in chunks:
+                fp.write(chunk)
+
+    def delete_many(self, upload_resps):
+        deleted = 0
+        for resp in upload_resps:
+            try:
+                os.remove(self._path(resp['prefix'], resp['name']))
+                deleted += 1
+            except FileNotFoundError:
+                L.warning('Could not delete %s/%s, it does not exist', resp['prefix'],
+                          resp['name'])
+
+        return deleted
+
+    def open(self, cloudfile):
+        return open(self._path(cloudfile.upload_resp['prefix'], cloudfile.upload_resp['name']),
+                    'rb')
+
+    def stream(self, cloudfile, request):
+        """
+        Whole files are handed to the server's wsgi.file_wrapper, which sends them with
+        sendfile(2) where supported. A single byte range is read in chunks.
+        """
+        path = self._path(cloudfile.upload_resp['prefix'], cloudfile.upload_resp['name'])
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            raise Http404
+
+        byte_range = self._byte_range(request, size, cloudfile.etag)
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'))
+        else:
+            start, end = byte_range
+            if start >= size or end < start:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+
+            response = StreamingHttpResponse(self._iter_range(path, start, end - start + 1),
+                                             status=206)
+            response['Content-Type'] = mimetypes.guess_type(path)[0] or \
+                'application/octet-stream'
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+
+        response['Accept-Ranges'] = 'bytes'
+        if cloudfile.etag is not None:
+            response['ETag'] = cloudfile.etag
+
+        return response
+
+    @staticmethod
+    def _byte_range(request, size, etag):
+        """
+        :return tuple: (first, last) byte of the requested range, None for the whole file
+        """
+        header = request.META.get('HTTP_RANGE', '').strip()
+        if_range = request.META.get('HTTP_IF_RANGE')
+        match = RANGE_RE.match(header)
+        if match is None or (if_range is not None and if_range != etag):
+            return None
+
+        first, last = match.groups()
+        if not first:
+            if not last:
+                return None
+            # Suffix range, the last `last` bytes
+            return max(size - int(last), 0), size - 1
+
+        return int(first), min(int(last), size - 1) if last else size - 1
+
+    @staticmethod
+    def _iter_range(path, start, length):
+        chunk_size = helper.parse_size(getattr(settings, 'CLOUDSTORAGE_DOWNLOAD_CHUNK_SIZE',
+                                               '64KiB'))
+        with open(path, 'rb') as fp:
+            fp.seek(start)
+            while length > 0:
+                chunk = fp.read(min(chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    @staticmethod
+    def _path(prefix, name):
+        root = getattr(settings, 'CLOUDSTORAGE_LOCAL_ROOT', None)
+        assert root is not None, 'Define CLOUDSTORAGE_LOCAL_ROOT'
+
+        return safe_join(root, prefix, name)
+
+    @staticmethod
+    def _url(prefix, name):
+        return urljoin(getattr(settings, 'CLOUDSTORAGE_LOCAL_URL', '/cloudstorage/'),
+                       '%s/%s' % (prefix, name))
@@ -0,0 +1,140 @@
+import logging
+
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+
+from .. import clients, helper
+from ..errors import CloudFileError, UploadError
+from ..signing import get_signer
+from .base import StorageBackend
+
+L = logging.getLogger(__name__)
+
+
+class S3Backend(StorageBackend):
+    """
+    Bucket configured by the django_boto settings. Objects are private or public according to
+    settings.AWS_ACL_POLICY, `sign_many()` signs urls for settings.S3_SIGNED_URL_EXPIRES_IN
+    seconds.
+    """
+    resp_keys = ('storage', 'prefix', 'name')
+
+    @staticmethod
+    def storage():
+        """
+        :return django_boto.s3.storage.S3Storage: Long lived storage of the current thread,
+            configured from django_boto settings
+        """
+        return clients.s3_storage()
+
+    def upload(self, f, directory, use_filename=False):
+        filename = self.get_file_name(f, use_filename)
+        threshold = helper.parse_size(getattr(settings, 'S3_MULTIPART_THRESHOLD', '64MiB'))
+
+        try:
+            if helper.file_size(f) >= threshold:
+                url = self._multipart_upload(f, filename, directory)
+            else:
+                url = self._put(f, filename, directory)
+            resp = {'prefix': directory, 'name': filename, 'storage': self.name}
+            return url, resp
+        except Exception as e:
+            raise UploadError from e
+
+    def _put(self, f, filename, directory):
+        """
+        Uploads the file with its ACL in a single request
+
+        :return str: Url of the uploaded file
+        """
+        storage = self.storage()
+        key = storage.bucket.new_key('%s/%s' % (directory, filename))
+
+        if isinstance(f, str):
+            with open(f, 'rb') as fp:
+                key.set_contents_from_file(fp, policy=storage.policy)
+        else:
+            f.seek(0)
+            key.set_contents_from_file(f, policy=storage.policy)
+
+        return self._public_url(key)
+
+    def _public_url(self, key):
+        """
+        :param boto.s3.key.Key key:
+        :return str: Unsigned url of the key, built without a request
+        """
+        return key.generate_url(0, query_auth=False, force_http=self.storage().force_http)
+
+    def _multipart_upload(self, f, filename, directory):
+        """
+        Uploads the file in parts of settings.S3_MULTIPART_CHUNK_SIZE bytes, at most
+        settings.S3_MULTIPART_CONCURRENCY of them at the same time.
+
+        :return str: Url of the uploaded file
+        """
+        from ..multipart import S3MultipartUploader
+
+        uploader = S3MultipartUploader(
+            bucket_factory=lambda: self.storage().bucket,
+            chunk_size=helper.parse_size(getattr(settings, 'S3_MULTIPART_CHUNK_SIZE', '8MiB')),
+            concurrency=getattr(settings, 'S3_MULTIPART_CONCURRENCY', 4),
+            max_retries=getattr(settings, 'S3_MULTIPART_MAX_RETRIES', 3),
+            policy=getattr(settings, 'AWS_ACL_POLICY', 'public-read'),
+        )
+
+        key_name = '%s/%s' % (directory, filename)
+        if isinstance(f, str):
+            with open(f, 'rb') as fp:
+                uploader.upload(fp, key_name, helper.file_size(f))
+        else:
+            uploader.upload(f, key_name, helper.file_size(f))
+
+        return self._public_url(self.storage().bucket.new_key(key_name))
+
+    def delete_many(self, upload_resps):
+        keys = sorted({'%s/%s' % (resp['prefix'], resp['name']) for resp in upload_resps})
+        bucket = self.storage().bucket
+        deleted = 0
+
+        # DeleteObjects takes up to 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            chunk = keys[i:i + 1000]
+            result = bucket.delete_keys(chunk, quiet=True)
+            for error in result.errors:
+                L.warning('Could not delete %s from S3: %s', error.key, error.message)
+            deleted += len(chunk) - len(result.errors)
+
+        return deleted
+
+    def download_url(self, cloudfile):
+        return get_signer().sign(cloudfile.upload_resp['name'], cloudfile.upload_resp['prefix'],
+                                 expires=60)
+
+    def open(self, cloudfile):
+        return self.storage().open('%s/%s' % (cloudfile.upload_resp['prefix'],
+                                              cloudfile.upload_resp['name']))
+
+    def sign_many(self, cloudfiles):
+        return get_signer().sign_many(
+            [(cloudfile.upload_resp['name'], cloudfile.upload_resp['prefix'])
+             for cloudfile in cloudfiles],
+            expires=settings.S3_SIGNED_URL_EXPIRES_IN
+        )
+
+    def direct_upload_params(self, target, directory, filename, mime_type, expires_in):
+        fields = {'Content-Type': mime_type} if mime_type else {}
+        conditions = [['content-length-range', target.min_file_size, target.max_file_size]]
+
+        url, fields = get_signer().presign_post('%s/%s' % (directory, filename), expires_in,
+                                                conditions, fields)
+
+        return url, fields, {'prefix': directory, 'name': filename, 'storage': self.name}
+
+    def verify_direct_upload(self, upload_resp, client_resp):
+        key = self.storage().bucket.get_key('%s/%s' % (upload_resp['prefix'],
+                                                       upload_resp['name']))
+        if key is None:
+            raise CloudFileError(_('File has not been uploaded.'))
+
+        return self._public_url(key), upload_resp, key.size
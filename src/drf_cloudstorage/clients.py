@@ -0,0 +1,129 @@
+"""
+Long lived provider clients with keep-alive connections. Clients are created lazily per process,
+so processes forked by app servers (uwsgi, gunicorn --preload) never share sockets with their
+parent.
+"""
+import importlib
+import os
+import threading
+
+import urllib3
+from django.conf import settings
+
+_lock = threading.Lock()
+_pid = None
+_local = threading.local()
+_http_pool = None
+
+#: Module attributes holding the pools of cloudinary, as of cloudinary 1.46. Requests of versions
+# lacking one of them go through the pool of their own.
+CLOUDINARY_POOLS = (
+    ('cloudinary.uploader', '_http'),
+    ('cloudinary.api_client.call_api', '_http'),
+)
+
+
+def s3_storage():
+    """
+    boto connections are not thread safe, so every thread gets a storage of its own. Its
+    connection keeps idle sockets to S3 open between requests.
+
+    :return django_boto.s3.storage.S3Storage: Storage of the current thread
+    """
+    _check_pid()
+
+    storage = getattr(_local, 's3_storage', None)
+    if storage is None:
+        import boto
+        from django_boto.s3.storage import S3Storage
+
+        if not boto.config.has_section('Boto'):
+            boto.config.add_section('Boto')
+        boto.config.set('Boto', 'http_socket_timeout', str(_timeout().read_timeout))
+
+        storage = _local.s3_storage = S3Storage()
+
+    return storage
+
+
+def http_pool():
+    """
+    :return urllib3.PoolManager: Thread safe pool of the current process, keeping up to
+        settings.CLOUDSTORAGE_HTTP_POOL_SIZE connections per host
+    """
+    global _http_pool
+
+    _check_pid()
+
+    if _http_pool is None:
+        with _lock:
+            if _http_pool is None:
+                _http_pool = _new_http_pool()
+
+    return _http_pool
+
+
+def cloudinary_uploader():
+    """
+    :return module: `cloudinary.uploader` sending its requests through `http_pool()`
+    """
+    _patch_cloudinary()
+
+    import cloudinary.uploader
+
+    return cloudinary.uploader
+
+
+def cloudinary_api():
+    """
+    :return module: `cloudinary.api` sending its requests through `http_pool()`
+    """
+    _patch_cloudinary()
+
+    import cloudinary.api
+
+    return cloudinary.api
+
+
+def _patch_cloudinary():
+    # cloudinary creates its pools at import time, with a single connection per host that
+    # concurrent uploads keep throwing away
+    pool = http_pool()
+    for module_name, attr in CLOUDINARY_POOLS:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        if isinstance(getattr(module, attr, None), urllib3.PoolManager):
+            setattr(module, attr, pool)
+
+
+def _new_http_pool():
+    import cloudinary
+    from cloudinary.utils import get_http_connector
+
+    return get_http_connector(cloudinary.config(), dict(
+        cloudinary.CERT_KWARGS,
+        maxsize=getattr(settings, 'CLOUDSTORAGE_HTTP_POOL_SIZE', 10),
+        timeout=_timeout(),
+        retries=urllib3.Retry(total=2, redirect=2, raise_on_status=False),
+    ))
+
+
+def _timeout():
+    return urllib3.Timeout(connect=getattr(settings, 'CLOUDSTORAGE_HTTP_CONNECT_TIMEOUT', 5),
+                           read=getattr(settings, 'CLOUDSTORAGE_HTTP_READ_TIMEOUT', 60))
+
+
+def _check_pid():
+    """
+    Drops the clients inherited from the parent process after a fork
+    """
+    global _pid, _local, _http_pool
+
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                _local = threading.local()
+                _http_pool = None
+                _pid = os.getpid()
@@ -0,0 +1,157 @@
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from . import helper
+from .constants import FileStatus
+from .models import CloudFile, UploadSession
+from .targets import all_targets
+
+L = logging.getLogger(__name__)
+
+
+def unlinked_cloudfiles(cutoff):
+    """
+    Cloud files created before `cutoff` that no CloudFileField or ManyCloudFileField points to.
+    Every reverse relation is checked with an anti join rather than a query per row.
+
+    :param datetime cutoff:
+    :return QuerySet:
+    """
+    queryset = CloudFile.objects.filter(created_at__lt=cutoff)
+    annotations = {}
+
+    for i, target in enumerate(all_targets()):
+        if target.many:
+            through = target.field.remote_field.through
+            column = target.field.m2m_reverse_field_name()
+            references = through._base_manager.filter(**{column: OuterRef('pk')})
+        else:
+            references = target.model._base_manager.filter(
+                **{target.field.attname: OuterRef('pk')}
+            )
+        annotations['_linked_%d' % i] = Exists(references)
+
+    return queryset.annotate(**annotations) \
+        .filter(**{name: False for name in annotations}) \
+        .order_by('pk')
+
+
+def collect(cutoff, batch_size=1000, dry_run=False):
+    """
+    Deletes unlinked cloud files in batches along with their provider objects. Provider objects
+    still referenced by other rows (see settings.CLOUDSTORAGE_DEDUPLICATE) are kept. Linking a
+    file while it is being collected fails with an IntegrityError.
+
+    :param datetime cutoff: Only files created before are collected
+    :param int batch_size: Rows deleted per transaction
+    :param bool dry_run: Only count what would be deleted
+    :return dict: Statistics of the run
+    """
+    stats = {'files': 0, 'remote_objects': 0, 'remote_errors': 0, 'seconds': 0}
+    started = time.monotonic()
+    last_pk = 0
+
+    while True:
+        with transaction.atomic():
+            queryset = unlinked_cloudfiles(cutoff).filter(pk__gt=last_pk) \
+                .only('pk', 'status', 'upload_resp', 'content_hash')
+            if not dry_run:
+                # Linking a locked row waits for us, then fails on its foreign key once the row
+                # is deleted. A file is therefore either collected or linked, never both.
+                queryset = queryset.select_for_update(of=('self',))
+
+            batch = list(queryset[:batch_size])
+            if not batch:
+                break
+
+            last_pk = batch[-1].pk
+            if not dry_run:
+                # Links committed while we waited for the locks are not seen by the locking
+                # query, which only checks the locked rows again
+                unlinked = set(unlinked_cloudfiles(cutoff)
+                               .filter(pk__in=[cloudfile.pk for cloudfile in batch])
+                               .values_list('pk', flat=True))
+                batch = [cloudfile for cloudfile in batch if cloudfile.pk in unlinked]
+
+            remote = _remote_objects(batch)
+            stats['files'] += len(batch)
+
+            if dry_run:
+                stats['remote_objects'] += len(remote)
+                continue
+
+            CloudFile.objects.filter(pk__in=[cloudfile.pk for cloudfile in batch]).delete()
+
+        for cloudfile in batch:
+            if cloudfile.status != FileStatus.UPLOADED and 'spool_path' in (cloudfile.upload_resp
+                                                                            or {}):
+                helper.remove_spooled_file(cloudfile.upload_resp['spool_path'])
+
+        # Rows are gone at this point; a failing provider leaves orphaned objects only
+        try:
+            stats['remote_objects'] += CloudFile.objects.delete_remote(remote)
+        except Exception:
+            stats['remote_errors'] += len(remote)
+            L.exception('Could not delete provider objects of cloud files up to %s', last_pk)
+
+    stats['seconds'] = time.monotonic() - started
+
+    return stats
+
+
+def _remote_objects(batch):
+    """
+    :param list batch: Cloud files about to be deleted
+    :return list: upload_resp of provider objects not referenced outside of `batch`
+    """
+    uploaded = [cloudfile for cloudfile in batch if cloudfile.status == FileStatus.UPLOADED
+                and cloudfile.upload_resp]
+    hashes = {cloudfile.content_hash for cloudfile in uploaded if cloudfile.content_hash}
+
+    shared = set()
+    if hashes:
+        shared = set(
+            CloudFile.objects.filter(content_hash__in=hashes)
+            .exclude(pk__in=[cloudfile.pk for cloudfile in batch])
+            .values_list('content_hash', flat=True)
+        )
+
+    remote = {}
+    for cloudfile in uploaded:
+        if cloudfile.content_hash in shared:
+            continue
+        # Deduplicated rows in the same batch share one object
+        key = (cloudfile.upload_resp['storage'], cloudfile.content_hash or cloudfile.pk)
+        remote[key] = cloudfile.upload_resp
+
+    return list(remote.values())
+
+
+def expire_upload_sessions(batch_size=1000, dry_run=False):
+    """
+    Deletes upload sessions idle for settings.CLOUDSTORAGE_UPLOAD_SESSION_TTL seconds along
+    with their spool files
+
+    :param int batch_size: Sessions deleted per query
+    :param bool dry_run: Only count what would be deleted
+    :return int: Number of expired sessions
+    """
+    if dry_run:
+        return UploadSession.objects.expired().count()
+
+    expired = 0
+    while True:
+        batch = list(UploadSession.objects.expired().values_list('pk', 'spool_path')
+                     .order_by('pk')[:batch_size])
+        if not batch:
+            break
+
+        UploadSession.objects.filter(pk__in=[pk for pk, spool_path in batch]).delete()
+        for pk, spool_path in batch:
+            helper.remove_spooled_file(spool_path)
+        expired += len(batch)
+
+    return expired
@@ -8,6 +8,34 @@ class Target:
 class StorageProvider:
     S3 = 's3'
     CLOUDINARY = 'cloudinary'
+    LOCAL = 'local'
 
 
-PROVIDERS = (StorageProvider.S3, StorageProvider.CLOUDINARY)
+def __getattr__(name):
+    # PROVIDERS follows the backend registry, see backends.backend_names(); imported lazily
+    # since the backends import this module
+    if name == 'PROVIDERS':
+        from .backends import backend_names
+
+        return backend_names()
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+class FileStatus:
+    PENDING = 'pending'
+    UPLOADING = 'uploading'
+    UPLOADED = 'uploaded'
+    FAILED = 'failed'
+
+
+FILE_STATUSES = (FileStatus.PENDING, FileStatus.UPLOADING, FileStatus.UPLOADED,
+                 FileStatus.FAILED)
+
+
+#: Cloudinary transformations precomputed into `extra` unless the target field defines its own
+# `cloudinary_variants`
+DEFAULT_CLOUDINARY_VARIANTS = {
+    'thumbnail': 'c_scale,h_50',
+    'small': 'c_scale,h_250',
+}
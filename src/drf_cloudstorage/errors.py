@@ -9,5 +9,32 @@ class CloudFileError(CloudStorageError):
     status_code = 400
 
 
+class InvalidTarget(CloudFileError):
+    default_code = 'invalid_target'
+
+
 class UploadError(CloudStorageError):
     status_code = 503
+
+
+class DownloadError(CloudStorageError):
+    status_code = 502
+
+
+class InvalidStorage(CloudFileError):
+    pass
+
+
+class InvalidTargetObject(CloudFileError):
+    default_code = 'target_object'
+
+
+class FileTooLarge(CloudFileError):
+    default_code = 'file_size'
+
+
+class ProviderUnavailable(UploadError):
+    """
+    Raised instead of calling a provider whose circuit breaker is open
+    """
+    pass
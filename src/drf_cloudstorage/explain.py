@@ -0,0 +1,89 @@
+"""
+Query plan audit of the queries the library runs on cloudstorage_file, see the
+`cloudstorage_explain` management command
+"""
+import json
+
+from django.db import connections, transaction
+
+from .constants import FileStatus
+from .models import CloudFile
+from .targets import all_targets
+
+
+def audited_queries():
+    """
+    :return list: (name, queryset, name of the index its plan must use)
+    """
+    targets = sorted(all_targets(), key=lambda t: t.name)
+    queries = [
+        ('pending uploads',
+         CloudFile.objects.filter(status=FileStatus.PENDING).order_by('pk').values('pk')[:10],
+         'cloudstorage_pending_idx'),
+        ('files of an owner',
+         CloudFile.objects.filter(owner_id=1).order_by('-created_at')[:100],
+         'cloudstorage_owner_idx'),
+        ('completed direct upload',
+         CloudFile.objects.filter(url='https://example.com/file').values('pk')[:1],
+         'cloudstorage_url_idx'),
+    ]
+    if targets:
+        by_target = CloudFile.objects.filter_by_target(targets[0].name) \
+            .filter(status=FileStatus.UPLOADED).order_by('-created_at', '-id')
+        queries += [
+            ('files of a target', by_target[:100], 'cloudstorage_target_idx'),
+            ('files of an object', by_target.filter(object_id='1')[:100],
+             'cloudstorage_target_obj_idx'),
+        ]
+
+    return queries
+
+
+def plan_indexes(plan):
+    """
+    :param list|dict plan: Output of EXPLAIN (FORMAT JSON)
+    :return set: Names of the indexes scanned anywhere in the plan
+    """
+    if isinstance(plan, list):
+        return set().union(*(plan_indexes(node) for node in plan))
+
+    indexes = {plan['Index Name']} if 'Index Name' in plan else set()
+    for key in ('Plan', 'Plans'):
+        if key in plan:
+            indexes |= plan_indexes(plan[key])
+
+    return indexes
+
+
+def explain(queryset, force_index=True):
+    """
+    :param QuerySet queryset:
+    :param bool force_index: Disable sequential scans, which the planner prefers on small tables,
+        to tell whether the index can serve the query
+    :return list: EXPLAIN (FORMAT JSON) output
+    """
+    sql, params = queryset.query.sql_with_params()
+
+    # Run by hand, QuerySet.explain() turns the JSON decoded by psycopg2 back into a repr
+    with transaction.atomic(using=queryset.db), connections[queryset.db].cursor() as cursor:
+        if force_index:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        plan = cursor.fetchone()[0]
+
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def audit(force_index=True, using='default'):
+    """
+    :param bool force_index: See `explain()`
+    :param str using: Alias of the database
+    :return list: (name, expected index, indexes used, whether the expected one is among them)
+        per audited query
+    """
+    results = []
+    for name, queryset, index in audited_queries():
+        used = plan_indexes(explain(queryset.using(using), force_index=force_index))
+        results.append((name, index, used, index in used))
+
+    return results
@@ -9,11 +9,29 @@ class CustomAttributeFieldMixin:
     def __init__(self, *args, **kwargs):
         """
         :param kwargs:
+            :tuple allowed_mime_types:
+            :str min_file_size: Human readable size such as '1KB'
+            :str max_file_size: Human readable size such as '2MB'
+            :str memory_file_size: Uploads up to this size are kept in memory, bigger ones are
+                spooled to a temporary file. Defaults to settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            :dict cloudinary_variants: Name to Cloudinary transformation of the urls added to
+                `extra`, defaults to constants.DEFAULT_CLOUDINARY_VARIANTS
         """
 
         self.allowed_mime_types = kwargs.pop('allowed_mime_types', None)
+        self.cloudinary_variants = kwargs.pop('cloudinary_variants', None)
         self._min_file_size = kwargs.pop('min_file_size', None)
         self._max_file_size = kwargs.pop('max_file_size', None)
+        self._memory_file_size = kwargs.pop('memory_file_size', None)
+
+        # Parsed here rather than in .check(), which uwsgi workers never run, so every process
+        # and every copy of the field carries the limits in bytes.
+        #: int: min_file_size in bytes
+        self.min_file_size = self._parse_size(self._min_file_size)
+        #: int: max_file_size in bytes
+        self.max_file_size = self._parse_size(self._max_file_size)
+        #: int: memory_file_size in bytes
+        self.memory_file_size = self._parse_size(self._memory_file_size)
 
         super().__init__(*args, **kwargs)
 
@@ -24,25 +42,25 @@ class CustomAttributeFieldMixin:
             *self._check_validation_attribute(),
         ]
 
-    @property
-    def min_file_size(self):
+    def clone(self):
         """
-        For some reason, when app is used with uwsgi, self.min_file_size assigned in .check()
-        does not preserved.
-
-        :return int: min_file_size in bytes
+        Upload limits only matter to validation, deconstruct() leaves them out so changing them
+        does not need a migration. They are passed on to the copy here.
         """
-        return humanfriendly.parse_size(self._min_file_size, binary=True)
+        name, path, args, kwargs = self.deconstruct()
+        kwargs.update(allowed_mime_types=self.allowed_mime_types,
+                      cloudinary_variants=self.cloudinary_variants,
+                      min_file_size=self._min_file_size, max_file_size=self._max_file_size,
+                      memory_file_size=self._memory_file_size)
 
-    @property
-    def max_file_size(self):
-        """
-        For some reason, when app is used with uwsgi, self.max_file_size assigned in .check()
-        does not preserved.
+        return self.__class__(*args, **kwargs)
 
-        :return int: max_file_size in bytes
-        """
-        return humanfriendly.parse_size(self._max_file_size, binary=True)
+    @staticmethod
+    def _parse_size(size):
+        try:
+            return humanfriendly.parse_size(size, binary=True)
+        except (TypeError, humanfriendly.InvalidSize):
+            return None
 
     def _check_cloudfile_subclass(self):
         if issubclass(self.related_model, AbstractCloudFile) is False:
@@ -60,9 +78,7 @@ class CustomAttributeFieldMixin:
         return []
 
     def _check_validation_attribute(self):
-        try:
-            humanfriendly.parse_size(self._min_file_size, binary=True)
-        except TypeError:
+        if self.min_file_size is None:
             return [
                 checks.Error(
                     "CloudFileFields must define a 'min_file_size' attribute.",
@@ -71,9 +87,7 @@ class CustomAttributeFieldMixin:
                 )
             ]
 
-        try:
-            humanfriendly.parse_size(self._max_file_size, binary=True)
-        except TypeError:
+        if self.max_file_size is None:
             return [
                 checks.Error(
                     "CloudFileFields must define a 'max_file_size' attribute.",
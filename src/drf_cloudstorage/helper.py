@@ -1,5 +1,13 @@
+import hashlib
 import ntpath
+import os
 import re
+import shutil
+import tempfile
+
+import humanfriendly
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.text import get_valid_filename
 
 
 def path_leaf(path):
@@ -13,6 +21,105 @@ def path_leaf(path):
     return tail or ntpath.basename(head)
 
 
+def parse_size(size):
+    """
+    :param int|str size: Size in bytes or human readable size such as '8MiB'
+    :return int: Size in bytes
+    """
+    if isinstance(size, int):
+        return size
+
+    return humanfriendly.parse_size(size, binary=True)
+
+
+def file_size(f):
+    """
+    :param str|File f: File path or file object
+    :return int: File size in bytes
+    """
+    if isinstance(f, str):
+        return os.path.getsize(f)
+    if hasattr(f, 'size'):
+        return f.size
+
+    return os.fstat(f.fileno()).st_size
+
+
+def hash_file(f, chunk_size=64 * 1024):
+    """
+    Streams the file through SHA-256 without loading it into memory
+
+    :param str|File f: File path or file object, its position is restored
+    :param int chunk_size:
+    :return str: Hex digest
+    """
+    hasher = hashlib.sha256()
+
+    if isinstance(f, str):
+        with open(f, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    position = f.tell()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        hasher.update(chunk)
+    f.seek(position)
+
+    return hasher.hexdigest()
+
+
+def spool_file(f, directory=None, hasher=None):
+    """
+    Copies the file to local disk so it outlives the request that received it. The file keeps
+    its name inside a directory of its own.
+
+    :param File f: File to be spooled
+    :param str directory: Spool directory, defaults to the system temp dir
+    :param hasher: hashlib object updated with the content while it is copied
+    :return str: Path of the spooled file
+    """
+    path = spool_path(f.name, directory)
+    with open(path, 'wb') as fp:
+        chunks = f.chunks() if hasattr(f, 'chunks') else iter(lambda: f.read(64 * 1024), b'')
+        for chunk in chunks:
+            fp.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+
+    return path
+
+
+def spool_path(name, directory=None):
+    """
+    :param str name: File name
+    :param str directory: Spool directory, defaults to the system temp dir
+    :return str: Path of a file named `name` inside a new directory of its own
+    """
+    directory = directory or os.path.join(tempfile.gettempdir(), 'drf_cloudstorage')
+    os.makedirs(directory, exist_ok=True)
+
+    # Names come from clients: never '..' or anything else than a plain file name
+    try:
+        name = get_valid_filename(path_leaf(name or ''))[-255:]
+    except SuspiciousFileOperation:
+        name = ''
+    if name.strip('.') == '':
+        name = 'file'
+
+    return os.path.join(tempfile.mkdtemp(dir=directory), name)
+
+
+def remove_spooled_file(path):
+    """
+    Removes a file spooled by `spool_file()` or at `spool_path()` along with its directory
+
+    :param str path: Path of the spooled file
+    """
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
 def shorten_str(s, to_length=10, append=None):
     """
     Truncate string to a given length with appending 2 dots.
@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+
+from drf_cloudstorage.explain import audit
+
+
+class Command(BaseCommand):
+    help = 'Checks with EXPLAIN that the queries of drf_cloudstorage on cloudstorage_file use ' \
+           'their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='Database whose plans are checked')
+        parser.add_argument('--no-force-index', action='store_true',
+                            help='Keep sequential scans enabled to see the plans the planner '
+                                 'actually picks, e.g. on production data')
+
+    def handle(self, *args, **options):
+        if connections[options['database']].vendor != 'postgresql':
+            raise CommandError('The audit needs a PostgreSQL database')
+
+        failed = 0
+        for name, index, used, ok in audit(force_index=not options['no_force_index'],
+                                           using=options['database']):
+            failed += not ok
+            self.stdout.write('%s %s: expected %s, used %s' % (
+                'OK  ' if ok else 'FAIL', name, index, ', '.join(sorted(used)) or 'no index'
+            ))
+
+        if failed:
+            raise CommandError('%d queries do not use their index' % failed)
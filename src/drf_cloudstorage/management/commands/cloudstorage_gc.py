@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+import humanfriendly
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from drf_cloudstorage.collector import collect, expire_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Deletes cloud files never linked to a target along with their provider objects, ' \
+           'and expired upload sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', default='24h',
+                            help="Age of unlinked files to be deleted, e.g. '24h' or '7d'")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of files deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting anything')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=humanfriendly.parse_timespan(options['ttl']))
+        stats = collect(cutoff, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        sessions = expire_upload_sessions(batch_size=options['batch_size'],
+                                          dry_run=options['dry_run'])
+
+        seconds = max(stats['seconds'], 1e-6)
+        self.stdout.write(
+            '%s %d files and %d provider objects in %.2fs (%.1f files/s, %.1f objects/s)' % (
+                'Would delete' if options['dry_run'] else 'Deleted',
+                stats['files'], stats['remote_objects'], stats['seconds'],
+                stats['files'] / seconds, stats['remote_objects'] / seconds,
+            )
+        )
+        self.stdout.write('%s %d expired upload sessions' % (
+            'Would delete' if options['dry_run'] else 'Deleted', sessions
+        ))
+        if stats['remote_errors']:
+            self.stderr.write('%d provider objects could not be deleted' % stats['remote_errors'])
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management import BaseCommand
+
+from drf_cloudstorage.workers import pending_uploads, process_upload, reclaim_abandoned_uploads
+
+
+class Command(BaseCommand):
+    help = 'Uploads pending cloud files created with CLOUDSTORAGE_ASYNC_UPLOAD enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to sleep when there is nothing to upload')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Number of pending files fetched per poll')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once there is nothing left to upload')
+
+    def handle(self, *args, **options):
+        # Every poll walks the pending files once, those that fail are not read again
+        last_pk = 0
+        while True:
+            if last_pk == 0:
+                reclaimed = reclaim_abandoned_uploads()
+                if reclaimed:
+                    self.stdout.write('Reclaimed %d abandoned uploads' % reclaimed)
+
+            pending_ids = list(
+                pending_uploads().filter(pk__gt=last_pk)
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+
+            for pk in pending_ids:
+                if process_upload(pk) is not None:
+                    self.stdout.write('Uploaded cloud file %s' % pk)
+
+            if pending_ids:
+                last_pk = pending_ids[-1]
+                continue
+
+            if options['once']:
+                return
+            last_pk = 0
+            time.sleep(options['interval'])
@@ -0,0 +1,216 @@
+"""
+Instrumentation of the upload lifecycle. Stages are timed and reported through the signals of
+`signals`; settings.CLOUDSTORAGE_METRICS_SINK additionally forwards them to a metrics sink:
+
+- cloudstorage.stage.duration (timing, tags stage and storage)
+- cloudstorage.stage.failures (counter, tags stage and storage)
+- cloudstorage.upload.bytes (counter, tag storage)
+- cloudstorage.upload.throughput (histogram of bytes per second, tag storage)
+- cloudstorage.rejections (counter, tag reason)
+- cloudstorage.signed_urls (counter, tag storage) and cloudstorage.sign.duration (timing)
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+
+from .signals import stage_finished, upload_rejected, urls_signed
+
+_sink = None
+_sink_loaded = False
+
+
+class MetricsSink:
+    """
+    Receives the metrics, typically to hand them to a statsd client or Prometheus collectors.
+    Tags are a dict of str, to be mapped to tags or labels.
+    """
+
+    def increment(self, name, value=1, tags=None):
+        """
+        :param str name:
+        :param int|float value: Amount added to the counter
+        :param dict tags:
+        """
+        raise NotImplementedError
+
+    def timing(self, name, seconds, tags=None):
+        """
+        :param str name:
+        :param float seconds: Duration of the event
+        :param dict tags:
+        """
+        raise NotImplementedError
+
+    def observe(self, name, value, tags=None):
+        """
+        :param str name:
+        :param float value: Sample of a histogram
+        :param dict tags:
+        """
+        raise NotImplementedError
+
+
+class InMemorySink(MetricsSink):
+    """
+    Keeps the metrics of the process in memory, e.g. for tests
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.timings = defaultdict(list)
+        self.observations = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, tags=None):
+        """
+        :return tuple: Key of the metric in counters, timings and observations
+        """
+        return (name,) + tuple(sorted((tags or {}).items()))
+
+    def increment(self, name, value=1, tags=None):
+        with self._lock:
+            self.counters[self.key(name, tags)] += value
+
+    def timing(self, name, seconds, tags=None):
+        with self._lock:
+            self.timings[self.key(name, tags)].append(seconds)
+
+    def observe(self, name, value, tags=None):
+        with self._lock:
+            self.observations[self.key(name, tags)].append(value)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.observations.clear()
+
+
+def get_metrics_sink():
+    """
+    :return MetricsSink: Sink configured by settings.CLOUDSTORAGE_METRICS_SINK, None if unset
+    """
+    global _sink, _sink_loaded
+
+    if not _sink_loaded:
+        path = getattr(settings, 'CLOUDSTORAGE_METRICS_SINK', None)
+        _sink = import_string(path)() if path else None
+        _sink_loaded = True
+
+    return _sink
+
+
+@contextmanager
+def timed(stage, size=None, storage=None):
+    """
+    Times the block and sends `signals.stage_finished` once it is over, raising or not
+
+    :param str stage: Name of the stage, sender of the signal
+    :param int size: Bytes processed by the stage
+    :param str storage: Name of the storage backend
+    """
+    failed = True
+    started = time.perf_counter()
+    try:
+        yield
+        failed = False
+    finally:
+        stage_finished.send(sender=stage, duration=time.perf_counter() - started, size=size,
+                            storage=storage, failed=failed)
+
+
+def rejection_reasons(exc):
+    """
+    :param APIException exc: Validation error
+    :return set: Error codes of the exception, prefixed by the field they belong to
+    """
+    codes = exc.get_codes()
+    if not isinstance(codes, dict):
+        return set(_flatten(codes))
+
+    return {code if field == api_settings.NON_FIELD_ERRORS_KEY else '%s.%s' % (field, code)
+            for field, field_codes in codes.items() for code in _flatten(field_codes)}
+
+
+def _flatten(codes):
+    if isinstance(codes, str):
+        yield codes
+    elif isinstance(codes, dict):
+        for value in codes.values():
+            yield from _flatten(value)
+    else:
+        for value in codes:
+            yield from _flatten(value)
+
+
+def record_rejection(exc):
+    """
+    Sends `signals.upload_rejected` once per reason of the validation error
+    """
+    for reason in sorted(rejection_reasons(exc)):
+        upload_rejected.send(sender=reason)
+
+
+@contextmanager
+def signing(storage):
+    """
+    Times the signing of urls and sends `signals.urls_signed` if any got signed. The yielded
+    dict takes the number of signed urls as 'count'.
+
+    :param str storage: Name of the storage backend
+    """
+    info = {'count': 0}
+    started = time.perf_counter()
+    yield info
+    if info['count']:
+        urls_signed.send(sender=storage, count=info['count'],
+                         duration=time.perf_counter() - started)
+
+
+@receiver(stage_finished)
+def _stage_metrics(sender, duration, size, storage, failed, **kwargs):
+    sink = get_metrics_sink()
+    if sink is None:
+        return
+
+    tags = {'stage': sender, 'storage': storage or ''}
+    sink.timing('cloudstorage.stage.duration', duration, tags)
+    if failed:
+        sink.increment('cloudstorage.stage.failures', tags=tags)
+    elif sender == 'upload' and size is not None:
+        tags = {'storage': storage or ''}
+        sink.increment('cloudstorage.upload.bytes', size, tags)
+        if duration > 0:
+            sink.observe('cloudstorage.upload.throughput', size / duration, tags)
+
+
+@receiver(upload_rejected)
+def _rejection_metrics(sender, **kwargs):
+    sink = get_metrics_sink()
+    if sink is not None:
+        sink.increment('cloudstorage.rejections', tags={'reason': sender})
+
+
+@receiver(urls_signed)
+def _signing_metrics(sender, count, duration, **kwargs):
+    sink = get_metrics_sink()
+    if sink is not None:
+        sink.increment('cloudstorage.signed_urls', count, {'storage': sender})
+        sink.timing('cloudstorage.sign.duration', duration, {'storage': sender})
+
+
+@receiver(setting_changed)
+def _reset_sink(setting, **kwargs):
+    global _sink, _sink_loaded
+
+    if setting == 'CLOUDSTORAGE_METRICS_SINK':
+        _sink = None
+        _sink_loaded = False
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudfile',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('uploaded', 'uploaded'),
+                                            ('failed', 'failed')],
+                                   default='uploaded', max_length=10),
+        ),
+    ]
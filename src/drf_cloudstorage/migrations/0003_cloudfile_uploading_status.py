@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0002_cloudfile_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cloudfile',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('uploading', 'uploading'),
+                                            ('uploaded', 'uploaded'), ('failed', 'failed')],
+                                   default='uploaded', max_length=10),
+        ),
+    ]
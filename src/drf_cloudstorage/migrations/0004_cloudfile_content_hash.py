@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0003_cloudfile_uploading_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64,
+                                   null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:05
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0004_cloudfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudfile',
+            name='extra_data',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, editable=False,
+                                                                 null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:07
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0005_cloudfile_extra_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CloudFileRawResponse',
+            fields=[
+                ('cloudfile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                   primary_key=True, related_name='raw_response',
+                                                   serialize=False,
+                                                   to='drf_cloudstorage.cloudfile')),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField()),
+            ],
+            options={
+                'db_table': 'cloudstorage_file_raw_response',
+                'default_permissions': (),
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:11
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_cloudstorage', '0006_cloudfile_raw_response'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True,
+                                        serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('spool_path', models.CharField(editable=False, max_length=500)),
+                ('target', models.CharField(max_length=500)),
+                ('storage', models.CharField(max_length=20)),
+                ('object_id', models.CharField(blank=True, max_length=10, null=True)),
+                ('name', models.CharField(blank=True, default='', max_length=50)),
+                ('link_target', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'cloudstorage_upload_session',
+                'default_permissions': (),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:38
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('drf_cloudstorage', '0007_uploadsession'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='cloudfile',
+            index=models.Index(condition=models.Q(status='uploaded'),
+                               fields=['content_type', 'content_field', 'object_id', 'created_at',
+                                       'id'], name='cloudstorage_target_obj_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='cloudfile',
+            index=models.Index(condition=models.Q(status='uploaded'),
+                               fields=['content_type', 'content_field', 'created_at', 'id'],
+                               name='cloudstorage_target_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:39
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('drf_cloudstorage', '0008_cloudfile_target_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='cloudfile',
+            index=models.Index(fields=['owner', 'created_at'], name='cloudstorage_owner_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='cloudfile',
+            index=models.Index(condition=models.Q(status='pending'), fields=['id'],
+                               name='cloudstorage_pending_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='cloudfile',
+            index=models.Index(fields=['url'], name='cloudstorage_url_idx'),
+        ),
+    ]
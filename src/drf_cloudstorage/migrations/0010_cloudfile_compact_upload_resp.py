@@ -0,0 +1,89 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:41
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+#: Snapshot of StorageBackend.resp_keys of the S3 and Cloudinary backends when this migration
+#: was written
+UPLOAD_RESP_KEYS = {
+    's3': ('storage', 'prefix', 'name'),
+    'cloudinary': ('storage', 'public_id', 'version', 'format', 'resource_type', 'secure_url',
+                   'etag'),
+}
+
+BATCH_SIZE = 1000
+
+
+def compact_upload_resp(apps, schema_editor):
+    """
+    Trims upload_resp of uploaded files to UPLOAD_RESP_KEYS. Rows are rewritten in batches of
+    BATCH_SIZE, each in a transaction of its own, so the table is never locked as a whole.
+
+    With settings.CLOUDSTORAGE_STORE_RAW_RESPONSE enabled the complete responses are copied to
+    cloudstorage_file_raw_response first and the migration can be reversed. Otherwise the keys
+    trimmed are lost for good.
+    """
+    CloudFile = apps.get_model('drf_cloudstorage', 'CloudFile')
+    CloudFileRawResponse = apps.get_model('drf_cloudstorage', 'CloudFileRawResponse')
+    store_raw = getattr(settings, 'CLOUDSTORAGE_STORE_RAW_RESPONSE', False) is True
+    queryset = CloudFile.objects.filter(status='uploaded').order_by('pk').only('pk', 'upload_resp')
+
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        compacted = []
+        raw_responses = []
+        for cloudfile in batch:
+            keys = UPLOAD_RESP_KEYS.get((cloudfile.upload_resp or {}).get('storage'))
+            if keys is None or set(cloudfile.upload_resp) <= set(keys):
+                continue
+            if store_raw:
+                raw_responses.append(CloudFileRawResponse(cloudfile_id=cloudfile.pk,
+                                                          data=cloudfile.upload_resp))
+            cloudfile.upload_resp = {key: cloudfile.upload_resp[key] for key in keys
+                                     if key in cloudfile.upload_resp}
+            compacted.append(cloudfile)
+
+        with transaction.atomic():
+            CloudFileRawResponse.objects.bulk_create(raw_responses, ignore_conflicts=True)
+            CloudFile.objects.bulk_update(compacted, ['upload_resp'])
+
+
+def restore_upload_resp(apps, schema_editor):
+    """
+    Puts back the complete responses kept by `compact_upload_resp()`, rows without one stay
+    trimmed
+    """
+    CloudFile = apps.get_model('drf_cloudstorage', 'CloudFile')
+    CloudFileRawResponse = apps.get_model('drf_cloudstorage', 'CloudFileRawResponse')
+    queryset = CloudFileRawResponse.objects.order_by('pk')
+
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        with transaction.atomic():
+            CloudFile.objects.bulk_update([
+                CloudFile(pk=raw_response.pk, upload_resp=raw_response.data)
+                for raw_response in batch
+            ], ['upload_resp'])
+
+
+class Migration(migrations.Migration):
+    # Every batch commits on its own, see compact_upload_resp()
+    atomic = False
+
+    dependencies = [
+        ('drf_cloudstorage', '0009_cloudfile_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_upload_resp, restore_upload_resp, elidable=True),
+    ]
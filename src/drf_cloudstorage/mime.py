@@ -0,0 +1,101 @@
+import mimetypes
+import re
+
+#: Bytes read from the beginning of a file to detect its type
+HEADER_SIZE = 32
+
+#: (pattern matched at the start of the file, mime type)
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8[79]a', 'image/gif'),
+    (b'RIFF.{4}WEBP', 'image/webp'),
+    (b'II\\*\x00|MM\x00\\*', 'image/tiff'),
+    (b'BM.{4}\x00\x00\x00\x00', 'image/bmp'),
+    (b'\x00\x00\x01\x00', 'image/x-icon'),
+    (b'.{4}ftyp(heic|heix|mif1)', 'image/heic'),
+    (b'.{4}ftypqt', 'video/quicktime'),
+    (b'.{4}ftyp', 'video/mp4'),
+    (b'\x1aE\xdf\xa3', 'video/webm'),
+    (b'RIFF.{4}AVI ', 'video/x-msvideo'),
+    (b'RIFF.{4}WAVE', 'audio/x-wav'),
+    (b'ID3|\xff[\xfb\xf3\xf2]', 'audio/mpeg'),
+    (b'OggS', 'audio/ogg'),
+    (b'fLaC', 'audio/flac'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04|PK\x05\x06', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'Rar!\x1a\x07', 'application/x-rar-compressed'),
+    (b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+)
+
+#: Formats stored in a container whose signature is all we can see in the header. The type
+# guessed from the file name is trusted when the container matches.
+CONTAINERS = {
+    'application/zip': {
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/vnd.oasis.opendocument.text',
+        'application/vnd.oasis.opendocument.spreadsheet',
+        'application/epub+zip',
+        'application/java-archive',
+    },
+    'application/x-ole-storage': {
+        'application/msword',
+        'application/vnd.ms-excel',
+        'application/vnd.ms-powerpoint',
+    },
+    'video/mp4': {
+        'audio/mp4',
+        'video/3gpp',
+    },
+}
+
+_SIGNATURE_RE = re.compile(
+    b'|'.join(b'(?P<s%d>%s)' % (i, pattern) for i, (pattern, mt) in enumerate(SIGNATURES)),
+    re.DOTALL
+)
+_SIGNATURE_MIME_TYPES = {'s%d' % i: mt for i, (pattern, mt) in enumerate(SIGNATURES)}
+_SNIFFABLE_MIME_TYPES = set(_SIGNATURE_MIME_TYPES.values()) | {'image/jpg'}
+
+
+def sniff_mime_type(file):
+    """
+    Detects the file type from the magic number in its first HEADER_SIZE bytes. The file
+    position is restored afterwards.
+
+    :param File file:
+    :return str: Mime type or None if no signature matches
+    """
+    position = file.tell()
+    file.seek(0)
+    header = file.read(HEADER_SIZE)
+    file.seek(position)
+
+    match = _SIGNATURE_RE.match(header)
+    if match is None:
+        return None
+
+    return _SIGNATURE_MIME_TYPES[match.lastgroup]
+
+
+def detect_mime_type(file):
+    """
+    Combines the sniffed and the name based mime type. A name can't claim a type whose
+    signature is missing from the content, e.g. a text file renamed to .jpg is not an image.
+
+    :param File file:
+    :return str: Mime type or None
+    """
+    sniffed = sniff_mime_type(file)
+    guessed, encoding = mimetypes.guess_type(file.name)
+
+    if sniffed is None:
+        return None if guessed in _SNIFFABLE_MIME_TYPES else guessed
+
+    if guessed in CONTAINERS.get(sniffed, ()):
+        return guessed
+
+    return sniffed
@@ -1,28 +1,45 @@
+import hashlib
+import logging
 import os
-from pathlib import Path
+import shutil
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-import cloudinary.uploader
-from cloudinary.exceptions import Error
+import humanfriendly
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres import fields as pg_fields
-from django.db import models, transaction
-from django.db.models import Manager, Model
-from django.utils.crypto import get_random_string
-from django.utils.text import slugify
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router, transaction
+from django.db.models import Manager, Model, Q
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from . import helper
-from .constants import StorageProvider
-from .errors import UploadError
-from .helper import CloudinaryHelper
+from . import clients, helper, metrics, resilience
+from .backends import get_backend
+from .constants import FILE_STATUSES, FileStatus, StorageProvider
+from .errors import CloudFileError, InvalidTargetObject, UploadError
+from .targets import get_target
+
+L = logging.getLogger(__name__)
+
+DIRECT_UPLOAD_SALT = 'drf_cloudstorage.direct_upload'
 
 
 class StorageProviderManagerMixin:
-    @classmethod
-    def upload(cls, f, directory, use_filename=True):
-        raise NotImplementedError
+    #: Name of the storage backend served by the manager, see backends.backend_names()
+    storage = None
+
+    @property
+    def backend(self):
+        """
+        :return StorageBackend:
+        """
+        return get_backend(self.storage)
 
     def create_and_upload(self, f, **kwargs):
         """
@@ -33,31 +50,375 @@ class StorageProviderManagerMixin:
             :str content_field:
             :str target:
             :int object_id:
+            :bool two_phase: Commit a pending row before uploading, defaults to
+                settings.CLOUDSTORAGE_TWO_PHASE_UPLOAD
         :return:
         """
-        content_type = kwargs.get('content_type') or None
-        content_field = kwargs.get('content_field') or None
-        target = kwargs.pop('target', None)
         link_target = kwargs.pop('link_target', False)
         use_filename = kwargs.pop('use_filename', False)
+        two_phase = kwargs.pop('two_phase',
+                               getattr(settings, 'CLOUDSTORAGE_TWO_PHASE_UPLOAD', False))
 
-        assert target or (content_type and content_field)
+        upload_dir = self._resolve_target(kwargs)
 
-        # resolve target
-        if target:
-            content_type, content_field = self._parse_target(target)
-            kwargs.update({'content_type': content_type, 'content_field': content_field})
+        if self._deduplicate():
+            kwargs['content_hash'] = helper.hash_file(f)
+            duplicate = self._find_duplicate(kwargs['content_hash'])
+            if duplicate is not None:
+                cloudfile = self._create_duplicate(duplicate, link_target, **kwargs)
+                if cloudfile is not None:
+                    return cloudfile
+
+        if two_phase is True:
+            return self._create_and_upload_two_phase(f, upload_dir, use_filename, link_target,
+                                                     **kwargs)
+
+        url, resp = self._upload(f, upload_dir, use_filename)
+
+        # The row is inserted once with its final values
+        try:
+            with metrics.timed('save', storage=resp['storage']), transaction.atomic():
+                kwargs.update({'url': url, 'upload_resp': self._compact_resp(resp)})
+                cloudfile = self.create(**kwargs)
+                self._save_raw_responses([cloudfile], [resp])
+
+                try:
+                    if link_target is True:
+                        cloudfile.link_to_target()
+                except AssertionError:
+                    pass
+        except InvalidTargetObject:
+            # The object is checked by linking, after the upload
+            self._delete_uploaded(resp)
+            raise
+
+        return cloudfile
+
+    def bulk_create_and_upload(self, files, **kwargs):
+        """
+        Uploads files sharing a target concurrently from a pool of
+        settings.CLOUDSTORAGE_BULK_UPLOAD_CONCURRENCY threads, inserts the uploaded ones with a
+        single query and links them to the target at once.
+
+        :param list files:
+        :param kwargs: Same as `create_and_upload()`
+        :return list: CloudFile or UploadError per file, in the order of `files`
+        """
+        link_target = kwargs.pop('link_target', False)
+        use_filename = kwargs.pop('use_filename', False)
+        kwargs.pop('two_phase', None)
+
+        upload_dir = self._resolve_target(kwargs)
+        if not files:
+            return []
+        concurrency = getattr(settings, 'CLOUDSTORAGE_BULK_UPLOAD_CONCURRENCY', 4)
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(files))) as executor:
+            if self._deduplicate():
+                hashes = list(executor.map(helper.hash_file, files))
+                duplicates = {cloudfile.content_hash: cloudfile
+                              for cloudfile in self._find_duplicates(hashes)}
+            else:
+                hashes = [None] * len(files)
+                duplicates = {}
+
+            def upload(f, content_hash):
+                if content_hash in duplicates:
+                    return duplicates[content_hash].url, duplicates[content_hash].upload_resp
+                try:
+                    return self._upload(f, upload_dir, use_filename)
+                except UploadError as e:
+                    return None, e
+
+            results = list(executor.map(upload, files, hashes))
+
+        while True:
+            try:
+                cloudfiles, stale = self._bulk_save(results, hashes, duplicates, link_target,
+                                                    **kwargs)
+            except InvalidTargetObject:
+                # The object is checked by linking, after the uploads
+                for (url, resp), content_hash in zip(results, hashes):
+                    if content_hash not in duplicates and not isinstance(resp, UploadError):
+                        self._delete_uploaded(resp)
+                raise
+            if not stale:
+                break
+
+            # Their duplicates got deleted in the meantime, uploaded after all out of the
+            # transaction
+            for i in stale:
+                duplicates.pop(hashes[i], None)
+            for i in stale:
+                results[i] = upload(files[i], hashes[i])
+
+        uploaded = iter(cloudfiles)
+        return [resp if isinstance(resp, UploadError) else next(uploaded)
+                for url, resp in results]
+
+    def _bulk_save(self, results, hashes, duplicates, link_target, **kwargs):
+        """
+        Inserts the rows of `bulk_create_and_upload()` unless some of the duplicates reused got
+        deleted in the meantime. They are locked like in `_create_duplicate()` until the rows
+        are committed.
+
+        :return tuple: (inserted cloud files, indexes of the results whose duplicate is gone)
+        """
+        with metrics.timed('save', storage=self.storage), transaction.atomic():
+            kept = set(self.select_for_update()
+                       .filter(pk__in=[cloudfile.pk for cloudfile in duplicates.values()])
+                       .values_list('content_hash', flat=True)) if duplicates else set()
+            stale = [i for i, content_hash in enumerate(hashes)
+                     if content_hash in duplicates and content_hash not in kept]
+            if stale:
+                return [], stale
+
+            cloudfiles, raw_resps = [], []
+            for (url, resp), content_hash in zip(results, hashes):
+                if isinstance(resp, UploadError):
+                    continue
+                cloudfile = self.model(url=url, upload_resp=self._compact_resp(resp),
+                                       content_hash=content_hash, **kwargs)
+                cloudfile.extra_data = cloudfile.build_extra()
+                cloudfiles.append(cloudfile)
+                raw_resps.append(None if content_hash in duplicates else resp)
+
+            cloudfiles = self.bulk_create(cloudfiles)
+            self._save_raw_responses(cloudfiles, raw_resps)
+
+            if link_target is True and cloudfiles and cloudfiles[0].object_id is not None:
+                self.model.link_all_to_target(cloudfiles)
+
+        return cloudfiles, []
+
+    def create_pending(self, f, **kwargs):
+        """
+        Spools the file to settings.CLOUDSTORAGE_SPOOL_DIR and creates a pending row. The
+        upload itself is done later by `upload_pending()`, usually from an upload worker.
+
+        :param File f:
+        :param kwargs: Same as `create_and_upload()`
+        :return CloudFile: Pending cloud file
+        """
+        link_target = kwargs.pop('link_target', False)
+        use_filename = kwargs.pop('use_filename', False)
+        kwargs.pop('two_phase', None)
+
+        self._resolve_target(kwargs)
+
+        hasher = hashlib.sha256() if self._deduplicate() else None
+        spool_path = helper.spool_file(f, getattr(settings, 'CLOUDSTORAGE_SPOOL_DIR', None),
+                                       hasher=hasher)
+
+        if hasher is not None:
+            kwargs['content_hash'] = hasher.hexdigest()
+            duplicate = self._find_duplicate(kwargs['content_hash'])
+            if duplicate is not None:
+                cloudfile = self._create_duplicate(duplicate, link_target, **kwargs)
+                if cloudfile is not None:
+                    helper.remove_spooled_file(spool_path)
+                    return cloudfile
+
+        kwargs.update({
+            'url': '',
+            'status': FileStatus.PENDING,
+            'upload_resp': {
+                'storage': self.storage,
+                'spool_path': spool_path,
+                'use_filename': use_filename,
+                'link_target': link_target,
+            }
+        })
+
+        return self.create(**kwargs)
+
+    def upload_pending(self, cloudfile):
+        """
+        Uploads the spooled file of a pending cloud file. The row is claimed first so that
+        concurrent workers never upload the same file twice.
+
+        :param CloudFile cloudfile: Pending cloud file
+        :return CloudFile: Uploaded cloud file or None if the row was claimed by someone else
+        """
+        # updated_at starts the lease, see `workers.reclaim_abandoned_uploads()`
+        claimed = self.filter(pk=cloudfile.pk, status=FileStatus.PENDING) \
+            .update(status=FileStatus.UPLOADING, updated_at=timezone.now())
+        if claimed == 0:
+            return None
+
+        job = cloudfile.upload_resp
+        upload_dir = self._contenttype_upload_dir(cloudfile.content_type, cloudfile.content_field)
+
+        try:
+            return self._complete_upload(cloudfile, job['spool_path'], upload_dir,
+                                         job['use_filename'], job['link_target'])
+        finally:
+            helper.remove_spooled_file(job['spool_path'])
+
+    def prepare_direct_upload(self, filename, mime_type=None, **kwargs):
+        """
+        Lets the client upload the file to the provider itself instead of through us. The
+        target limits are enforced by the provider where it can.
+
+        :param str filename: Name of the file the client is about to upload
+        :param str mime_type: Declared mime type, enforced by providers that can
+        :param kwargs: Same as `create_and_upload()`, a `target` is required
+        :return tuple: (job, url, fields) -- `job` is handed back to `complete_direct_upload()`
+            once the file is posted to `url` along with the form `fields`
+        """
+        link_target = kwargs.pop('link_target', False)
+        use_filename = kwargs.pop('use_filename', False)
+        target = get_target(kwargs.pop('target'))
+
+        upload_dir = self._contenttype_upload_dir(target.content_type, target.field.name)
+        url, fields, upload_resp = self.backend.direct_upload_params(
+            target, upload_dir, self.backend.get_file_name(filename, use_filename), mime_type,
+            getattr(settings, 'CLOUDSTORAGE_DIRECT_UPLOAD_EXPIRES_IN', 3600)
+        )
+
+        job = {
+            'storage': self.storage,
+            'target': target.name,
+            'upload_resp': upload_resp,
+            'link_target': link_target,
+            'fields': {key: kwargs[key] for key in ('object_id', 'name') if key in kwargs},
+        }
 
-        upload_dir = self._contenttype_upload_dir(content_type, content_field)
+        return job, url, fields
+
+    def complete_direct_upload(self, job, client_resp=None):
+        """
+        Creates the row of a file uploaded to the provider by the client
+
+        :param dict job: Job returned by `prepare_direct_upload()`
+        :param dict client_resp: Response the provider gave the client
+        :return CloudFile:
+        """
+        target = get_target(job['target'])
+        url, resp, size = resilience.call(self.storage, self.backend.verify_direct_upload,
+                                          job['upload_resp'], client_resp or {},
+                                          idempotent=True)
+
+        if size < target.min_file_size or size > target.max_file_size:
+            self._delete_uploaded(resp)
+            raise CloudFileError(_(
+                'File size must be between %s and %s' %
+                (humanfriendly.format_size(target.min_file_size),
+                 humanfriendly.format_size(target.max_file_size))
+            ))
 
         with transaction.atomic():
-            kwargs.update({'url': '', 'upload_resp': None})
-            cloudfile = self.create(**kwargs)
+            if self.filter(url=url).exists():
+                raise CloudFileError(_('Upload has already been completed.'))
+
+            cloudfile = self.create(url=url, upload_resp=self._compact_resp(resp),
+                                    content_type=target.content_type,
+                                    content_field=target.field.name, **job['fields'])
+            self._save_raw_responses([cloudfile], [resp])
+
+            try:
+                if job['link_target'] is True:
+                    cloudfile.link_to_target()
+            except AssertionError:
+                pass
+
+        return cloudfile
+
+    def _compact_resp(self, resp):
+        """
+        :param dict resp: Upload response of the backend
+        :return dict: Keys of the response read by the app, see StorageBackend.resp_keys
+        """
+        keys = get_backend(resp['storage']).resp_keys
+        if keys is None:
+            return resp
+
+        return {key: resp[key] for key in keys if key in resp}
+
+    def _upload(self, f, upload_dir, use_filename):
+        """
+        Uploads through the circuit breaker of the backend. Uploads are not retried, since
+        every attempt stores a new object, but fail over to the backend configured by
+        settings.CLOUDSTORAGE_FAILOVER.
+
+        :return tuple: (url, upload_resp), upload_resp['storage'] names the backend used
+        """
+        try:
+            size = helper.file_size(f)
+        except (AttributeError, OSError):
+            # Streams without a size are timed only
+            size = None
+
+        try:
+            with metrics.timed('upload', size=size, storage=self.storage):
+                return resilience.call(self.storage, self.backend.upload, f, upload_dir,
+                                       use_filename=use_filename)
+        except UploadError:
+            alternate = resilience.failover_backend(self.storage)
+            if alternate is None:
+                raise
+
+        L.warning('Upload to storage %s failed, failing over to %s', self.storage, alternate,
+                  exc_info=True)
+        if not isinstance(f, str):
+            f.seek(0)
+
+        with metrics.timed('upload', size=size, storage=alternate):
+            return resilience.call(alternate, get_backend(alternate).upload, f, upload_dir,
+                                   use_filename=use_filename)
+
+    @staticmethod
+    def _delete_uploaded(resp):
+        """
+        Deletes the object of an upload response again, of whichever backend stored it
+        """
+        storage = resp['storage']
+        resilience.call(storage, get_backend(storage).delete_many, [resp], idempotent=True)
+
+    @staticmethod
+    def _save_raw_responses(cloudfiles, resps):
+        """
+        Keeps complete provider responses in their own table when
+        settings.CLOUDSTORAGE_STORE_RAW_RESPONSE is enabled
+        """
+        if getattr(settings, 'CLOUDSTORAGE_STORE_RAW_RESPONSE', False) is not True:
+            return
 
-            url, resp = self.upload(f, upload_dir, use_filename=use_filename)
-            cloudfile.url = url
-            cloudfile.upload_resp = resp
-            cloudfile.save()
+        CloudFileRawResponse.objects.bulk_create([
+            CloudFileRawResponse(cloudfile=cloudfile, data=resp)
+            for cloudfile, resp in zip(cloudfiles, resps) if resp is not None
+        ])
+
+    @staticmethod
+    def _deduplicate():
+        return getattr(settings, 'CLOUDSTORAGE_DEDUPLICATE', False) is True
+
+    def _find_duplicate(self, content_hash):
+        """
+        :param str content_hash:
+        :return CloudFile: Uploaded file of the same storage and content or None
+        """
+        return self._find_duplicates([content_hash]).first()
+
+    def _find_duplicates(self, content_hashes):
+        return self.filter(content_hash__in=content_hashes, status=FileStatus.UPLOADED,
+                           upload_resp__storage=self.storage) \
+            .only('url', 'upload_resp', 'content_hash').order_by('pk')
+
+    def _create_duplicate(self, duplicate, link_target, **kwargs):
+        """
+        Creates a row pointing to the provider object of `duplicate` instead of uploading.
+        `duplicate` is locked until the row is committed, so `collector.collect()` either sees
+        the new row sharing the object or deletes `duplicate` first.
+
+        :return CloudFile: None if `duplicate` was deleted in the meantime
+        """
+        with transaction.atomic():
+            if not self.select_for_update().filter(pk=duplicate.pk).exists():
+                return None
+
+            kwargs.update({'url': duplicate.url, 'upload_resp': duplicate.upload_resp})
+            cloudfile = self.create(**kwargs)
 
             try:
                 if link_target is True:
@@ -67,37 +428,98 @@ class StorageProviderManagerMixin:
 
         return cloudfile
 
+    def _resolve_target(self, kwargs):
+        """
+        Replaces `target` in kwargs with its content type and field
+
+        :param dict kwargs: create_and_upload() keyword arguments
+        :return str: Upload directory of the target
+        """
+        content_type = kwargs.get('content_type') or None
+        content_field = kwargs.get('content_field') or None
+        target = kwargs.pop('target', None)
+
+        assert target or (content_type and content_field)
+
+        if target:
+            content_type, content_field = self._parse_target(target)
+            kwargs.update({'content_type': content_type, 'content_field': content_field})
+
+        return self._contenttype_upload_dir(content_type, content_field)
+
+    def _create_and_upload_two_phase(self, f, upload_dir, use_filename, link_target, **kwargs):
+        """
+        Commits a pending row first, uploads the file without holding a database connection
+        and finally stores the upload response in a short second transaction. A failed upload
+        leaves the row marked as failed.
+        """
+        kwargs.update({'url': '', 'upload_resp': None, 'status': FileStatus.PENDING})
+        cloudfile = self.create(**kwargs)
+
+        self._release_connection()
+
+        return self._complete_upload(cloudfile, f, upload_dir, use_filename, link_target)
+
+    def _complete_upload(self, cloudfile, f, upload_dir, use_filename, link_target):
+        try:
+            url, resp = self._upload(f, upload_dir, use_filename)
+        except Exception:
+            self.filter(pk=cloudfile.pk).update(status=FileStatus.FAILED)
+            cloudfile.status = FileStatus.FAILED
+            raise
+
+        try:
+            with metrics.timed('save', storage=resp['storage']), transaction.atomic():
+                cloudfile.url = url
+                cloudfile.upload_resp = self._compact_resp(resp)
+                cloudfile.status = FileStatus.UPLOADED
+                cloudfile.save(update_fields=['url', 'upload_resp', 'status', 'extra_data'])
+                self._save_raw_responses([cloudfile], [resp])
+
+                try:
+                    if link_target is True:
+                        cloudfile.link_to_target()
+                except AssertionError:
+                    pass
+        except InvalidTargetObject:
+            # Rolled back to pending, which nothing would ever clean up along with the object
+            self.filter(pk=cloudfile.pk).update(status=FileStatus.FAILED)
+            cloudfile.status = FileStatus.FAILED
+            self._delete_uploaded(resp)
+            raise
+
+        return cloudfile
+
+    def _release_connection(self):
+        """
+        Closes the database connection unless the caller wraps us in a transaction, in which
+        case the connection can't be given back anyway. Django reconnects on the next query.
+        """
+        connection = connections[self.db]
+        if not connection.in_atomic_block:
+            connection.close()
+
     @classmethod
     def _parse_target(cls, target):
-        app_label, model, field = target.lower().split('.')
+        target = get_target(target)
 
-        content_type = ContentType.objects.get_by_natural_key(app_label, model)
-
-        return content_type, field
+        return target.content_type, target.field.name
 
     @classmethod
     def _contenttype_upload_dir(cls, contenttype, field=''):
         return '%s__%s__%s'.rstrip('_') % (contenttype.app_label, contenttype.model, field)
 
-    @classmethod
-    def _get_file_name(cls, f, use_filename):
-        if isinstance(f, str):
-            filename = helper.path_leaf(f)
-        else:
-            filename = f.name
-
-        if use_filename is False:
-            filename = '%s_%s' % (get_random_string(5), filename)
 
-        # Slugify only file name without extension
-        filename_, ext = os.path.splitext(filename)
-        filename_ = slugify(filename_)
-        ext = ''.join(Path(filename).suffixes)
+class StorageProviderManager(Manager, StorageProviderManagerMixin):
+    def __init__(self, storage=None):
+        super().__init__()
+        if storage is not None:
+            self.storage = storage
 
-        return '%s%s' % (filename_, ext)
 
+class S3FileManager(StorageProviderManager):
+    storage = StorageProvider.S3
 
-class S3FileManager(Manager, StorageProviderManagerMixin):
     @staticmethod
     def boto_s3():
         """
@@ -110,46 +532,93 @@ class S3FileManager(Manager, StorageProviderManagerMixin):
 
         return django_boto.s3
 
-    @classmethod
-    def upload(cls, f, directory, use_filename=False):
-        filename = cls._get_file_name(f, use_filename)
+    @staticmethod
+    def boto_s3_storage():
+        """
+        :return django_boto.s3.storage.S3Storage: Long lived storage of the current thread,
+            configured from django_boto settings
+        """
+        return clients.s3_storage()
 
-        try:
-            url = cls.boto_s3().upload(f, name=filename, prefix=directory)
-            resp = {'prefix': directory, 'name': filename, 'storage': StorageProvider.S3}
-            return url, resp
-        except Exception as e:
-            raise UploadError from e
 
+class CloudinaryFileManager(StorageProviderManager):
+    storage = StorageProvider.CLOUDINARY
 
-class CloudinaryFileManager(Manager, StorageProviderManagerMixin):
-    @classmethod
-    def upload(cls, f, directory, use_filename=True):
-        assert settings.CLOUDINARY_BASE_PATH is not None, 'Define Cloudinary base path'
 
-        path = '%s/%s' % (settings.CLOUDINARY_BASE_PATH, directory)
-        try:
-            response = cloudinary.uploader.upload(f, folder=path, use_filename=True,
-                                                  invalidate=True, resource_type='auto')
-            response['storage'] = StorageProvider.CLOUDINARY
-        except Error as e:
-            raise UploadError from e
+class CloudFileManager(Manager):
+    def create_and_upload(self, f, **kwargs):
+        storage = kwargs.pop('storage')
 
-        return response['secure_url'], response
+        return self._storage_manager(storage).create_and_upload(f, **kwargs)
 
+    def bulk_create_and_upload(self, files, **kwargs):
+        storage = kwargs.pop('storage')
 
-class CloudFileManager(Manager):
-    def create_and_upload(self, f, **kwargs):
+        return self._storage_manager(storage).bulk_create_and_upload(files, **kwargs)
+
+    def create_pending(self, f, **kwargs):
         storage = kwargs.pop('storage')
 
-        if storage == StorageProvider.CLOUDINARY:
-            manager = self.model.cloudinary
-        elif storage == StorageProvider.S3:
-            manager = self.model.s3
-        else:
-            raise Exception
+        return self._storage_manager(storage).create_pending(f, **kwargs)
+
+    def upload_pending(self, cloudfile):
+        return self._storage_manager(cloudfile.storage_provider).upload_pending(cloudfile)
+
+    def direct_upload_ticket(self, filename, **kwargs):
+        """
+        :param str filename:
+        :param kwargs: Same as `prepare_direct_upload()` plus `storage`
+        :return dict: Signed `ticket` for `complete_direct_upload()`, the `url` and form
+            `fields` to post the file with
+        """
+        storage = kwargs.pop('storage')
+        job, url, fields = self._storage_manager(storage).prepare_direct_upload(filename,
+                                                                                **kwargs)
+
+        return {'ticket': signing.dumps(job, salt=DIRECT_UPLOAD_SALT), 'url': url,
+                'fields': fields}
+
+    def complete_direct_upload(self, ticket, client_resp=None):
+        """
+        :param str ticket: Ticket issued by `direct_upload_ticket()`
+        :param dict client_resp: Response the provider gave the client
+        :return CloudFile:
+        """
+        # The client gets as long to complete as it had to upload
+        max_age = getattr(settings, 'CLOUDSTORAGE_DIRECT_UPLOAD_EXPIRES_IN', 3600) * 2
+        try:
+            job = signing.loads(ticket, salt=DIRECT_UPLOAD_SALT, max_age=max_age)
+        except signing.BadSignature:
+            raise CloudFileError(_('Upload ticket is invalid or expired.'))
+
+        return self._storage_manager(job['storage']).complete_direct_upload(job, client_resp)
 
-        return manager.create_and_upload(f, **kwargs)
+    def delete_remote(self, upload_resps):
+        """
+        :param list upload_resps: upload_resp of uploaded files of any storage
+        :return int: Number of deleted objects
+        """
+        by_storage = defaultdict(list)
+        for resp in upload_resps:
+            by_storage[resp['storage']].append(resp)
+
+        return sum(resilience.call(storage, get_backend(storage).delete_many, resps,
+                                   idempotent=True)
+                   for storage, resps in by_storage.items())
+
+    def _storage_manager(self, storage):
+        """
+        :param str storage: Name of a storage backend
+        :return StorageProviderManager: Manager creating files of the backend
+        :raise InvalidStorage: If no backend is registered under `storage`
+        """
+        get_backend(storage)
+
+        manager = StorageProviderManager(storage)
+        manager.model = self.model
+        manager._db = self._db
+
+        return manager
 
     def filter_by_target(self, target):
         content_type, field = StorageProviderManagerMixin._parse_target(target)
@@ -164,7 +633,7 @@ class AbstractCloudFile(Model):
     name = models.CharField(max_length=50, default='', blank=True)
     #: File url
     url = models.URLField()
-    #: response received from uploading service
+    #: response received from uploading service, trimmed to the resp_keys of its backend
     upload_resp = pg_fields.JSONField(blank=True, editable=False, null=True)
     #: Target model name
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, blank=True)
@@ -172,6 +641,15 @@ class AbstractCloudFile(Model):
     content_field = models.CharField(max_length=50, blank=True, null=True)
     #: Target object pk
     object_id = models.CharField(max_length=10, null=True)
+    #: Precomputed `extra`, e.g. derived Cloudinary urls
+    extra_data = pg_fields.JSONField(blank=True, editable=False, null=True)
+    #: SHA-256 of the content, set when settings.CLOUDSTORAGE_DEDUPLICATE is enabled. Rows
+    # sharing it with the same storage share the provider object.
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False,
+                                    db_index=True)
+    #: Upload state; rows stay pending until the provider upload is stored
+    status = models.CharField(max_length=10, choices=[(s, s) for s in FILE_STATUSES],
+                              default=FileStatus.UPLOADED)
 
     content_object = GenericForeignKey('content_type', 'object_id')
 
@@ -189,74 +667,218 @@ class AbstractCloudFile(Model):
     def storage_provider(self):
         return self.upload_resp['storage']
 
+    @property
+    def backend(self):
+        """
+        :return StorageBackend: Backend the file is stored with
+        """
+        return get_backend(self.storage_provider)
+
     @property
     def extra(self):
-        if self.storage_provider == StorageProvider.CLOUDINARY:
-            return self._cloudinary_extra
+        if self.extra_data is None:
+            # Files uploaded before extra_data was stored
+            if '_extra' not in self.__dict__:
+                self._extra = self.build_extra()
+            return self._extra
+
+        return self.extra_data
+
+    def save(self, *args, **kwargs):
+        if self.extra_data is None and self.status == FileStatus.UPLOADED and self.upload_resp:
+            self.extra_data = self.build_extra()
+
+        super().save(*args, **kwargs)
+
+    def build_extra(self):
+        """
+        :return dict: Provider specific metadata such as derived urls of Cloudinary images
+        """
+        if self.status != FileStatus.UPLOADED or not self.upload_resp:
+            return {}
 
-        return {}
+        return self.backend.build_extra(self)
+
+    @property
+    def target(self):
+        """
+        :return CloudFileTarget: Target the file was uploaded for
+        """
+        content_type = ContentType.objects.get_for_id(self.content_type_id)
+
+        return get_target('%s.%s.%s' % (content_type.app_label, content_type.model,
+                                        self.content_field))
 
     def link_to_target(self):
         """
-        Sets foreign key or add to the object located by content_type, object_id and content_field
+        Sets foreign key or add to the object located by content_type, object_id and content_field.
+        The object is neither fetched nor saved, see `_link()`.
 
-        :return Model: Object that is linked
+        :raise InvalidTargetObject: If the object does not exist
         """
 
         assert self.object_id is not None
 
-        model_cls = self.content_type.model_class()
-        field = model_cls._meta.get_field(self.content_field)
-        has_many_files = issubclass(field.__class__, models.ManyToManyField)
-        has_one_file = issubclass(field.__class__, models.ForeignKey)
-        obj = model_cls.objects.get(pk=self.object_id)
+        model_cls = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        self._link(model_cls, self.content_field, self.object_id, [self])
 
-        if has_many_files:
-            getattr(obj, self.content_field).add(self)
-        elif has_one_file:
-            setattr(obj, self.content_field, self)
-            obj.save(update_fields=[self.content_field])
-        else:
-            raise NotImplementedError
+    @property
+    def shares_remote_object(self):
+        """
+        :return bool: True when other rows reference the same provider object, in which case
+            it must outlive this row
+        """
+        if self.content_hash is None:
+            return False
 
-        return obj
+        return type(self).objects.filter(
+            content_hash=self.content_hash, upload_resp__storage=self.storage_provider
+        ).exclude(pk=self.pk).exists()
+
+    def delete_remote(self):
+        """
+        Deletes the provider object unless other rows still reference it
+
+        :return bool: True if the object was deleted
+        """
+        if self.status != FileStatus.UPLOADED or self.shares_remote_object:
+            return False
+
+        type(self).objects.delete_remote([self.upload_resp])
+        return True
+
+    @classmethod
+    def link_all_to_target(cls, cloudfiles):
+        """
+        Links cloud files sharing content_type, object_id and content_field at once. Many to
+        many fields get all of them in a single query, foreign keys the last one.
+
+        :param list cloudfiles:
+        :raise InvalidTargetObject: If the object does not exist
+        """
+        cloudfile = cloudfiles[-1]
+
+        assert cloudfile.object_id is not None
+
+        model_cls = ContentType.objects.get_for_id(cloudfile.content_type_id).model_class()
+        cls._link(model_cls, cloudfile.content_field, cloudfile.object_id, cloudfiles)
+
+    @classmethod
+    def _link(cls, model_cls, field_name, object_id, cloudfiles):
+        """
+        Links with a single statement whose row count tells whether the object exists: an
+        UPDATE of the foreign key, or an INSERT of the many to many rows that selects nothing
+        when the object is missing. Neither save() of the object nor m2m_changed is called.
+        """
+        field = model_cls._meta.get_field(field_name)
+        try:
+            pk = model_cls._meta.pk.to_python(object_id)
+        except ValidationError:
+            pk = None
+
+        with metrics.timed('link'):
+            if pk is None:
+                linked = 0
+            elif issubclass(field.__class__, models.ManyToManyField):
+                linked = cls._insert_through_rows(model_cls, field, pk,
+                                                  [cloudfile.pk for cloudfile in cloudfiles])
+                # Nothing is inserted either when every file is linked already
+                if linked == 0 and model_cls._base_manager.filter(pk=pk).exists():
+                    return
+            elif issubclass(field.__class__, models.ForeignKey):
+                linked = model_cls._base_manager.filter(pk=pk) \
+                    .update(**{field.attname: cloudfiles[-1].pk})
+            else:
+                raise NotImplementedError
+
+        if linked == 0:
+            raise InvalidTargetObject(_(
+                "Object id '%s' with provided target does not exist." % object_id
+            ))
+
+    @classmethod
+    def _insert_through_rows(cls, model_cls, field, object_id, cloudfile_pks):
+        """
+        :return int: Number of inserted rows
+        """
+        through = field.remote_field.through
+        connection = connections[router.db_for_write(through)]
+        qn = connection.ops.quote_name
+
+        sql = (
+            'INSERT INTO {through} ({source}, {target}) '
+            'SELECT %s, {pk} FROM {table} WHERE {pk} IN ({pks}) '
+            'AND EXISTS (SELECT 1 FROM {model_table} WHERE {model_pk} = %s) '
+            'ON CONFLICT DO NOTHING'
+        ).format(
+            through=qn(through._meta.db_table),
+            source=qn(through._meta.get_field(field.m2m_field_name()).column),
+            target=qn(through._meta.get_field(field.m2m_reverse_field_name()).column),
+            pk=qn(cls._meta.pk.column),
+            table=qn(cls._meta.db_table),
+            pks=', '.join(['%s'] * len(cloudfile_pks)),
+            model_table=qn(model_cls._meta.db_table),
+            model_pk=qn(model_cls._meta.pk.column),
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [object_id, *cloudfile_pks, object_id])
+            return cursor.rowcount
 
     def download(self):
         """
-        :return TemporaryFile:
+        :return file: Readable file with the content
         """
-        if self.upload_resp['storage'] == 's3':
-            return S3FileManager.boto_s3().download(self.upload_resp['name'],
-                                                    self.upload_resp['prefix'])
+        return resilience.call(self.storage_provider, self.backend.open, self, idempotent=True)
 
-        raise NotImplementedError
+    @property
+    def download_url(self):
+        """
+        :return str: Url the content is fetched from, signed if private
+        """
+        return self.backend.download_url(self)
 
     @property
-    def signed_url(self):
+    def etag(self):
         """
-        :return presigned URL which get expire after settings.S3_SIGNED_URL_EXPIRES_IN seconds.
+        :return str: ETag of the provider object if known without asking the provider
         """
-        if self.upload_resp['storage'] == 's3':
-            return S3FileManager.boto_s3().get_url(self.upload_resp['name'],
-                                                   self.upload_resp['prefix'],
-                                                   expires=settings.S3_SIGNED_URL_EXPIRES_IN,
-                                                   query_auth=True)
+        etag = self.upload_resp.get('etag') if self.upload_resp else None
 
-        return ''
+        return '"%s"' % etag.strip('"') if etag else None
 
     @property
-    def _cloudinary_extra(self):
-        cloudinary_cls = CloudinaryHelper(self.upload_resp)
-
-        return {
-            'thumbnail': cloudinary_cls.edit('c_scale,h_50'),
-            'small': cloudinary_cls.edit('c_scale,h_250'),
-            'public_id': self.upload_resp.get('public_id'),
-            'resource_type': self.upload_resp.get('resource_type'),
-            'file_name': cloudinary_cls.file_name,
-            'file_name_short': helper.shorten_str(cloudinary_cls.file_name,
-                                                  append='.%s' % cloudinary_cls.format)
-        }
+    def signed_url(self):
+        """
+        :return presigned URL which get expire after settings.S3_SIGNED_URL_EXPIRES_IN seconds,
+            empty for backends that do not sign urls.
+        """
+        if '_signed_url' not in self.__dict__:
+            self.prefetch_signed_urls([self])
+
+        return self._signed_url
+
+    @classmethod
+    def prefetch_signed_urls(cls, cloudfiles):
+        """
+        Signs the urls of many files in one pass per backend, `signed_url` then returns them
+        right away
+
+        :param list cloudfiles:
+        """
+        by_storage = defaultdict(list)
+        for cloudfile in cloudfiles:
+            cloudfile._signed_url = ''
+            if cloudfile.status == FileStatus.UPLOADED and cloudfile.upload_resp:
+                by_storage[cloudfile.storage_provider].append(cloudfile)
+
+        for storage, storage_files in by_storage.items():
+            with metrics.signing(storage) as signed:
+                urls = get_backend(storage).sign_many(storage_files)
+                # Backends that do not sign return empty urls
+                signed['count'] = sum(1 for url in urls if url)
+            for cloudfile, url in zip(storage_files, urls):
+                cloudfile._signed_url = url
 
 
 class CloudFile(AbstractCloudFile):
@@ -266,3 +888,138 @@ class CloudFile(AbstractCloudFile):
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, default=None, blank=True, editable=False,
                               null=True, on_delete=models.SET_NULL)
+
+    class Meta(AbstractCloudFile.Meta):
+        indexes = [
+            # Uploaded files of a target or of one of its objects, in the order they are listed
+            models.Index(fields=['content_type', 'content_field', 'object_id', 'created_at', 'id'],
+                         condition=Q(status=FileStatus.UPLOADED),
+                         name='cloudstorage_target_obj_idx'),
+            models.Index(fields=['content_type', 'content_field', 'created_at', 'id'],
+                         condition=Q(status=FileStatus.UPLOADED),
+                         name='cloudstorage_target_idx'),
+            # Files of an owner, newest first
+            models.Index(fields=['owner', 'created_at'], name='cloudstorage_owner_idx'),
+            # Rows waiting for the cloudstorage_worker command, a small part of the table
+            models.Index(fields=['id'], condition=Q(status=FileStatus.PENDING),
+                         name='cloudstorage_pending_idx'),
+            # Completion of direct uploads checks the url is new
+            models.Index(fields=['url'], name='cloudstorage_url_idx'),
+        ]
+
+
+class CloudFileRawResponse(Model):
+    """
+    Complete upload response of the provider, stored when settings.CLOUDSTORAGE_STORE_RAW_RESPONSE
+    is enabled. It lives in its own table so that cloudstorage_file rows stay small.
+    """
+    cloudfile = models.OneToOneField(CloudFile, primary_key=True, on_delete=models.CASCADE,
+                                     related_name='raw_response')
+    data = pg_fields.JSONField()
+
+    class Meta:
+        db_table = 'cloudstorage_file_raw_response'
+        default_permissions = ()
+
+
+class UploadSessionManager(Manager):
+    def start(self, **kwargs):
+        """
+        :param kwargs: UploadSession fields
+        :return UploadSession: Session with an empty spool file
+        """
+        kwargs['spool_path'] = helper.spool_path(kwargs['filename'],
+                                                 getattr(settings, 'CLOUDSTORAGE_SPOOL_DIR', None))
+        open(kwargs['spool_path'], 'wb').close()
+
+        return self.create(**kwargs)
+
+    def active(self):
+        return self.filter(updated_at__gte=self._expiry_cutoff())
+
+    def expired(self):
+        return self.filter(updated_at__lt=self._expiry_cutoff())
+
+    @staticmethod
+    def _expiry_cutoff():
+        ttl = getattr(settings, 'CLOUDSTORAGE_UPLOAD_SESSION_TTL', 24 * 3600)
+
+        return timezone.now() - timedelta(seconds=ttl)
+
+
+class UploadSession(Model):
+    """
+    Resumable upload. Chunks are appended to a spool file until `size` bytes are received, then
+    the cloud file is created from it.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    #: Total size in bytes
+    size = models.BigIntegerField()
+    #: Bytes received so far, a client resumes from here
+    offset = models.BigIntegerField(default=0)
+    spool_path = models.CharField(max_length=500, editable=False)
+    #: Cloud file fields
+    target = models.CharField(max_length=500)
+    storage = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=10, null=True, blank=True)
+    name = models.CharField(max_length=50, default='', blank=True)
+    link_target = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    #: Sessions not written to for settings.CLOUDSTORAGE_UPLOAD_SESSION_TTL seconds expire
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = UploadSessionManager()
+
+    class Meta:
+        db_table = 'cloudstorage_upload_session'
+        default_permissions = ()
+
+    @property
+    def complete(self):
+        return self.offset >= self.size
+
+    def write_chunk(self, start, chunks):
+        """
+        Writes a chunk at `start`, which must be the current offset. The chunk is received into
+        a part file of its own outside of any transaction, then copied into the spool file while
+        the row is locked, so of concurrent requests for the same range only the first is kept
+        and no lock is held while a slow client sends its bytes. Bytes received before the
+        client goes away are kept, so it resumes right after them.
+
+        :param int start: Offset of the chunk
+        :param iterable chunks: Pieces of the chunk, at most `size - start` bytes in total
+        :return bool: False if another request moved the offset in the meantime
+        """
+        part_path = os.path.join(os.path.dirname(self.spool_path), '.part-%s' % uuid.uuid4().hex)
+        error = None
+        with open(part_path, 'wb') as part:
+            try:
+                for chunk in chunks:
+                    part.write(chunk)
+            except Exception as exc:
+                # Raised once the bytes received are kept
+                error = exc
+
+        try:
+            with transaction.atomic():
+                if not type(self).objects.select_for_update().filter(pk=self.pk, offset=start) \
+                        .exists():
+                    return False
+
+                with open(part_path, 'rb') as part, open(self.spool_path, 'r+b') as fp:
+                    fp.seek(start)
+                    shutil.copyfileobj(part, fp)
+                    fp.truncate()
+                    written = fp.tell() - start
+
+                type(self).objects.filter(pk=self.pk) \
+                    .update(offset=start + written, updated_at=timezone.now())
+                self.offset = start + written
+        finally:
+            os.remove(part_path)
+
+        if error is not None:
+            raise error
+
+        return True
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from boto.s3.multipart import MultiPartUpload
+
+L = logging.getLogger(__name__)
+
+#: S3 rejects parts smaller than this, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3MultipartUploader:
+    """
+    Uploads a file to S3 in parts from a bounded thread pool. Every thread talks to S3 through a
+    bucket of its own since boto connections are not thread safe. At most `concurrency` parts
+    are held in memory at a time.
+    """
+
+    def __init__(self, bucket_factory, chunk_size, concurrency=4, max_retries=3,
+                 retry_backoff=0.5, policy=None):
+        """
+        :param callable bucket_factory: Returns a new `boto.s3.bucket.Bucket`
+        :param int chunk_size: Part size in bytes
+        :param int concurrency: Number of parts uploaded at the same time
+        :param int max_retries: Number of times a failed part is retried
+        :param float retry_backoff: Seconds to wait before the first retry, doubled every retry
+        :param str policy: Canned ACL of the uploaded key
+        """
+        self.bucket_factory = bucket_factory
+        self.chunk_size = max(chunk_size, MIN_PART_SIZE)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.policy = policy
+
+        self._local = threading.local()
+        self._read_lock = threading.Lock()
+
+    def upload(self, fp, key_name, size):
+        """
+        :param file fp: Seekable file to be uploaded
+        :param str key_name: Full key name in the bucket
+        :param int size: File size in bytes
+        :return list: ETags of the uploaded parts
+        """
+        mp = self._bucket.initiate_multipart_upload(key_name, policy=self.policy)
+        part_count = max(1, -(-size // self.chunk_size))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency,
+                                    thread_name_prefix='cloudstorage-s3-part') as executor:
+                futures = [executor.submit(self._upload_part, fp, mp.key_name, mp.id, part_num)
+                           for part_num in range(1, part_count + 1)]
+                try:
+                    etags = [future.result() for future in futures]
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            self._bucket.complete_multipart_upload(mp.key_name, mp.id, self._to_xml(etags))
+        except Exception:
+            L.warning('Aborting multipart upload %s of %s', mp.id, key_name)
+            self._bucket.cancel_multipart_upload(mp.key_name, mp.id)
+            raise
+
+        return etags
+
+    @property
+    def _bucket(self):
+        if getattr(self._local, 'bucket', None) is None:
+            self._local.bucket = self.bucket_factory()
+
+        return self._local.bucket
+
+    def _upload_part(self, fp, key_name, upload_id, part_num):
+        with self._read_lock:
+            fp.seek((part_num - 1) * self.chunk_size)
+            part = BytesIO(fp.read(self.chunk_size))
+
+        attempt = 0
+        while True:
+            mp = MultiPartUpload(self._bucket)
+            mp.key_name = key_name
+            mp.id = upload_id
+
+            try:
+                part.seek(0)
+                return mp.upload_part_from_file(part, part_num).etag
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+
+                L.warning('Retrying part %s of multipart upload %s', part_num, upload_id,
+                          exc_info=True)
+                time.sleep(self.retry_backoff * 2 ** attempt)
+                attempt += 1
+                # Start over with a fresh connection
+                self._local.bucket = None
+
+    @staticmethod
+    def _to_xml(etags):
+        parts = ''.join('<Part><PartNumber>%d</PartNumber><ETag>%s</ETag></Part>' %
+                        (part_num, escape(etag)) for part_num, etag in enumerate(etags, 1))
+
+        return '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % parts
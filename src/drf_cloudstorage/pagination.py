@@ -0,0 +1,99 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages newest first by (created_at, id). The cursor holds the key of the last row of a page
+    and the next page starts below it, so every page is read straight from an index ending with
+    (created_at, id), however deep.
+
+    The page size is settings.CLOUDSTORAGE_LIST_PAGE_SIZE, clients may ask for up to
+    settings.CLOUDSTORAGE_LIST_MAX_PAGE_SIZE rows with the `page_size` query parameter.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        key = self.decode_cursor(request)
+        if key is not None:
+            created_at, pk = key
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(id__lt=pk),
+                                       created_at__lte=created_at)
+
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        self.next_key = (rows[page_size - 1].created_at, rows[page_size - 1].pk) \
+            if len(rows) > page_size else None
+
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'CLOUDSTORAGE_LIST_PAGE_SIZE', 100)
+        max_page_size = getattr(settings, 'CLOUDSTORAGE_LIST_MAX_PAGE_SIZE', 1000)
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, page_size))
+        except ValueError:
+            pass
+
+        return min(max(page_size, 1), max_page_size)
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(*self.next_key))
+
+    @staticmethod
+    def encode_cursor(created_at, pk):
+        """
+        :return str: Opaque cursor of the key
+        """
+        key = '%s|%s' % (created_at.isoformat(), pk)
+
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, request):
+        """
+        :return tuple: (created_at, id) of the row the page starts below, None on the first page
+        :raise NotFound: If the cursor is invalid
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return created_at, pk
@@ -0,0 +1,153 @@
+"""
+Retries and circuit breakers around storage backend calls, so a provider brownout fails requests
+fast instead of tying up every worker. Attempts are bounded by the socket timeouts of
+`clients`; retries are only made for idempotent operations.
+"""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import Http404
+from django.utils.translation import ugettext_lazy as _
+
+from .errors import CloudFileError, ProviderUnavailable
+
+L = logging.getLogger(__name__)
+
+#: Errors of the client rather than the provider, they neither trip breakers nor get retried
+CLIENT_ERRORS = (CloudFileError, Http404)
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and refuses calls for `reset_timeout`
+    seconds. A single trial call is let through then, closing the breaker again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """
+        :return bool: False if the call must not be made
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+def get_circuit_breaker(name):
+    """
+    :param str name: Name of the storage backend
+    :return CircuitBreaker: Breaker of the backend in this process, configured by
+        settings.CLOUDSTORAGE_CIRCUIT_BREAKER_THRESHOLD and
+        settings.CLOUDSTORAGE_CIRCUIT_BREAKER_RESET_TIMEOUT
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(
+                failure_threshold=getattr(settings, 'CLOUDSTORAGE_CIRCUIT_BREAKER_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'CLOUDSTORAGE_CIRCUIT_BREAKER_RESET_TIMEOUT', 30),
+            ))
+
+    return breaker
+
+
+def call(name, func, *args, idempotent=False, **kwargs):
+    """
+    Calls `func` through the circuit breaker of backend `name`. Idempotent calls are retried up
+    to settings.CLOUDSTORAGE_RETRY_ATTEMPTS times with jittered exponential backoff, as long as
+    settings.CLOUDSTORAGE_RETRY_DEADLINE seconds are not over.
+
+    :param str name: Name of the storage backend
+    :param callable func: Backend operation
+    :param bool idempotent: Whether `func` can safely be called again after a failure
+    :return: Result of `func`
+    :raise ProviderUnavailable: If the breaker is open
+    """
+    breaker = get_circuit_breaker(name)
+    attempts = getattr(settings, 'CLOUDSTORAGE_RETRY_ATTEMPTS', 3) if idempotent else 1
+    deadline = time.monotonic() + getattr(settings, 'CLOUDSTORAGE_RETRY_DEADLINE', 10)
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            raise ProviderUnavailable(_("Storage '%s' is unavailable, try again later." % name))
+
+        try:
+            result = func(*args, **kwargs)
+        except CLIENT_ERRORS:
+            breaker.record_success()
+            raise
+        except Exception:
+            delay = backoff(attempt)
+            if attempt + 1 == attempts or time.monotonic() + delay >= deadline:
+                # A call fails once, however many attempts it took
+                breaker.record_failure()
+                raise
+            L.warning('Retrying %s of storage %s in %.2fs', func.__name__, name, delay,
+                      exc_info=True)
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def backoff(attempt):
+    """
+    :param int attempt: Number of the failed attempt, from 0
+    :return float: Seconds to wait, "full jitter" of settings.CLOUDSTORAGE_RETRY_BASE_DELAY
+        doubled per attempt up to settings.CLOUDSTORAGE_RETRY_MAX_DELAY
+    """
+    ceiling = min(getattr(settings, 'CLOUDSTORAGE_RETRY_MAX_DELAY', 2),
+                  getattr(settings, 'CLOUDSTORAGE_RETRY_BASE_DELAY', 0.2) * 2 ** attempt)
+
+    return random.uniform(0, ceiling)
+
+
+def failover_backend(name):
+    """
+    :param str name: Name of the storage backend
+    :return str: Backend uploads go to when `name` fails, see settings.CLOUDSTORAGE_FAILOVER
+    """
+    return getattr(settings, 'CLOUDSTORAGE_FAILOVER', {}).get(name)
+
+
+@receiver(setting_changed)
+def _reset_breakers(setting, **kwargs):
+    if setting.startswith('CLOUDSTORAGE_'):
+        _breakers.clear()
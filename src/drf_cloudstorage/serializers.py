@@ -2,100 +2,292 @@ import mimetypes
 
 import humanfriendly
 from django.conf import settings
-from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Manager
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 
-from drf_cloudstorage.constants import PROVIDERS
-from drf_cloudstorage.errors import CloudFileError
-from drf_cloudstorage.models import CloudFile, StorageProviderManagerMixin
+from drf_cloudstorage.backends import backend_names
+from drf_cloudstorage.errors import CloudFileError, InvalidTarget
+from drf_cloudstorage.mime import detect_mime_type
+from drf_cloudstorage.models import CloudFile, UploadSession
+from drf_cloudstorage.targets import get_target
+from drf_cloudstorage.workers import get_upload_worker
 
 
-class CloudFileSerializer(ModelSerializer):
-    file = serializers.FileField(required=True, write_only=True)
-    target = serializers.CharField(required=True, write_only=True, max_length=500)
-    extra = serializers.DictField(read_only=True)
-    storage = serializers.ChoiceField(choices=PROVIDERS, write_only=True,
-                                      default=getattr(settings, 'CLOUDSTORAGE_DEFAULT_PROVIDER',
-                                                      None))
-    link_target = serializers.BooleanField(write_only=True, default=True)
-    signed_url = serializers.ReadOnlyField()
+class StorageField(serializers.ChoiceField):
+    """
+    Name of one of the configured storage backends
+    """
 
-    class Meta:
-        model = CloudFile
-        read_only_fields = ('url', 'owner')
-        owner_field = 'owner'
-        exclude = ('upload_resp',)
+    def __init__(self, **kwargs):
+        super().__init__(choices=backend_names(), **kwargs)
 
+
+class CloudFileValidationMixin:
     def validate_storage(self, value):
         if not value:
             raise ValidationError(_('This field is required.'))
         return value
 
     def validate_target(self, value):
-        content_type, field = StorageProviderManagerMixin._parse_target(value)
-        model_cls = content_type.model_class()
         try:
-            field_cls = model_cls._meta.get_field(field)
-        except FieldDoesNotExist as e:
-            raise ValidationError(e.args[0])
+            return get_target(value)
+        except InvalidTarget as e:
+            raise ValidationError(e.detail)
 
-        return value, field_cls, model_cls
+    def _validate_mime_type(self, target, file):
+        if target.allowed_mime_types is None:
+            return
 
-    def validate(self, attrs):
-        attrs = super().validate(attrs)
-        file = attrs.get('file')
-        target_str, field_cls, model_cls = attrs.pop('target')
-        attrs['target'] = target_str
-
-        self._validate_mime_type(field_cls, file)
-        self._validate_file_size(field_cls, file)
-        try:
-            self._validate_target_object(model_cls, attrs['object_id'])
-        except KeyError:
-            pass
+        if getattr(settings, 'CLOUDSTORAGE_SNIFF_MIME_TYPES', False) is True:
+            mt = detect_mime_type(file)
+        else:
+            mt, encoding = mimetypes.guess_type(file.name)
 
-        return attrs
-
-    def _validate_mime_type(self, remote_field_model_cls, file):
-        mt, encoding = mimetypes.guess_type(file.name)
-        allowed_mt = getattr(remote_field_model_cls, 'allowed_mime_types', None)
+        self._check_mime_type(target, mt)
 
+    def _check_mime_type(self, target, mt):
+        allowed_mt = target.allowed_mime_types
         if allowed_mt is not None and mt not in allowed_mt:
-            raise CloudFileError(_('Only %s file types are allowed' % ', '.join(allowed_mt)))
+            raise CloudFileError(_('Only %s file types are allowed' %
+                                   ', '.join(sorted(allowed_mt))), code='mime_type')
+
+    def _validate_file_size(self, target, file):
+        self._check_file_size(target, file.size)
 
-    def _validate_file_size(self, remote_field_model_cls, file):
-        min_size = remote_field_model_cls.min_file_size
-        max_size = remote_field_model_cls.max_file_size
+    def _check_file_size(self, target, size):
+        min_size = target.min_file_size
+        max_size = target.max_file_size
 
-        if file.size > max_size or file.size < min_size:
+        if size > max_size or size < min_size:
             raise CloudFileError(_(
                 'File size must be between %s and %s' %
                 (humanfriendly.format_size(min_size), humanfriendly.format_size(max_size))
-            ))
+            ), code='file_size')
 
     def _validate_target_object(self, model_cls, object_id):
         if model_cls.objects.filter(id=object_id).exists() is False:
             raise ValidationError(_(
                 "Object id '%s' with provided target does not exist." % object_id
-            ))
+            ), code='target_object')
+
+
+class CloudFileSerializer(CloudFileValidationMixin, ModelSerializer):
+    file = serializers.FileField(required=True, write_only=True)
+    target = serializers.CharField(required=True, write_only=True, max_length=500)
+    extra = serializers.DictField(read_only=True)
+    storage = StorageField(write_only=True,
+                           default=getattr(settings, 'CLOUDSTORAGE_DEFAULT_PROVIDER', None))
+    link_target = serializers.BooleanField(write_only=True, default=True)
+    signed_url = serializers.ReadOnlyField()
+
+    class Meta:
+        model = CloudFile
+        read_only_fields = ('url', 'owner')
+        owner_field = 'owner'
+        exclude = ('upload_resp',)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        file = attrs.get('file')
+        target = attrs['target']
+        attrs['target'] = target.name
+
+        self._validate_mime_type(target, file)
+        self._validate_file_size(target, file)
+
+        # Files linked right away find out whether the object exists from the link itself
+        links_on_create = attrs['link_target'] and \
+            getattr(settings, 'CLOUDSTORAGE_ASYNC_UPLOAD', False) is not True
+        if 'object_id' in attrs and not links_on_create:
+            self._validate_target_object(target.model, attrs['object_id'])
+
+        return attrs
 
     def create(self, validated_data):
         f = validated_data.pop('file', None)
+
+        if getattr(settings, 'CLOUDSTORAGE_ASYNC_UPLOAD', False) is True:
+            cloudfile = CloudFile.objects.create_pending(f, **validated_data)
+            get_upload_worker().submit(cloudfile)
+            return cloudfile
+
         return CloudFile.objects.create_and_upload(f, **validated_data)
 
 
+class CloudFileBulkSerializer(CloudFileValidationMixin, serializers.Serializer):
+    """
+    Uploads many files for a single target. The files are validated up front and uploaded
+    concurrently; `save()` returns a CloudFile or an error per file.
+    """
+    files = serializers.ListField(
+        child=serializers.FileField(), allow_empty=False, write_only=True,
+        max_length=getattr(settings, 'CLOUDSTORAGE_BULK_UPLOAD_MAX_FILES', 100)
+    )
+    target = serializers.CharField(required=True, write_only=True, max_length=500)
+    object_id = serializers.CharField(required=False, max_length=10)
+    name = serializers.CharField(required=False, max_length=50)
+    storage = StorageField(write_only=True,
+                           default=getattr(settings, 'CLOUDSTORAGE_DEFAULT_PROVIDER', None))
+    link_target = serializers.BooleanField(write_only=True, default=True)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        target = attrs['target']
+        attrs['target'] = target.name
+
+        errors = {}
+        for i, file in enumerate(attrs['files']):
+            try:
+                self._validate_mime_type(target, file)
+                self._validate_file_size(target, file)
+            except CloudFileError as e:
+                errors[i] = [e.detail]
+        if errors:
+            raise ValidationError({'files': errors})
+
+        if 'object_id' in attrs:
+            self._validate_target_object(target.model, attrs['object_id'])
+
+            if attrs['link_target'] and len(attrs['files']) > 1 and not target.many:
+                raise ValidationError({'files': _('Only one file can be linked to this target.')})
+
+        return attrs
+
+    def create(self, validated_data):
+        files = validated_data.pop('files')
+
+        return CloudFile.objects.bulk_create_and_upload(files, **validated_data)
+
+
+class DirectUploadTicketSerializer(CloudFileValidationMixin, serializers.Serializer):
+    """
+    Issues a ticket to upload a file straight to the provider. The declared mime type and
+    size are checked here and enforced by the provider where it can.
+    """
+    filename = serializers.CharField(required=True, write_only=True, max_length=255)
+    mime_type = serializers.CharField(required=False, write_only=True, max_length=255)
+    size = serializers.IntegerField(required=False, write_only=True, min_value=0)
+    target = serializers.CharField(required=True, write_only=True, max_length=500)
+    object_id = serializers.CharField(required=False, max_length=10)
+    name = serializers.CharField(required=False, max_length=50)
+    storage = StorageField(write_only=True,
+                           default=getattr(settings, 'CLOUDSTORAGE_DEFAULT_PROVIDER', None))
+    link_target = serializers.BooleanField(write_only=True, default=True)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        target = attrs['target']
+        attrs['target'] = target.name
+
+        if target.allowed_mime_types is not None:
+            if 'mime_type' not in attrs:
+                attrs['mime_type'], encoding = mimetypes.guess_type(attrs['filename'])
+            self._check_mime_type(target, attrs['mime_type'])
+
+        if 'size' in attrs:
+            self._check_file_size(target, attrs.pop('size'))
+
+        if 'object_id' in attrs:
+            self._validate_target_object(target.model, attrs['object_id'])
+
+        return attrs
+
+    def create(self, validated_data):
+        filename = validated_data.pop('filename')
+
+        return CloudFile.objects.direct_upload_ticket(filename, **validated_data)
+
+
+class DirectUploadCompleteSerializer(serializers.Serializer):
+    ticket = serializers.CharField(required=True, write_only=True)
+    #: Response the provider gave the client, e.g. `resource_type` of Cloudinary uploads
+    upload_resp = serializers.DictField(required=False, write_only=True)
+
+    def create(self, validated_data):
+        return CloudFile.objects.complete_direct_upload(validated_data['ticket'],
+                                                        validated_data.get('upload_resp'))
+
+
+class UploadSessionSerializer(CloudFileValidationMixin, ModelSerializer):
+    """
+    Starts a resumable upload. The file name and size are checked up front, the content once
+    it is complete.
+    """
+    target = serializers.CharField(required=True, write_only=True, max_length=500)
+    storage = StorageField(write_only=True,
+                           default=getattr(settings, 'CLOUDSTORAGE_DEFAULT_PROVIDER', None))
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'size', 'offset', 'target', 'storage', 'object_id', 'name',
+                  'link_target')
+        read_only_fields = ('offset',)
+        extra_kwargs = {
+            'size': {'min_value': 0},
+            'object_id': {'write_only': True},
+            'name': {'write_only': True},
+            'link_target': {'write_only': True},
+        }
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        target = attrs['target']
+        attrs['target'] = target.name
+
+        if target.allowed_mime_types is not None:
+            mt, encoding = mimetypes.guess_type(attrs['filename'])
+            self._check_mime_type(target, mt)
+        self._check_file_size(target, attrs['size'])
+
+        if attrs.get('object_id') is not None:
+            self._validate_target_object(target.model, attrs['object_id'])
+
+        return attrs
+
+    def create(self, validated_data):
+        return UploadSession.objects.start(**validated_data)
+
+
+class CloudFileListQuerySerializer(CloudFileValidationMixin, serializers.Serializer):
+    """
+    Query parameters of the file list
+    """
+    target = serializers.CharField(required=True, max_length=500)
+    object_id = serializers.CharField(required=False, max_length=10)
+
+
 class CloudFileListSerializer(ModelSerializer):
     class Meta:
         model = CloudFile
         fields = ('url', 'id', 'extra', 'name', 'owner', 'created_at')
 
 
+class SignedURLListSerializer(serializers.ListSerializer):
+    """
+    Signs the urls of all files of the list, e.g. a page, in one pass
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        cloudfiles = list(iterable)
+        CloudFile.prefetch_signed_urls(cloudfiles)
+
+        return super().to_representation(cloudfiles)
+
+
 class CloudFileURLSignedListSerializer(ModelSerializer):
     signed_url = serializers.ReadOnlyField()
 
     class Meta:
         model = CloudFile
+        list_serializer_class = SignedURLListSerializer
         fields = ('url', 'id', 'extra', 'name', 'owner', 'created_at', 'signed_url')
+
+
+class CloudFileStatusSerializer(ModelSerializer):
+    class Meta:
+        model = CloudFile
+        fields = ('id', 'status', 'url')
@@ -0,0 +1,15 @@
+from django.dispatch import Signal
+
+#: Sent when a stage of an upload is over, whether it succeeded or not. The sender is the name
+# of the stage: 'parse' (multipart body), 'validate' (serializer), 'upload' (provider call),
+# 'save' (database writes, including the link) or 'link' (link to the target object).
+# Arguments: duration in seconds, size in bytes or None, storage name or None, failed
+stage_finished = Signal()
+
+#: Sent when an upload is refused by validation, the sender is the reason, e.g. 'mime_type',
+# 'file_size', 'target_object' or '<field>.<code>' for field errors
+upload_rejected = Signal()
+
+#: Sent when urls of downloads are signed. The sender is the storage name.
+# Arguments: count, duration in seconds
+urls_signed = Signal()
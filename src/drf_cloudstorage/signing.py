@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from . import clients
+
+
+class S3URLSigner:
+    """
+    Signs S3 GET urls locally with the long lived connection of `clients.s3_storage()`, instead
+    of looking the key up on S3 for every url as `django_boto.s3.get_url()` does.
+
+    Urls are signed for windows of `window` seconds: every url signed within a window carries
+    the same expiry, `expires` seconds after the window ends, so they are cached and reused
+    until the window is over.
+    """
+
+    def __init__(self, window=60, max_entries=10000):
+        """
+        :param int window: Seconds a signature is reused for, 0 disables caching
+        :param int max_entries: Maximum number of cached urls
+        """
+        self.window = window
+        self.max_entries = max_entries
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        return clients.s3_storage()
+
+    def sign(self, name, prefix, expires):
+        """
+        :param str name: File name
+        :param str prefix: Directory of the file
+        :param int expires: Minimum seconds the url stays valid for
+        :return str: Signed url
+        """
+        return self.sign_many([(name, prefix)], expires)[0]
+
+    def sign_many(self, keys, expires):
+        """
+        :param list keys: (name, prefix) tuples
+        :param int expires: Minimum seconds the urls stay valid for
+        :return list: Signed urls in the order of `keys`
+        """
+        now = time.time()
+        window_start = int(now // self.window) * self.window if self.window else now
+
+        urls = []
+        missing = False
+        for name, prefix in keys:
+            url = self._cache.get((name, prefix, expires, window_start))
+            if url is None:
+                url = self._sign('%s/%s' % (prefix, name), window_start, expires)
+                self._cache[(name, prefix, expires, window_start)] = url
+                missing = True
+            urls.append(url)
+
+        if missing and len(self._cache) > self.max_entries:
+            self._evict(window_start)
+
+        return urls
+
+    def presign_post(self, key_name, expires_in, conditions=(), fields=None):
+        """
+        Builds a POST policy that lets a client upload a single key straight to the bucket
+
+        :param str key_name: Full key name in the bucket
+        :param int expires_in: Seconds the policy is valid for
+        :param list conditions: Additional policy conditions,
+            e.g. ['content-length-range', 0, 1024]
+        :param dict fields: Additional form fields, each one must match exactly
+        :return tuple: (url, fields) to be posted along with the file
+        """
+        storage = self.storage
+        connection = storage.bucket.connection
+        sigv4 = connection._auth_handler.capability[0] == 'hmac-v4-s3'
+        now = time.gmtime()
+
+        fields = dict(fields or {}, key=key_name)
+        if storage.policy:
+            fields['acl'] = storage.policy
+        if connection.provider.security_token:
+            fields['x-amz-security-token'] = connection.provider.security_token
+        if sigv4:
+            region = connection._auth_handler.determine_region_name(connection.host)
+            scope = '%s/%s/s3/aws4_request' % (time.strftime('%Y%m%d', now), region)
+            fields.update({
+                'x-amz-algorithm': 'AWS4-HMAC-SHA256',
+                'x-amz-credential': '%s/%s' % (connection.aws_access_key_id, scope),
+                'x-amz-date': time.strftime('%Y%m%dT%H%M%SZ', now),
+            })
+
+        policy = json.dumps({
+            'expiration': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                        time.gmtime(time.time() + expires_in)),
+            'conditions': [{'bucket': storage.bucket_name}] +
+                          [{name: value} for name, value in fields.items()] + list(conditions),
+        })
+        fields['policy'] = base64.b64encode(policy.encode()).decode()
+
+        if sigv4:
+            key = ('AWS4' + connection.aws_secret_access_key).encode()
+            for part in scope.split('/'):
+                key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+            fields['x-amz-signature'] = hmac.new(key, fields['policy'].encode(),
+                                                 hashlib.sha256).hexdigest()
+        else:
+            fields['AWSAccessKeyId'] = connection.aws_access_key_id
+            fields['signature'] = connection._auth_handler.sign_string(fields['policy'])
+
+        url = '%s://%s/' % ('http' if storage.force_http else 'https',
+                            connection.calling_format.build_host(connection.server_name(),
+                                                                 storage.bucket_name))
+
+        return url, fields
+
+    def _sign(self, key_name, window_start, expires):
+        storage = self.storage
+        connection = storage.bucket.connection
+        expires_in = expires + self.window
+
+        if connection._auth_handler.capability[0] == 'hmac-v4-s3':
+            return connection.generate_url_sigv4(
+                expires_in, 'GET', bucket=storage.bucket_name, key=key_name,
+                force_http=storage.force_http,
+                iso_date=time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(window_start))
+            )
+
+        return connection.generate_url(window_start + expires_in, 'GET',
+                                       bucket=storage.bucket_name, key=key_name,
+                                       force_http=storage.force_http, expires_in_absolute=True)
+
+    def _evict(self, window_start):
+        with self._lock:
+            self._cache = {key: url for key, url in self._cache.items()
+                           if key[3] == window_start}
+            if len(self._cache) > self.max_entries:
+                self._cache = {}
+
+
+_signer = None
+
+
+def get_signer():
+    """
+    :return S3URLSigner: Signer configured by settings.S3_SIGNED_URL_CACHE_WINDOW and
+        settings.S3_SIGNED_URL_CACHE_SIZE
+    """
+    global _signer
+
+    if _signer is None:
+        _signer = S3URLSigner(window=getattr(settings, 'S3_SIGNED_URL_CACHE_WINDOW', 60),
+                              max_entries=getattr(settings, 'S3_SIGNED_URL_CACHE_SIZE', 10000))
+
+    return _signer
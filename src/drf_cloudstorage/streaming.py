@@ -0,0 +1,88 @@
+import urllib3
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+
+from . import clients, helper
+from .errors import DownloadError
+
+#: Request headers passed on to the provider, by their `request.META` key
+REQUEST_HEADERS = {
+    'HTTP_RANGE': 'Range',
+    'HTTP_IF_RANGE': 'If-Range',
+    'HTTP_IF_NONE_MATCH': 'If-None-Match',
+    'HTTP_IF_MODIFIED_SINCE': 'If-Modified-Since',
+}
+
+#: Provider response headers passed on to the client
+RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Content-Encoding',
+                    'Accept-Ranges', 'ETag', 'Last-Modified', 'Cache-Control')
+
+#: Provider statuses answered without a body
+BODILESS_STATUSES = (304, 412, 416)
+
+
+def open_remote(url, headers=None):
+    """
+    Requests a provider object without reading its body
+
+    :param str url: Url of the object, signed if private
+    :param dict headers: Request headers
+    :return urllib3.HTTPResponse: Response to be read and released by the caller
+    :raise Http404: If the object does not exist
+    :raise DownloadError: If the provider fails
+    """
+    try:
+        resp = clients.http_pool().request('GET', url, headers=headers, preload_content=False,
+                                           decode_content=False)
+    except urllib3.exceptions.HTTPError as e:
+        raise DownloadError from e
+
+    if resp.status >= 400 and resp.status not in BODILESS_STATUSES:
+        resp.release_conn()
+        if resp.status in (403, 404):
+            raise Http404
+        raise DownloadError
+
+    return resp
+
+
+def iter_content(resp, chunk_size=None):
+    """
+    :param urllib3.HTTPResponse resp: Response of `open_remote()`, released once consumed or
+        closed
+    :param int chunk_size: Bytes per chunk, defaults to settings.CLOUDSTORAGE_DOWNLOAD_CHUNK_SIZE
+    :return generator: Body in chunks, as sent by the provider
+    """
+    chunk_size = chunk_size or helper.parse_size(
+        getattr(settings, 'CLOUDSTORAGE_DOWNLOAD_CHUNK_SIZE', '64KiB')
+    )
+    try:
+        yield from resp.stream(chunk_size, decode_content=False)
+    finally:
+        resp.release_conn()
+
+
+def stream_response(url, request):
+    """
+    Relays a provider object to the client chunk by chunk, so memory stays constant whatever
+    its size. Range and conditional requests are answered by the provider.
+
+    :param str url: Url of the object, signed if private
+    :param HttpRequest request: Client request
+    :return HttpResponse:
+    """
+    headers = {name: request.META[key] for key, name in REQUEST_HEADERS.items()
+               if key in request.META}
+    resp = open_remote(url, headers)
+
+    if resp.status in BODILESS_STATUSES:
+        resp.release_conn()
+        response = HttpResponse(status=resp.status)
+    else:
+        response = StreamingHttpResponse(iter_content(resp), status=resp.status)
+
+    for name in RESPONSE_HEADERS:
+        if name in resp.headers:
+            response[name] = resp.headers[name]
+
+    return response
@@ -0,0 +1,105 @@
+from collections import namedtuple
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import ManyToManyField
+from django.utils.translation import ugettext_lazy as _
+
+from .constants import DEFAULT_CLOUDINARY_VARIANTS
+from .errors import InvalidTarget
+
+_registry = {}
+_registry_built = False
+
+
+class CloudFileTarget(namedtuple('CloudFileTarget', ('name', 'model', 'field', 'many',
+                                                     'min_file_size', 'max_file_size',
+                                                     'memory_file_size', 'allowed_mime_types',
+                                                     'cloudinary_variants'))):
+    """
+    Upload target resolved from a CloudFileField or ManyCloudFileField. `name` is the lower
+    cased <app_label>.<model>.<field>.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_field(cls, field, model=None):
+        """
+        :param Field field:
+        :param Model model: Model the target belongs to, defaults to the model declaring the
+            field. Children of multi-table inheritance have targets of their own.
+        """
+        model = model or field.model
+        allowed_mime_types = getattr(field, 'allowed_mime_types', None)
+
+        return cls(
+            name=('%s.%s.%s' % (model._meta.app_label, model._meta.model_name,
+                                field.name)).lower(),
+            model=model,
+            field=field,
+            many=isinstance(field, ManyToManyField),
+            min_file_size=field.min_file_size,
+            max_file_size=field.max_file_size,
+            memory_file_size=field.memory_file_size,
+            allowed_mime_types=None if allowed_mime_types is None else frozenset(
+                allowed_mime_types
+            ),
+            cloudinary_variants=getattr(field, 'cloudinary_variants', None) or
+            DEFAULT_CLOUDINARY_VARIANTS,
+        )
+
+    @property
+    def content_type(self):
+        """
+        ContentType caches the lookup, so this hits the database once per process
+        """
+        return ContentType.objects.get_for_model(self.model)
+
+
+def build_registry():
+    """
+    Collects the targets of every CloudFileField and ManyCloudFileField of installed models,
+    including the fields inherited from concrete parents. Proxy models share the targets of
+    their concrete model. Called once the app registry is ready.
+    """
+    global _registry_built
+
+    from .fields import CustomAttributeFieldMixin
+
+    registry = {}
+    for model in apps.get_models():
+        if model._meta.concrete_model is not model:
+            continue
+        for field in model._meta.get_fields():
+            if isinstance(field, CustomAttributeFieldMixin):
+                target = CloudFileTarget.from_field(field, model)
+                registry[target.name] = target
+
+    _registry.clear()
+    _registry.update(registry)
+    _registry_built = True
+
+
+def get_target(target):
+    """
+    :param str target: <app_label>.<model>.<field>
+    :return CloudFileTarget:
+    :raises InvalidTarget: When target is not a CloudFileField or ManyCloudFileField
+    """
+    if not _registry_built:
+        build_registry()
+
+    try:
+        return _registry[target.lower()]
+    except KeyError:
+        raise InvalidTarget(_("'%s' is not a valid target." % target))
+
+
+def all_targets():
+    """
+    :return list: Every registered CloudFileTarget
+    """
+    if not _registry_built:
+        build_registry()
+
+    return list(_registry.values())
@@ -1,9 +1,42 @@
+import base64
 import os
+import pickle
+import shutil
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile, \
+    TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
+from drf_cloudstorage import clients, constants, helper, metrics, resilience
+from drf_cloudstorage.backends import backend_names, get_backend
+from drf_cloudstorage.backends.local import LocalBackend
+from drf_cloudstorage.backends.s3 import S3Backend
+from drf_cloudstorage.collector import collect, expire_upload_sessions
+from drf_cloudstorage.constants import FileStatus, StorageProvider
+from drf_cloudstorage.errors import CloudFileError, InvalidTarget, InvalidTargetObject, \
+    ProviderUnavailable, UploadError
+from drf_cloudstorage.explain import plan_indexes
+from drf_cloudstorage.mime import detect_mime_type
+from drf_cloudstorage.models import CloudFile, CloudFileManager, UploadSession
+from drf_cloudstorage.multipart import S3MultipartUploader
+from drf_cloudstorage.serializers import CloudFileURLSignedListSerializer, \
+    CloudFileValidationMixin
+from drf_cloudstorage.signals import stage_finished
+from drf_cloudstorage.signing import S3URLSigner
+from drf_cloudstorage.targets import all_targets, get_target
+from drf_cloudstorage.uploadhandlers import CloudFileUploadHandler
+from drf_cloudstorage.workers import DatabaseWorker, process_upload
 from example.models import Example
 
 
@@ -159,3 +192,1245 @@ class CloudinaryTestCase(TestCase):
 
     def _get_image_file(self):
         return open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb')
+
+
+class TwoPhaseUploadTestCase(TestCase):
+    S3_RESP = ('https://bucket.s3.amazonaws.com/example/sample.jpg',
+               {'prefix': 'example', 'name': 'sample.jpg', 'storage': StorageProvider.S3})
+
+    @mock.patch.object(S3Backend, 'upload', return_value=S3_RESP)
+    def test_upload(self, upload):
+        example = Example.objects.create()
+
+        cloudfile = CloudFile.objects.create_and_upload(
+            self._get_image_file(), storage=StorageProvider.S3, two_phase=True,
+            target='example.Example.image_file', object_id=example.id, link_target=True
+        )
+        cloudfile.refresh_from_db()
+        example.refresh_from_db()
+
+        self.assertEqual(cloudfile.status, FileStatus.UPLOADED)
+        self.assertEqual(cloudfile.url, self.S3_RESP[0])
+        self.assertEqual(example.image_file_id, cloudfile.id)
+
+    @mock.patch.object(S3Backend, 'upload', side_effect=UploadError)
+    def test_failed_upload(self, upload):
+        with self.assertRaises(UploadError):
+            CloudFile.objects.create_and_upload(self._get_image_file(), two_phase=True,
+                                                storage=StorageProvider.S3,
+                                                target='example.Example.image_file')
+
+        self.assertEqual(CloudFile.objects.get().status, FileStatus.FAILED)
+
+    def _get_image_file(self):
+        return open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb')
+
+
+@mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+class UploadQueriesTestCase(TestCase):
+    def setUp(self):
+        self.example = Example.objects.create()
+        # Cached once per process
+        get_target('example.Example.image_file').content_type
+
+    def test_create_and_upload(self, upload):
+        # SAVEPOINT, INSERT of the file, UPDATE of the target, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            cloudfile = CloudFile.objects.create_and_upload(
+                BytesIO(b'x'), storage=StorageProvider.S3, target='example.Example.image_file',
+                object_id=self.example.id, link_target=True
+            )
+
+        self.example.refresh_from_db()
+        self.assertEqual(self.example.image_file_id, cloudfile.id)
+
+    def test_two_phase(self, upload):
+        # INSERT of the pending file, SAVEPOINT, UPDATE of the file, UPDATE of the target,
+        # RELEASE SAVEPOINT
+        with self.assertNumQueries(5):
+            CloudFile.objects.create_and_upload(
+                BytesIO(b'x'), storage=StorageProvider.S3, target='example.Example.image_file',
+                object_id=self.example.id, link_target=True, two_phase=True
+            )
+
+    def test_many_to_many(self, upload):
+        # SAVEPOINT, INSERT of the file, INSERT of the through row, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            cloudfile = CloudFile.objects.create_and_upload(
+                BytesIO(b'x'), storage=StorageProvider.S3, target='example.Example.attachments',
+                object_id=self.example.id, link_target=True
+            )
+
+        # Linking twice is harmless
+        cloudfile.link_to_target()
+        self.assertEqual(list(self.example.attachments.all()), [cloudfile])
+
+    @mock.patch.object(S3Backend, 'delete_many')
+    def test_missing_target_object(self, upload, delete_many):
+        for target in ('example.Example.image_file', 'example.Example.attachments'):
+            with self.assertRaises(InvalidTargetObject):
+                CloudFile.objects.create_and_upload(
+                    BytesIO(b'x'), storage=StorageProvider.S3, target=target,
+                    object_id=self.example.id + 1, link_target=True
+                )
+
+        self.assertFalse(CloudFile.objects.exists())
+        # The uploaded objects are deleted again
+        self.assertEqual(delete_many.call_count, 2)
+
+    @mock.patch.object(S3Backend, 'delete_many')
+    def test_missing_target_object_two_phase(self, upload, delete_many):
+        with self.assertRaises(InvalidTargetObject):
+            CloudFile.objects.create_and_upload(
+                BytesIO(b'x'), storage=StorageProvider.S3, target='example.Example.image_file',
+                object_id=self.example.id + 1, link_target=True, two_phase=True
+            )
+
+        cloudfile = CloudFile.objects.get()
+        self.assertEqual(cloudfile.status, FileStatus.FAILED)
+        self.assertEqual(delete_many.call_count, 1)
+
+    @mock.patch.object(S3Backend, 'delete_many')
+    def test_serializer_skips_existence_check(self, upload, delete_many):
+        resp = self.client.post(reverse('cloudfile-list'), data={
+            'file': SimpleUploadedFile('sample.bin', b'x' * 2048),
+            'target': 'example.Example.all_file',
+            'object_id': self.example.id + 1,
+            'storage': StorageProvider.S3,
+        })
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(upload.call_count, 1)
+
+
+@override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=4096)
+@mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+class UploadHandlerTestCase(TestCase):
+    def _post(self, size, url=reverse('cloudfile-list'), **extra):
+        return self.client.post(url, data={
+            'file': SimpleUploadedFile('sample.bin', b'x' * size),
+            'target': 'example.Example.all_file',
+            'storage': StorageProvider.S3,
+        }, **extra)
+
+    def test_memory_threshold(self, upload):
+        self.assertEqual(self._post(2048).status_code, status.HTTP_201_CREATED)
+        self.assertIsInstance(upload.call_args[0][0], InMemoryUploadedFile)
+
+        self.assertEqual(self._post(8192).status_code, status.HTTP_201_CREATED)
+        self.assertIsInstance(upload.call_args[0][0], TemporaryUploadedFile)
+
+    def test_too_large(self, upload):
+        # Rejected while the body is read
+        with mock.patch.object(CloudFileUploadHandler, 'file_complete') as file_complete:
+            resp = self._post(3 * 1024 * 1024,
+                              HTTP_X_CLOUDSTORAGE_TARGET='example.Example.all_file')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(file_complete.called)
+        self.assertFalse(upload.called)
+
+        # Limited by the largest target when none is named
+        resp = self._post(3 * 1024 * 1024, url=reverse('cloudfile-list') + '?target=')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CLOUDSTORAGE_ASYNC_UPLOAD=True)
+@mock.patch('drf_cloudstorage.serializers.get_upload_worker', DatabaseWorker)
+class AsyncUploadTestCase(TestCase):
+    ENDPOINT = '/cloudfiles'
+
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_create(self, upload):
+        example = Example.objects.create()
+        data = {
+            'file': open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb'),
+            'target': 'example.Example.image_file',
+            'object_id': example.id,
+            'storage': StorageProvider.S3,
+        }
+
+        resp = self.client.post(self.ENDPOINT, data=data, format='multipart')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED, resp.data)
+        self.assertEqual(resp.data['status'], FileStatus.PENDING)
+
+        spool_path = CloudFile.objects.get(pk=resp.data['id']).upload_resp['spool_path']
+        self.assertTrue(os.path.exists(spool_path))
+
+        process_upload(resp.data['id'])
+        example.refresh_from_db()
+
+        resp = self.client.get(reverse('cloudfile-upload-status', args=[resp.data['id']]))
+        self.assertEqual(resp.data['status'], FileStatus.UPLOADED)
+        self.assertEqual(resp.data['url'], TwoPhaseUploadTestCase.S3_RESP[0])
+        self.assertEqual(example.image_file_id, resp.data['id'])
+        self.assertFalse(os.path.exists(spool_path))
+
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_worker_command(self, upload):
+        content_type = get_target('example.Example.image_file').content_type
+        # Uploaded by its own request
+        two_phase = CloudFile.objects.create(url='', status=FileStatus.PENDING,
+                                             content_type=content_type)
+        unknown_storage = CloudFile.objects.create(
+            url='', status=FileStatus.PENDING, content_type=content_type,
+            upload_resp={'storage': 'gone', 'spool_path': '/nonexistent',
+                         'use_filename': False, 'link_target': False}
+        )
+        spooled = CloudFile.objects.create_pending(self._get_file(), storage=StorageProvider.S3,
+                                                   target='example.Example.image_file')
+        abandoned = CloudFile.objects.create_pending(self._get_file(), storage=StorageProvider.S3,
+                                                     target='example.Example.image_file')
+        CloudFile.objects.filter(pk=abandoned.pk).update(
+            status=FileStatus.UPLOADING, updated_at=timezone.now() - timedelta(hours=2)
+        )
+
+        with self.assertLogs('drf_cloudstorage.workers', 'ERROR'):
+            call_command('cloudstorage_worker', once=True, batch_size=1, stdout=StringIO())
+
+        statuses = dict(CloudFile.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            two_phase.pk: FileStatus.PENDING,
+            unknown_storage.pk: FileStatus.FAILED,
+            spooled.pk: FileStatus.UPLOADED,
+            abandoned.pk: FileStatus.UPLOADED,
+        })
+        self.assertEqual(upload.call_count, 2)
+
+    @staticmethod
+    def _get_file():
+        return open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb')
+
+
+class FakeMultipartBucket:
+    """ Stand-in for `boto.s3.bucket.Bucket` that fails the first attempt of chosen parts """
+
+    def __init__(self, failing_parts=()):
+        self.failing_parts = set(failing_parts)
+        self.parts = {}
+        self.completed = None
+        self.cancelled = False
+
+    def initiate_multipart_upload(self, key_name, policy=None):
+        return mock.Mock(key_name=key_name, id='upload-id')
+
+    def new_key(self, key_name):
+        bucket = self
+
+        class Key:
+            etag = None
+
+            def set_contents_from_file(self, fp, query_args, **kwargs):
+                part_num = int(query_args.split('partNumber=')[1])
+                if part_num in bucket.failing_parts:
+                    bucket.failing_parts.remove(part_num)
+                    raise IOError
+                bucket.parts[part_num] = fp.read()
+                self.etag = '"etag-%s"' % part_num
+
+        return Key()
+
+    def complete_multipart_upload(self, key_name, upload_id, xml):
+        self.completed = xml
+
+    def cancel_multipart_upload(self, key_name, upload_id):
+        self.cancelled = True
+
+
+class S3MultipartUploaderTestCase(TestCase):
+    CHUNK_SIZE = 5 * 1024 * 1024
+
+    def test_upload(self):
+        bucket = FakeMultipartBucket(failing_parts=[2])
+        uploader = S3MultipartUploader(lambda: bucket, self.CHUNK_SIZE, retry_backoff=0)
+        size = self.CHUNK_SIZE * 2 + 10
+
+        with tempfile.TemporaryFile() as fp:
+            fp.write(os.urandom(size))
+            etags = uploader.upload(fp, 'example/big.bin', size)
+            fp.seek(0)
+            content = fp.read()
+
+        self.assertEqual(etags, ['"etag-1"', '"etag-2"', '"etag-3"'])
+        self.assertEqual(b''.join(bucket.parts[i] for i in sorted(bucket.parts)), content)
+        self.assertIn('<PartNumber>3</PartNumber>', bucket.completed)
+        self.assertFalse(bucket.cancelled)
+
+    def test_abort(self):
+        bucket = FakeMultipartBucket(failing_parts=[1])
+        uploader = S3MultipartUploader(lambda: bucket, self.CHUNK_SIZE, max_retries=0)
+
+        with tempfile.TemporaryFile() as fp:
+            fp.write(b'0' * 10)
+            with self.assertRaises(IOError):
+                uploader.upload(fp, 'example/big.bin', 10)
+
+        self.assertIsNone(bucket.completed)
+        self.assertTrue(bucket.cancelled)
+
+
+class BulkUploadTestCase(TestCase):
+    ENDPOINT = reverse('cloudfile-bulk')
+
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_create(self, upload):
+        example = Example.objects.create()
+        data = {
+            'files': [self._get_image_file(), self._get_image_file()],
+            'target': 'example.Example.attachments',
+            'object_id': example.id,
+            'storage': StorageProvider.S3,
+        }
+
+        resp = self.client.post(self.ENDPOINT, data=data, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.assertEqual(example.attachments.count(), 2)
+        self.assertEqual(sorted(example.attachments.values_list('id', flat=True)),
+                         sorted(result['data']['id'] for result in resp.data))
+
+    @mock.patch.object(S3Backend, 'upload',
+                       side_effect=[TwoPhaseUploadTestCase.S3_RESP, UploadError])
+    def test_partial_failure(self, upload):
+        data = {
+            'files': [self._get_image_file(), self._get_image_file()],
+            'target': 'example.Example.attachments',
+            'storage': StorageProvider.S3,
+        }
+
+        resp = self.client.post(self.ENDPOINT, data=data, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS, resp.data)
+        self.assertEqual([result['uploaded'] for result in resp.data], [True, False])
+        self.assertEqual(CloudFile.objects.count(), 1)
+
+    @mock.patch.object(S3Backend, 'delete_many')
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_missing_target_object(self, upload, delete_many):
+        with self.assertRaises(InvalidTargetObject):
+            CloudFile.objects.bulk_create_and_upload(
+                [self._get_image_file(), self._get_image_file()], storage=StorageProvider.S3,
+                target='example.Example.attachments', object_id=0, link_target=True
+            )
+
+        self.assertFalse(CloudFile.objects.exists())
+        self.assertEqual(delete_many.call_count, 2)
+
+    def test_no_files(self):
+        self.assertEqual(CloudFile.objects.bulk_create_and_upload(
+            [], storage=StorageProvider.S3, target='example.Example.attachments'
+        ), [])
+
+    def test_create_invalid_mime(self):
+        data = {
+            'files': [self._get_image_file(),
+                      open(os.path.dirname(__file__) + '/fixtures/sample.txt', 'rb')],
+            'target': 'example.Example.image_file',
+            'storage': StorageProvider.S3,
+        }
+
+        resp = self.client.post(self.ENDPOINT, data=data, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, resp.data)
+        self.assertEqual(list(resp.data['files']), [1])
+
+    def _get_image_file(self):
+        return open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb')
+
+
+class TargetRegistryTestCase(TestCase):
+    def test_get_target(self):
+        target = get_target('example.Example.image_file')
+
+        self.assertIs(target.model, Example)
+        self.assertFalse(target.many)
+        self.assertEqual(target.max_file_size, 2 * 1024 * 1024)
+        self.assertEqual(target.allowed_mime_types, {'image/jpeg', 'image/png', 'image/jpg'})
+        self.assertTrue(get_target('example.example.attachments').many)
+
+    def test_invalid_target(self):
+        for target in ('example.Example.id', 'example.Example', 'example.Unknown.image_file'):
+            with self.assertRaises(InvalidTarget):
+                get_target(target)
+
+        resp = self.client.post('/cloudfiles', data={
+            'file': open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb'),
+            'target': 'example.Example.id',
+        }, format='multipart')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, resp.data)
+
+
+    def test_inherited_targets(self):
+        from django.db import models
+        from django.test.utils import isolate_apps
+
+        from drf_cloudstorage import targets
+        from drf_cloudstorage.fields import CloudFileField
+
+        with isolate_apps('example') as isolated:
+            class Parent(models.Model):
+                document = CloudFileField(CloudFile, on_delete=models.SET_NULL, null=True,
+                                          related_name='+')
+
+                class Meta:
+                    app_label = 'example'
+
+            class Child(Parent):
+                class Meta:
+                    app_label = 'example'
+
+            class ParentProxy(Parent):
+                class Meta:
+                    app_label = 'example'
+                    proxy = True
+
+        self.addCleanup(targets.build_registry)
+        with mock.patch.object(targets, 'apps', isolated):
+            targets.build_registry()
+
+        self.assertEqual(set(target.name for target in all_targets()),
+                         {'example.parent.document', 'example.child.document'})
+        self.assertIs(get_target('example.child.document').model, Child)
+
+    def test_empty_registry(self):
+        from django.test.utils import isolate_apps
+
+        from drf_cloudstorage import targets
+
+        self.addCleanup(targets.build_registry)
+        with isolate_apps('example') as isolated, mock.patch.object(targets, 'apps', isolated):
+            targets.build_registry()
+
+        # Built once, even with nothing to register
+        with mock.patch.object(targets, 'build_registry') as build_registry:
+            with self.assertRaises(InvalidTarget):
+                get_target('example.Example.image_file')
+        self.assertFalse(build_registry.called)
+
+
+class CloudFileFieldTestCase(TestCase):
+    def test_parsed_size_limits(self):
+        field = Example._meta.get_field('image_file')
+
+        for f in (field, field.clone(), pickle.loads(pickle.dumps(field))):
+            self.assertEqual(f.min_file_size, 1024)
+            self.assertEqual(f.max_file_size, 2 * 1024 * 1024)
+            self.assertEqual(f.allowed_mime_types, ('image/jpeg', 'image/png', 'image/jpg'))
+
+
+class MimeSniffingTestCase(TestCase):
+    def test_detect_mime_type(self):
+        with open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb') as f:
+            content = f.read()
+
+        cases = (
+            ('sample.jpg', content, 'image/jpeg'),
+            ('sample.png', content, 'image/jpeg'),
+            ('sample.jpg', b'plain text', None),
+            ('sample.txt', b'plain text', 'text/plain'),
+            ('sample.docx', b'PK\x03\x04rest',
+             'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+        )
+        for name, content, mime_type in cases:
+            f = SimpleUploadedFile(name, content)
+            f.seek(3)
+            self.assertEqual(detect_mime_type(f), mime_type, name)
+            self.assertEqual(f.tell(), 3)
+
+    def test_renamed_file_is_rejected(self):
+        target = get_target('example.Example.image_file')
+        f = SimpleUploadedFile('sample.jpg', b'plain text')
+
+        CloudFileValidationMixin()._validate_mime_type(target, f)
+
+        with override_settings(CLOUDSTORAGE_SNIFF_MIME_TYPES=True):
+            with self.assertRaises(CloudFileError):
+                CloudFileValidationMixin()._validate_mime_type(target, f)
+
+
+@override_settings(CLOUDSTORAGE_DEDUPLICATE=True)
+class DeduplicationTestCase(TestCase):
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_duplicate_upload(self, upload):
+        cloudfiles = [
+            CloudFile.objects.create_and_upload(self._get_image_file(), storage=StorageProvider.S3,
+                                                target='example.Example.image_file')
+            for i in range(2)
+        ]
+
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(cloudfiles[0].content_hash, cloudfiles[1].content_hash)
+        self.assertEqual(cloudfiles[0].upload_resp, cloudfiles[1].upload_resp)
+        self.assertTrue(cloudfiles[0].shares_remote_object)
+
+        cloudfiles[1].delete()
+        self.assertFalse(cloudfiles[0].shares_remote_object)
+
+    @mock.patch.object(CloudFileManager, 'delete_remote', return_value=1)
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_duplicate_collected(self, upload, delete_remote):
+        duplicate = CloudFile.objects.create_and_upload(self._get_image_file(),
+                                                        storage=StorageProvider.S3,
+                                                        target='example.Example.image_file')
+
+        # The collector deletes the duplicate once it is found but before it gets reused
+        def find_duplicate(content_hash):
+            collect(timezone.now() + timedelta(hours=1))
+            return duplicate
+
+        with mock.patch('drf_cloudstorage.models.StorageProviderManagerMixin._find_duplicate',
+                        side_effect=find_duplicate):
+            cloudfile = CloudFile.objects.create_and_upload(self._get_image_file(),
+                                                            storage=StorageProvider.S3,
+                                                            target='example.Example.image_file')
+
+        self.assertEqual(delete_remote.call_args[0][0], [duplicate.upload_resp])
+        # Uploaded again rather than pointing to the deleted object
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(list(CloudFile.objects.all()), [cloudfile])
+
+    @mock.patch.object(CloudFileManager, 'delete_remote', return_value=1)
+    @mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP)
+    def test_duplicate_collected_bulk(self, upload, delete_remote):
+        duplicate = CloudFile.objects.create_and_upload(self._get_image_file(),
+                                                        storage=StorageProvider.S3,
+                                                        target='example.Example.image_file')
+
+        def find_duplicates(content_hashes):
+            collect(timezone.now() + timedelta(hours=1))
+            return [duplicate]
+
+        with mock.patch('drf_cloudstorage.models.StorageProviderManagerMixin._find_duplicates',
+                        side_effect=find_duplicates):
+            cloudfiles = CloudFile.objects.bulk_create_and_upload(
+                [self._get_image_file()], storage=StorageProvider.S3,
+                target='example.Example.image_file'
+            )
+
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(len(cloudfiles), 1)
+        self.assertEqual(CloudFile.objects.count(), 1)
+
+    def _get_image_file(self):
+        return open(os.path.dirname(__file__) + '/fixtures/sample.jpg', 'rb')
+
+
+class GarbageCollectorTestCase(TestCase):
+    def setUp(self):
+        self.example = Example.objects.create(image_file=self._create(), all_file=self._create())
+        self.example.attachments.add(self._create())
+        self.unlinked = [self._create(), self._create(content_hash='shared')]
+        self._create(content_hash='shared')
+
+    @mock.patch.object(CloudFileManager, 'delete_remote', return_value=1)
+    def test_collect(self, delete_remote):
+        stats = collect(timezone.now() + timedelta(hours=1), batch_size=1, dry_run=True)
+        self.assertEqual(stats['files'], 3)
+        delete_remote.assert_not_called()
+
+        self.example.attachments.clear()
+        linked = [self.example.image_file_id, self.example.all_file_id]
+
+        stats = collect(timezone.now() + timedelta(hours=1))
+        self.assertEqual(stats['files'], 4)
+        self.assertEqual(set(CloudFile.objects.values_list('pk', flat=True)), set(linked))
+        # Objects of rows sharing a hash are deleted once
+        self.assertEqual(len(delete_remote.call_args[0][0]), 3)
+
+    @mock.patch.object(CloudFileManager, 'delete_remote', return_value=1)
+    def test_linked_while_locking(self, delete_remote):
+        from drf_cloudstorage import collector
+
+        unlinked_cloudfiles = collector.unlinked_cloudfiles
+        calls = []
+
+        # A link commits after the batch was selected, while its rows get locked
+        def link_meanwhile(cutoff):
+            if len(calls) == 1:
+                self.example.attachments.add(self.unlinked[0])
+            calls.append(cutoff)
+            return unlinked_cloudfiles(cutoff)
+
+        with mock.patch.object(collector, 'unlinked_cloudfiles', side_effect=link_meanwhile):
+            stats = collect(timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(stats['files'], 2)
+        self.assertIn(self.unlinked[0], self.example.attachments.all())
+
+    def test_ttl(self):
+        stats = collect(timezone.now() - timedelta(hours=1))
+        self.assertEqual(stats['files'], 0)
+
+    def _create(self, **kwargs):
+        return CloudFile.objects.create(url=TwoPhaseUploadTestCase.S3_RESP[0],
+                                        upload_resp=TwoPhaseUploadTestCase.S3_RESP[1],
+                                        content_type=get_target('example.Example.all_file')
+                                        .content_type, **kwargs)
+
+
+class SignedURLTestCase(TestCase):
+    def setUp(self):
+        from boto.s3.connection import S3Connection
+
+        connection = S3Connection(aws_access_key_id='key', aws_secret_access_key='secret')
+        self.storage = mock.Mock(bucket_name='bucket', force_http=False,
+                                 bucket=mock.Mock(connection=connection))
+
+    def test_sign_many(self):
+        signer = S3URLSigner(window=60)
+        with mock.patch.object(S3URLSigner, 'storage', self.storage):
+            urls = signer.sign_many([('a.jpg', 'example'), ('b.jpg', 'example')], expires=30)
+
+            self.assertIn('/example/a.jpg?', urls[0])
+            self.assertIn('Signature=', urls[0])
+            self.assertIn('/example/b.jpg?', urls[1])
+            self.assertEqual(signer.sign('a.jpg', 'example', expires=30), urls[0])
+
+    @mock.patch('drf_cloudstorage.signing.S3URLSigner.sign_many', return_value=['signed'] * 3)
+    def test_list_serializer(self, sign_many):
+        cloudfiles = [CloudFile(url='', upload_resp=TwoPhaseUploadTestCase.S3_RESP[1])
+                      for i in range(3)]
+
+        data = CloudFileURLSignedListSerializer(cloudfiles, many=True).data
+
+        self.assertEqual(sign_many.call_count, 1)
+        self.assertEqual([item['signed_url'] for item in data], ['signed'] * 3)
+
+
+class CloudinaryExtraTestCase(TestCase):
+    UPLOAD_RESP = {
+        'public_id': 'drf_cloudstorage/example__example__image_file/sample',
+        'version': 1584600000,
+        'format': 'jpg',
+        'resource_type': 'image',
+        'secure_url': 'https://res.cloudinary.com/demo/image/upload/v1584600000/'
+                      'drf_cloudstorage/example__example__image_file/sample.jpg',
+        'storage': StorageProvider.CLOUDINARY,
+    }
+
+    def test_extra_data(self):
+        target = get_target('example.Example.image_file')
+        cloudfile = CloudFile.objects.create(url=self.UPLOAD_RESP['secure_url'],
+                                             upload_resp=self.UPLOAD_RESP,
+                                             content_type=target.content_type,
+                                             content_field='image_file')
+        cloudfile.refresh_from_db()
+
+        self.assertEqual(cloudfile.extra_data['thumbnail'],
+                         'https://res.cloudinary.com/demo/image/upload/c_scale,h_50/'
+                         'v1584600000/drf_cloudstorage/example__example__image_file/sample.jpg')
+        self.assertEqual(cloudfile.extra_data['file_name'], 'sample.jpg')
+        self.assertEqual(cloudfile.extra, cloudfile.extra_data)
+
+        with mock.patch.object(type(target), 'cloudinary_variants', {'large': 'c_scale,h_900'}):
+            self.assertEqual(set(cloudfile.build_extra()) & {'large', 'thumbnail'}, {'large'})
+
+    @override_settings(CLOUDSTORAGE_STORE_RAW_RESPONSE=True)
+    @mock.patch('cloudinary.uploader.upload')
+    def test_upload_resp_compaction(self, upload):
+        upload.return_value = dict(self.UPLOAD_RESP, colors=[['#FFFFFF', 90.1]],
+                                   image_metadata={'Make': 'Canon'}, eager=[])
+        del upload.return_value['storage']
+
+        f = SimpleUploadedFile('sample.jpg', b'\xff\xd8\xff', content_type='image/jpeg')
+        cloudfile = CloudFile.objects.create_and_upload(f, storage=StorageProvider.CLOUDINARY,
+                                                        target='example.Example.image_file')
+        cloudfile.refresh_from_db()
+
+        self.assertEqual(cloudfile.upload_resp, self.UPLOAD_RESP)
+        self.assertEqual(cloudfile.raw_response.data['image_metadata'], {'Make': 'Canon'})
+
+
+class DirectUploadTestCase(TestCase):
+    def setUp(self):
+        from boto.s3.connection import S3Connection
+
+        connection = S3Connection(aws_access_key_id='key', aws_secret_access_key='secret')
+        self.storage = mock.Mock(bucket_name='bucket', force_http=False, policy='private',
+                                 bucket=mock.Mock(connection=connection))
+        self.example = Example.objects.create()
+
+    def test_ticket(self):
+        with mock.patch.object(S3URLSigner, 'storage', self.storage):
+            resp = self.client.post(reverse('cloudfile-direct-upload'), data={
+                'filename': 'sample.jpg',
+                'target': 'example.Example.image_file',
+                'storage': StorageProvider.S3,
+            })
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        fields = resp.data['fields']
+        self.assertEqual(fields['Content-Type'], 'image/jpeg')
+        self.assertTrue(fields['key'].startswith('example__example__image_file/'))
+        self.assertIn(b'["content-length-range", 1024, 2097152]',
+                      base64.b64decode(fields['policy']))
+        self.assertIn('signature', fields)
+
+    def test_ticket_mime_type(self):
+        resp = self.client.post(reverse('cloudfile-direct-upload'), data={
+            'filename': 'sample.txt',
+            'target': 'example.Example.image_file',
+            'storage': StorageProvider.S3,
+        })
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete(self):
+        with mock.patch.object(S3URLSigner, 'storage', self.storage):
+            ticket = CloudFile.objects.direct_upload_ticket(
+                'sample.jpg', target='example.Example.image_file', storage=StorageProvider.S3,
+                object_id=str(self.example.pk), link_target=True
+            )['ticket']
+
+        with mock.patch.object(S3Backend, 'verify_direct_upload',
+                               side_effect=lambda resp, client_resp: ('https://s3/x.jpg', resp,
+                                                                      1500)):
+            resp = self.client.post(reverse('cloudfile-complete-direct-upload'),
+                                    data={'ticket': ticket}, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+
+            # A ticket is completed once
+            resp = self.client.post(reverse('cloudfile-complete-direct-upload'),
+                                    data={'ticket': ticket}, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.example.refresh_from_db()
+        self.assertEqual(self.example.image_file.url, 'https://s3/x.jpg')
+
+    def test_complete_invalid_ticket(self):
+        resp = self.client.post(reverse('cloudfile-complete-direct-upload'),
+                                data={'ticket': 'forged'}, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ResumableUploadTestCase(TestCase):
+    CONTENT = os.urandom(4096)
+
+    def setUp(self):
+        resp = self.client.post(reverse('cloudfile-start-upload'), data={
+            'filename': 'sample.bin',
+            'size': len(self.CONTENT),
+            'target': 'example.Example.all_file',
+            'storage': StorageProvider.S3,
+        })
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.session = UploadSession.objects.get(pk=resp.data['id'])
+        self.url = reverse('cloudfile-upload-session', args=[resp.data['id']])
+
+    def tearDown(self):
+        helper.remove_spooled_file(self.session.spool_path)
+
+    def _put(self, start, end):
+        return self.client.put(self.url, data=self.CONTENT[start:end + 1],
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes %d-%d/%d' % (start, end,
+                                                                      len(self.CONTENT)))
+
+    def test_resume(self):
+        uploaded = []
+
+        def upload(f, directory, use_filename=False):
+            uploaded.append(f.read())
+            return TwoPhaseUploadTestCase.S3_RESP
+
+        resp = self._put(0, 2999)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(resp.data['offset'], 3000)
+
+        # A chunk that does not start at the offset is refused
+        resp = self._put(2000, 2999)
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(self.url).data['offset'], 3000)
+
+        with mock.patch.object(S3Backend, 'upload', side_effect=upload):
+            resp = self._put(3000, 4095)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+
+        self.assertEqual(uploaded, [self.CONTENT])
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(self.session.spool_path))
+
+    def test_stale_chunk(self):
+        self.assertEqual(self._put(0, 2999).status_code, status.HTTP_200_OK)
+
+        # A request that read the session before the first chunk was written writes nothing
+        stale = UploadSession.objects.get(pk=self.session.pk)
+        stale.offset = 0
+        self.assertFalse(stale.write_chunk(0, [b'x' * 3000]))
+
+        with open(self.session.spool_path, 'rb') as fp:
+            self.assertEqual(fp.read(), self.CONTENT[:3000])
+        # The part file the stale chunk was received into is gone
+        self.assertEqual(os.listdir(os.path.dirname(self.session.spool_path)), ['sample.bin'])
+        self.assertEqual(self.client.get(self.url).data['offset'], 3000)
+
+    def test_retry(self):
+        with mock.patch.object(S3Backend, 'upload', side_effect=UploadError):
+            resp = self._put(0, 4095)
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.client.get(self.url).data['offset'], 4096)
+
+        with mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP):
+            resp = self.client.put(self.url, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes */%d' % len(self.CONTENT))
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_concurrent_finish(self):
+        with mock.patch.object(S3Backend, 'upload', return_value=TwoPhaseUploadTestCase.S3_RESP):
+            self.assertEqual(self._put(0, 4095).status_code, status.HTTP_201_CREATED)
+
+        # A retry that read the complete session before the first request finished it
+        stale = UploadSession(**{f.attname: getattr(self.session, f.attname)
+                                 for f in UploadSession._meta.concrete_fields})
+        stale.offset = len(self.CONTENT)
+        with mock.patch('drf_cloudstorage.views.get_object_or_404', return_value=stale), \
+                mock.patch.object(S3Backend, 'upload') as upload:
+            resp = self.client.put(self.url, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes */%d' % len(self.CONTENT))
+
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(upload.called)
+        self.assertEqual(CloudFile.objects.count(), 1)
+
+    def test_directory_filename(self):
+        resp = self.client.post(reverse('cloudfile-start-upload'), data={
+            'filename': '..', 'size': 2048, 'target': 'example.Example.all_file',
+            'storage': StorageProvider.S3,
+        })
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        session = UploadSession.objects.get(pk=resp.data['id'])
+        self.addCleanup(helper.remove_spooled_file, session.spool_path)
+
+        self.assertEqual(os.path.basename(session.spool_path), 'file')
+        self.assertTrue(session.write_chunk(0, [b'x' * 2048]))
+
+    def test_invalid_range(self):
+        resp = self.client.put(self.url, data=b'x', content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes 0-0/1')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expiry(self):
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(expire_upload_sessions(), 1)
+        self.assertFalse(os.path.exists(self.session.spool_path))
+
+
+class DownloadTestCase(TestCase):
+    def setUp(self):
+        self.cloudfile = CloudFile.objects.create(
+            url=CloudinaryExtraTestCase.UPLOAD_RESP['secure_url'],
+            upload_resp=dict(CloudinaryExtraTestCase.UPLOAD_RESP, etag='0cc175b9'),
+            content_type=get_target('example.Example.image_file').content_type
+        )
+        self.url = reverse('cloudfile-download', args=[self.cloudfile.pk])
+
+    @mock.patch('drf_cloudstorage.clients.http_pool')
+    def test_range(self, http_pool):
+        from urllib3 import HTTPResponse
+
+        http_pool.return_value.request.return_value = HTTPResponse(
+            body=BytesIO(b'6789'), status=206, preload_content=False,
+            headers={'Content-Range': 'bytes 6-9/10', 'Content-Length': '4', 'ETag': '"0cc175b9"'}
+        )
+
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=6-')
+
+        self.assertEqual(resp.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(resp.streaming_content), b'6789')
+        self.assertEqual(resp['Content-Range'], 'bytes 6-9/10')
+        self.assertEqual(http_pool.return_value.request.call_args[1]['headers'],
+                         {'Range': 'bytes=6-'})
+
+    @mock.patch('drf_cloudstorage.clients.http_pool')
+    def test_not_modified(self, http_pool):
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH='"0cc175b9"')
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(http_pool.called)
+
+    @mock.patch('drf_cloudstorage.clients.http_pool')
+    def test_missing(self, http_pool):
+        from urllib3 import HTTPResponse
+
+        http_pool.return_value.request.return_value = HTTPResponse(body=BytesIO(b''), status=404,
+                                                                  preload_content=False)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ClientsTestCase(TestCase):
+    def tearDown(self):
+        # Drop the clients created here
+        clients._pid = None
+
+    def test_http_pool(self):
+        pool = clients.http_pool()
+        self.assertIs(clients.http_pool(), pool)
+        self.assertIs(clients.cloudinary_uploader()._http, pool)
+        self.assertEqual(pool.connection_pool_kw['maxsize'], 10)
+
+        # A forked process starts over
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(clients.http_pool(), pool)
+
+    @mock.patch.dict('sys.modules', {'cloudinary.api_client.call_api': None})
+    def test_cloudinary_internals_missing(self):
+        import cloudinary.uploader
+
+        # Versions without one of the pools keep working with their own
+        with mock.patch.object(cloudinary.uploader, '_http', None):
+            self.assertIsNone(clients.cloudinary_uploader()._http)
+
+        self.assertIs(clients.cloudinary_uploader()._http, clients.http_pool())
+
+    @mock.patch.dict('sys.modules', {'django_boto.s3.storage': mock.Mock(S3Storage=mock.Mock)})
+    def test_s3_storage_per_thread(self):
+        storage = clients.s3_storage()
+        self.assertIs(clients.s3_storage(), storage)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertIsNot(executor.submit(clients.s3_storage).result(), storage)
+
+
+class LocalBackendTestCase(TestCase):
+    CONTENT = os.urandom(2048)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+        backends = {StorageProvider.S3: 'drf_cloudstorage.backends.s3.S3Backend',
+                    StorageProvider.LOCAL: 'drf_cloudstorage.backends.local.LocalBackend'}
+        override = override_settings(CLOUDSTORAGE_BACKENDS=backends,
+                                     CLOUDSTORAGE_LOCAL_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        resp = self.client.post(reverse('cloudfile-list'), data={
+            'file': SimpleUploadedFile('sample.bin', self.CONTENT),
+            'target': 'example.Example.all_file',
+            'storage': StorageProvider.LOCAL,
+        })
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        self.cloudfile = CloudFile.objects.get(pk=resp.data['id'])
+        self.url = reverse('cloudfile-download', args=[self.cloudfile.pk])
+
+    def test_registry(self):
+        self.assertEqual(backend_names(), (StorageProvider.S3, StorageProvider.LOCAL))
+        self.assertEqual(constants.PROVIDERS, backend_names())
+        with self.assertRaises(CloudFileError):
+            get_backend(StorageProvider.CLOUDINARY)
+
+    def test_upload(self):
+        path = os.path.join(self.root, self.cloudfile.upload_resp['prefix'],
+                            self.cloudfile.upload_resp['name'])
+
+        with open(path, 'rb') as fp:
+            self.assertEqual(fp.read(), self.CONTENT)
+        self.assertTrue(self.cloudfile.url.startswith('/cloudstorage/example__example__all_file/'))
+        self.assertEqual(self.cloudfile.signed_url, '')
+        self.assertEqual(self.cloudfile.download().read(), self.CONTENT)
+
+    def test_download(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(resp.streaming_content), self.CONTENT)
+        self.assertEqual(resp['Content-Length'], str(len(self.CONTENT)))
+        self.assertEqual(resp['ETag'], self.cloudfile.etag)
+
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(resp.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(resp.streaming_content), self.CONTENT[-10:])
+        self.assertEqual(resp['Content-Range'], 'bytes 2038-2047/2048')
+
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=4096-')
+        self.assertEqual(resp.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_delete(self):
+        path = os.path.join(self.root, self.cloudfile.upload_resp['prefix'],
+                            self.cloudfile.upload_resp['name'])
+
+        self.assertTrue(self.cloudfile.delete_remote())
+        self.assertFalse(os.path.exists(path))
+
+
+class FakeBackend(LocalBackend):
+    """
+    Local backend that injects latency and errors into its operations
+    """
+    latency = 0
+    #: Raised by the next operations, one each
+    errors = ()
+
+    def _inject(self):
+        time.sleep(self.latency)
+        if self.errors:
+            error, *self.errors = self.errors
+            raise error
+
+    def upload(self, *args, **kwargs):
+        self._inject()
+        return super().upload(*args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        self._inject()
+        return super().delete_many(*args, **kwargs)
+
+
+class ResilienceTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+        override = override_settings(
+            CLOUDSTORAGE_BACKENDS={'fake': 'drf_cloudstorage.tests.FakeBackend',
+                                   StorageProvider.LOCAL: 'drf_cloudstorage.backends.local.'
+                                                          'LocalBackend'},
+            CLOUDSTORAGE_LOCAL_ROOT=self.root,
+            CLOUDSTORAGE_FAILOVER={'fake': StorageProvider.LOCAL},
+            CLOUDSTORAGE_CIRCUIT_BREAKER_THRESHOLD=2,
+            CLOUDSTORAGE_RETRY_BASE_DELAY=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.backend = get_backend('fake')
+
+    def _upload(self):
+        return CloudFile.objects.create_and_upload(SimpleUploadedFile('sample.bin', b'x' * 2048),
+                                                   storage='fake',
+                                                   target='example.Example.all_file')
+
+    def test_retry(self):
+        cloudfile = self._upload()
+
+        self.backend.errors = [ConnectionError(), ConnectionError()]
+        self.assertEqual(CloudFile.objects.delete_remote([cloudfile.upload_resp]), 1)
+        self.assertEqual(self.backend.errors, [])
+
+    @override_settings(CLOUDSTORAGE_RETRY_DEADLINE=0.15)
+    def test_retry_deadline(self):
+        cloudfile = self._upload()
+
+        self.backend.latency = 0.1
+        self.backend.errors = [ConnectionError()] * 3
+        with self.assertRaises(ConnectionError):
+            CloudFile.objects.delete_remote([cloudfile.upload_resp])
+        # No third attempt past the deadline
+        self.assertEqual(len(self.backend.errors), 1)
+
+    def test_failover(self):
+        self.backend.errors = [UploadError()]
+
+        cloudfile = self._upload()
+        self.assertEqual(cloudfile.storage_provider, StorageProvider.LOCAL)
+        self.assertEqual(self.backend.errors, [])
+
+    @override_settings(CLOUDSTORAGE_FAILOVER={})
+    def test_circuit_breaker(self):
+        self.backend.errors = [UploadError(), UploadError(), UploadError()]
+        for i in range(2):
+            with self.assertRaises(UploadError):
+                self._upload()
+
+        # Open, the provider is not called
+        with self.assertRaises(ProviderUnavailable):
+            self._upload()
+        self.assertEqual(len(self.backend.errors), 1)
+
+        # A single trial is let through once the reset timeout is over
+        breaker = resilience.get_circuit_breaker('fake')
+        breaker.opened_at -= breaker.reset_timeout
+        with self.assertRaises(UploadError):
+            self._upload()
+        with self.assertRaises(ProviderUnavailable):
+            self._upload()
+
+        breaker.opened_at -= breaker.reset_timeout
+        self._upload()
+        self.assertFalse(breaker.is_open)
+
+
+class ListTestCase(TestCase):
+    def setUp(self):
+        override = override_settings(
+            CLOUDSTORAGE_BACKENDS={StorageProvider.LOCAL: 'drf_cloudstorage.backends.local.'
+                                                          'LocalBackend'},
+            CLOUDSTORAGE_LOCAL_ROOT=tempfile.gettempdir(),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.example = Example.objects.create()
+        content_type = get_target('example.Example.all_file').content_type
+        for i in range(7):
+            CloudFile.objects.create(url='/cloudstorage/%d.bin' % i, content_type=content_type,
+                                     content_field='all_file',
+                                     object_id=self.example.pk if i < 5 else self.example.pk + 1,
+                                     upload_resp={'storage': StorageProvider.LOCAL,
+                                                  'prefix': 'example', 'name': '%d.bin' % i})
+        # Ties are broken by id
+        CloudFile.objects.filter(pk__in=CloudFile.objects.order_by('pk')[:4].values('pk')) \
+            .update(created_at=timezone.now())
+        self.ordered = list(CloudFile.objects.order_by('-created_at', '-id')
+                            .values_list('id', flat=True))
+
+    def _list(self, url=None, **params):
+        resp = self.client.get(url or reverse('cloudfile-list'), data=params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        return resp.data
+
+    def test_pages(self):
+        ids = []
+        data = self._list(target='example.Example.all_file', page_size=2)
+        while True:
+            self.assertLessEqual(len(data['results']), 2)
+            ids += [row['id'] for row in data['results']]
+            if data['next'] is None:
+                break
+            data = self._list(data['next'])
+
+        self.assertEqual(ids, self.ordered)
+        self.assertIn('signed_url', data['results'][0])
+
+    def test_object_id(self):
+        data = self._list(target='example.Example.all_file', object_id=self.example.pk)
+
+        self.assertEqual([row['id'] for row in data['results']],
+                         list(CloudFile.objects.filter(object_id=self.example.pk)
+                              .order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertIsNone(data['next'])
+
+    def test_uploaded_only(self):
+        for file_status in (FileStatus.PENDING, FileStatus.UPLOADING, FileStatus.FAILED):
+            CloudFile.objects.create(url='', status=file_status, content_field='all_file',
+                                     content_type=get_target('example.Example.all_file')
+                                     .content_type)
+
+        data = self._list(target='example.Example.all_file')
+
+        self.assertEqual([row['id'] for row in data['results']], self.ordered)
+
+    def test_queries(self):
+        data = self._list(target='example.Example.all_file', page_size=3)
+        with self.assertNumQueries(1):
+            self._list(data['next'])
+
+    def test_invalid_params(self):
+        resp = self.client.get(reverse('cloudfile-list'))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(reverse('cloudfile-list'), data={'target': 'example.Example.id'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(reverse('cloudfile-list'),
+                               data={'target': 'example.Example.all_file', 'cursor': 'abc'})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+        override = override_settings(
+            CLOUDSTORAGE_BACKENDS={StorageProvider.LOCAL: 'drf_cloudstorage.backends.local.'
+                                                          'LocalBackend'},
+            CLOUDSTORAGE_LOCAL_ROOT=self.root,
+            CLOUDSTORAGE_METRICS_SINK='drf_cloudstorage.metrics.InMemorySink',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.sink = metrics.get_metrics_sink()
+
+    def _post(self, filename, target, **data):
+        return self.client.post(reverse('cloudfile-list'), data={
+            'file': SimpleUploadedFile(filename, b'x' * 2048),
+            'target': target,
+            'storage': StorageProvider.LOCAL,
+            **data
+        })
+
+    def test_upload_stages(self):
+        stages = []
+
+        def on_stage(sender, **kwargs):
+            stages.append(sender)
+
+        stage_finished.connect(on_stage)
+        self.addCleanup(stage_finished.disconnect, on_stage)
+
+        example = Example.objects.create()
+        resp = self._post('sample.bin', 'example.Example.all_file', object_id=example.pk)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+
+        self.assertEqual(stages, ['parse', 'validate', 'upload', 'link', 'save'])
+        self.assertEqual(self.sink.counters[('cloudstorage.upload.bytes',
+                                             ('storage', StorageProvider.LOCAL))], 2048)
+        self.assertEqual(len(self.sink.observations[('cloudstorage.upload.throughput',
+                                                     ('storage', StorageProvider.LOCAL))]), 1)
+        self.assertEqual(len(self.sink.timings[self.sink.key(
+            'cloudstorage.stage.duration', {'stage': 'upload', 'storage': StorageProvider.LOCAL}
+        )]), 1)
+
+    def test_rejections(self):
+        resp = self._post('sample.bin', 'example.Example.image_file')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post(reverse('cloudfile-list'),
+                                data={'target': 'example.Example.image_file',
+                                      'storage': StorageProvider.LOCAL})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self._post('sample.bin', 'example.Example.all_file', object_id=0)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        rejections = {key: count for key, count in self.sink.counters.items()
+                      if key[0] == 'cloudstorage.rejections'}
+        self.assertEqual(rejections, {
+            ('cloudstorage.rejections', ('reason', 'mime_type')): 1,
+            ('cloudstorage.rejections', ('reason', 'file.required')): 1,
+            ('cloudstorage.rejections', ('reason', 'target_object')): 1,
+        })
+        # Only the missing object is found out after uploading, by the link
+        self.assertEqual(len(self.sink.timings[self.sink.key(
+            'cloudstorage.stage.duration', {'stage': 'upload', 'storage': StorageProvider.LOCAL}
+        )]), 1)
+
+    def test_signed_urls(self):
+        resp = self._post('sample.bin', 'example.Example.all_file')
+        cloudfile = CloudFile.objects.get(pk=resp.data['id'])
+
+        # Local urls are not signed
+        CloudFile.prefetch_signed_urls([cloudfile])
+        self.assertNotIn(('cloudstorage.signed_urls', ('storage', StorageProvider.LOCAL)),
+                         self.sink.counters)
+
+        with mock.patch.object(LocalBackend, 'sign_many', return_value=['signed']):
+            CloudFile.prefetch_signed_urls([cloudfile])
+        self.assertEqual(self.sink.counters[('cloudstorage.signed_urls',
+                                             ('storage', StorageProvider.LOCAL))], 1)
+
+
+class ExplainTestCase(TestCase):
+    def test_plan_indexes(self):
+        plan = [{'Plan': {
+            'Node Type': 'Limit',
+            'Plans': [{'Node Type': 'Nested Loop', 'Plans': [
+                {'Node Type': 'Index Scan', 'Index Name': 'cloudstorage_target_idx'},
+                {'Node Type': 'Bitmap Heap Scan', 'Plans': [
+                    {'Node Type': 'Bitmap Index Scan', 'Index Name': 'django_content_type_pkey'}
+                ]},
+            ]}],
+        }}]
+
+        self.assertEqual(plan_indexes(plan), {'cloudstorage_target_idx',
+                                              'django_content_type_pkey'})
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans of PostgreSQL')
+    def test_audit(self):
+        out = StringIO()
+        call_command('cloudstorage_explain', stdout=out)
+
+        self.assertNotIn('FAIL', out.getvalue())
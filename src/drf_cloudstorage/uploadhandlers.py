@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import humanfriendly
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils.translation import ugettext_lazy as _
+
+from .errors import FileTooLarge, InvalidTarget
+from .targets import all_targets, get_target
+
+#: `request.META` key of the header naming the upload target, alternatively to the `target`
+# query parameter
+TARGET_HEADER = 'HTTP_X_CLOUDSTORAGE_TARGET'
+
+
+class CloudFileUploadHandler(FileUploadHandler):
+    """
+    Receives files within the limits of the upload target, which the body is parsed too late to
+    tell, so it is named by the `target` query parameter or the X-Cloudstorage-Target header.
+
+    Files are rejected as soon as they grow over the max_file_size of the target, or of every
+    target if none is named. They are kept in memory up to its memory_file_size and spooled to
+    a temporary file past it, so providers read big files from disk.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+
+        target = self._get_target(request)
+        if target is not None:
+            self.max_file_size = target.max_file_size
+            self.memory_file_size = target.memory_file_size
+        else:
+            self.max_file_size = max((t.max_file_size for t in all_targets()), default=None)
+            self.memory_file_size = None
+        if self.memory_file_size is None:
+            self.memory_file_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+
+        self.file = None
+        self.size = 0
+
+    @staticmethod
+    def _get_target(request):
+        if request is None:
+            return None
+
+        name = request.GET.get('target') or request.META.get(TARGET_HEADER)
+        try:
+            return get_target(name) if name else None
+        except InvalidTarget:
+            # Left to the serializer to complain about
+            return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = BytesIO()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.max_file_size is not None and self.size > self.max_file_size:
+            self.file.close()
+            raise FileTooLarge(_('File size must not exceed %s' %
+                                 humanfriendly.format_size(self.max_file_size)))
+
+        if isinstance(self.file, BytesIO) and self.size > self.memory_file_size:
+            spooled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                            self.content_type_extra)
+            spooled.write(self.file.getvalue())
+            self.file = spooled
+
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+
+        if isinstance(self.file, BytesIO):
+            return InMemoryUploadedFile(self.file, self.field_name, self.file_name,
+                                        self.content_type, file_size, self.charset,
+                                        self.content_type_extra)
+
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        # Removes the temporary file
+        if self.file is not None:
+            self.file.close()
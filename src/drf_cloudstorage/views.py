@@ -1,23 +1,288 @@
+import logging
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from django.utils.translation import ugettext_lazy as _
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import CreateModelMixin, DestroyModelMixin
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from drf_cloudstorage.models import CloudFile
-from drf_cloudstorage.serializers import CloudFileSerializer, CloudFileListSerializer, CloudFileURLSignedListSerializer
+from drf_cloudstorage import helper, metrics, resilience
+from drf_cloudstorage.constants import FileStatus
+from drf_cloudstorage.errors import CloudFileError, InvalidTargetObject, UploadError
+from drf_cloudstorage.models import CloudFile, UploadSession
+from drf_cloudstorage.pagination import KeysetPagination
+from drf_cloudstorage.serializers import CloudFileBulkSerializer, CloudFileListQuerySerializer, \
+    CloudFileSerializer, CloudFileStatusSerializer, CloudFileURLSignedListSerializer, \
+    DirectUploadCompleteSerializer, DirectUploadTicketSerializer, UploadSessionSerializer
+from drf_cloudstorage.uploadhandlers import CloudFileUploadHandler
+
+L = logging.getLogger(__name__)
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+)$')
+
+#: Columns loaded for CloudFileURLSignedListSerializer, `extra` and `signed_url` included
+LIST_FIELDS = ('id', 'url', 'name', 'owner', 'created_at', 'status', 'upload_resp', 'extra_data',
+               'content_field', 'content_type__app_label', 'content_type__model')
 
 
 class CloudFileViewSet(CreateModelMixin, DestroyModelMixin, GenericViewSet):
     queryset = CloudFile.objects.all()
     serializer_class = CloudFileSerializer
+    pagination_class = KeysetPagination
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CloudFileURLSignedListSerializer
+
+        return super().get_serializer_class()
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be replaced before the body is read
+        request.upload_handlers = [CloudFileUploadHandler(request)]
+
+        return super().initialize_request(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if self.request.method != 'GET' and isinstance(exc, (ValidationError, CloudFileError)):
+            metrics.record_rejection(exc)
+
+        return super().handle_exception(exc)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Uploaded files of the `target` query parameter, of the object `object_id` if given,
+        newest first.
+        Further pages are fetched from the `next` link.
+        """
+        query = CloudFileListQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        queryset = CloudFile.objects.filter_by_target(query.validated_data['target'].name) \
+            .filter(status=FileStatus.UPLOADED)
+        if 'object_id' in query.validated_data:
+            queryset = queryset.filter(object_id=query.validated_data['object_id'])
+        queryset = queryset.select_related('content_type').only(*LIST_FIELDS)
+
+        page = self.paginate_queryset(queryset)
+
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        serializer = self.get_serializer(data=self._parse(request))
+        self._validate(serializer)
 
         self.perform_create(serializer)
 
         headers = self.get_success_headers(serializer.data)
-        serializer = CloudFileURLSignedListSerializer(serializer.instance)
+
+        return self._cloudfile_response(serializer.instance, headers)
+
+    @staticmethod
+    def _cloudfile_response(cloudfile, headers=None):
+        if cloudfile.status == FileStatus.PENDING:
+            serializer = CloudFileStatusSerializer(cloudfile)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+        serializer = CloudFileURLSignedListSerializer(cloudfile)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+
+        if getattr(settings, 'CLOUDSTORAGE_DELETE_REMOTE_FILES', True) is True:
+            transaction.on_commit(lambda: self._delete_remote(instance))
+
+    @staticmethod
+    def _delete_remote(instance):
+        try:
+            instance.delete_remote()
+        except Exception:
+            L.exception('Could not delete provider object of %s', instance.url)
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def upload_status(self, request, *args, **kwargs):
+        serializer = CloudFileStatusSerializer(self.get_object())
+
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        """
+        Streams the content from the storage backend. Range and conditional requests are
+        passed on, an If-None-Match matching the known ETag is answered right away.
+        """
+        cloudfile = self.get_object()
+        if cloudfile.status != FileStatus.UPLOADED:
+            raise Http404
+
+        etag = cloudfile.etag
+        if etag is not None:
+            etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if etag in etags or '*' in etags:
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = etag
+                return response
+
+        return resilience.call(cloudfile.storage_provider, cloudfile.backend.stream, cloudfile,
+                               request, idempotent=True)
+
+    @action(detail=False, methods=['post'], serializer_class=CloudFileBulkSerializer)
+    def bulk(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=self._parse(request))
+        self._validate(serializer)
+
+        results = []
+        for f, result in zip(serializer.validated_data['files'], serializer.save()):
+            if isinstance(result, UploadError):
+                results.append({'file': f.name, 'uploaded': False, 'error': result.detail})
+            else:
+                results.append({'file': f.name, 'uploaded': True,
+                                'data': CloudFileURLSignedListSerializer(result).data})
+
+        if all(result['uploaded'] for result in results):
+            return Response(results, status=status.HTTP_201_CREATED)
+
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+    @action(detail=False, methods=['post'], url_path='direct',
+            serializer_class=DirectUploadTicketSerializer)
+    def direct_upload(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(serializer.save())
+
+    @action(detail=False, methods=['post'], url_path='direct/complete',
+            serializer_class=DirectUploadCompleteSerializer)
+    def complete_direct_upload(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        serializer = CloudFileURLSignedListSerializer(serializer.save())
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='uploads',
+            serializer_class=UploadSessionSerializer)
+    def start_upload(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'put'], url_path=r'uploads/(?P<session_id>[0-9a-f-]{36})',
+            serializer_class=UploadSessionSerializer)
+    def upload_session(self, request, session_id, *args, **kwargs):
+        """
+        GET tells the offset to resume from. PUT writes the request body at the offset given by
+        its `Content-Range: bytes <start>-<end>/<size>` header and creates the file once all
+        bytes are received; `bytes */<size>` retries a creation that failed.
+        """
+        session = get_object_or_404(UploadSession.objects.active(), pk=session_id)
+        if request.method == 'GET':
+            return Response(self.get_serializer(session).data)
+
+        start, end = self._parse_content_range(request, session)
+        if start != session.offset:
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+
+        if end is not None and not session.write_chunk(start,
+                                                       self._read_chunk(request, end - start + 1)):
+            session.refresh_from_db()
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+
+        if not session.complete:
+            return Response(self.get_serializer(session).data)
+
+        return self._finish_upload(session)
+
+    @staticmethod
+    def _parse_content_range(request, session):
+        """
+        :return tuple: (start, end) of the chunk, end is None when there is no chunk
+        """
+        match = CONTENT_RANGE_RE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if match is None or int(match.group(3)) != session.size:
+            raise ValidationError({'Content-Range': _('Expected bytes <start>-<end>/%d.' %
+                                                      session.size)})
+
+        if match.group(1) is None:
+            return session.offset, None
+
+        start, end = int(match.group(1)), int(match.group(2))
+        if end < start or end >= session.size:
+            raise ValidationError({'Content-Range': _('Invalid byte range.')})
+
+        return start, end
+
+    @staticmethod
+    def _read_chunk(request, length, chunk_size=64 * 1024):
+        stream = request.stream
+        while stream is not None and length > 0:
+            chunk = stream.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+    def _finish_upload(self, session):
+        """
+        Creates the cloud file from a complete session through CloudFileSerializer, so the
+        content is validated like any other upload. The session row is deleted first, so of
+        concurrent requests finishing the same session only the one that deleted it creates the
+        file.
+        """
+        if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+
+        data = {'target': session.target, 'storage': session.storage, 'name': session.name,
+                'link_target': session.link_target}
+        if session.object_id is not None:
+            data['object_id'] = session.object_id
+
+        with open(session.spool_path, 'rb') as fp:
+            data['file'] = File(fp, name=session.filename)
+            serializer = CloudFileSerializer(data=data, context=self.get_serializer_context())
+            try:
+                self._validate(serializer)
+            except (ValidationError, CloudFileError):
+                helper.remove_spooled_file(session.spool_path)
+                raise
+
+            try:
+                self.perform_create(serializer)
+            except InvalidTargetObject:
+                helper.remove_spooled_file(session.spool_path)
+                raise
+            except Exception:
+                # An UploadError puts the session back for a retry
+                session.save(force_insert=True)
+                raise
+
+        helper.remove_spooled_file(session.spool_path)
+
+        return self._cloudfile_response(serializer.instance)
+
+    @staticmethod
+    def _parse(request):
+        """
+        :return: Data of the request, whose body is parsed and files received on first access
+        """
+        with metrics.timed('parse', size=int(request.META.get('CONTENT_LENGTH') or 0)):
+            return request.data
+
+    @staticmethod
+    def _validate(serializer):
+        with metrics.timed('validate'):
+            serializer.is_valid(raise_exception=True)
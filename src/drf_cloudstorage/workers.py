@@ -0,0 +1,128 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .constants import FileStatus
+from .models import CloudFile
+
+L = logging.getLogger(__name__)
+
+_worker = None
+
+
+def get_upload_worker():
+    """
+    :return BaseUploadWorker: Worker configured by settings.CLOUDSTORAGE_UPLOAD_WORKER
+    """
+    global _worker
+
+    if _worker is None:
+        path = getattr(settings, 'CLOUDSTORAGE_UPLOAD_WORKER',
+                       'drf_cloudstorage.workers.ThreadPoolWorker')
+        _worker = import_string(path)()
+
+    return _worker
+
+
+def pending_uploads():
+    """
+    :return QuerySet: Spooled files waiting to be uploaded, oldest first. Pending rows of two
+        phase uploads are uploaded by their own request and left out.
+    """
+    return CloudFile.objects.filter(status=FileStatus.PENDING, upload_resp__has_key='spool_path') \
+        .order_by('pk')
+
+
+def reclaim_abandoned_uploads():
+    """
+    Puts spooled files back to pending when their worker claimed them more than
+    settings.CLOUDSTORAGE_UPLOAD_LEASE seconds ago, presumably dying before it was done
+
+    :return int: Number of files reclaimed
+    """
+    lease = getattr(settings, 'CLOUDSTORAGE_UPLOAD_LEASE', 3600)
+
+    return CloudFile.objects.filter(
+        status=FileStatus.UPLOADING, upload_resp__has_key='spool_path',
+        updated_at__lt=timezone.now() - timedelta(seconds=lease)
+    ).update(status=FileStatus.PENDING, updated_at=timezone.now())
+
+
+def process_upload(cloudfile_id):
+    """
+    Uploads a pending cloud file. Errors are logged and leave the row marked as failed.
+
+    :param int cloudfile_id:
+    :return CloudFile: Uploaded cloud file or None
+    """
+    try:
+        cloudfile = pending_uploads().get(pk=cloudfile_id)
+        return CloudFile.objects.upload_pending(cloudfile)
+    except CloudFile.DoesNotExist:
+        return None
+    except Exception:
+        L.exception('Upload of cloud file %s failed', cloudfile_id)
+        # Never picked up again, e.g. when its storage is gone
+        CloudFile.objects.filter(pk=cloudfile_id,
+                                 status__in=(FileStatus.PENDING, FileStatus.UPLOADING)) \
+            .update(status=FileStatus.FAILED)
+        return None
+
+
+class BaseUploadWorker:
+    def submit(self, cloudfile):
+        """
+        Schedules the upload of a pending cloud file
+
+        :param CloudFile cloudfile: Pending cloud file
+        """
+        raise NotImplementedError
+
+
+class ThreadPoolWorker(BaseUploadWorker):
+    """
+    Uploads in a thread pool of the current process. The pool is created lazily per process so
+    it survives forking app servers.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CLOUDSTORAGE_UPLOAD_WORKERS', 4),
+                thread_name_prefix='cloudstorage-upload'
+            )
+            self._pid = os.getpid()
+
+        return self._executor
+
+    def submit(self, cloudfile):
+        # The pending row must be visible to the worker thread's own connection
+        transaction.on_commit(lambda: self.executor.submit(self._run, cloudfile.pk))
+
+    @staticmethod
+    def _run(cloudfile_id):
+        try:
+            process_upload(cloudfile_id)
+        finally:
+            close_old_connections()
+
+
+class DatabaseWorker(BaseUploadWorker):
+    """
+    Leaves pending rows in the database to be picked up by the `cloudstorage_worker` command.
+    The spool directory must be shared with the hosts running the command.
+    """
+
+    def submit(self, cloudfile):
+        pass